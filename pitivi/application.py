@@ -22,7 +22,9 @@ import os
 import time
 from gettext import gettext as _
 
+from gi.repository import GES
 from gi.repository import Gio
+from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gst
 from gi.repository import Gtk
@@ -38,17 +40,28 @@ from pitivi.settings import GlobalSettings
 from pitivi.settings import xdg_cache_home
 from pitivi.shortcuts import ShortcutsManager
 from pitivi.shortcuts import show_shortcuts
+from pitivi.timeline.previewers import AudioPreviewer
+from pitivi.timeline.previewers import forget_file_previews
+from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import ThumbnailCache
 from pitivi.undo.project import ProjectObserver
 from pitivi.undo.undo import UndoableActionLog
 from pitivi.utils import loggable
+from pitivi.utils.fileindex import FileHashIndex
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import path_from_uri
 from pitivi.utils.misc import quote_uri
 from pitivi.utils.proxy import ProxyManager
+from pitivi.utils.scheduler import BackgroundWorkPauseReason
+from pitivi.utils.scheduler import BackgroundWorkScheduler
 from pitivi.utils.system import get_system
 from pitivi.utils.threads import ThreadMaster
 from pitivi.utils.timeline import Zoomable
 
+# How long the background work waits after the playback or the rendering
+# stops, so pausing and seeking often does not restart it every time.
+BACKGROUND_WORK_RESUME_DELAY_MS = 1000
+
 
 class Pitivi(Gtk.Application, Loggable):
     """Hello world.
@@ -80,6 +93,7 @@ class Pitivi(Gtk.Application, Loggable):
 
         self.action_log = None
         self.project_observer = None
+        self.__resume_background_work_id = 0
         self._last_action_time = Gst.util_get_timestamp()
 
         self.gui = None
@@ -142,9 +156,32 @@ class Pitivi(Gtk.Application, Loggable):
         self.settings = GlobalSettings()
         self.threads = ThreadMaster()
         self.effects = EffectsManager()
+        self.background_work = BackgroundWorkScheduler.get_default()
         self.proxy_manager = ProxyManager(self)
         self.system = get_system()
 
+        self.settings.connect("thumbnailsMemoryCacheSizeChanged",
+                              self.__thumbnails_memory_cache_size_changed_cb)
+        self.__thumbnails_memory_cache_size_changed_cb(self.settings)
+        self.settings.connect("waveformTilesMemorySizeChanged",
+                              self.__waveform_tiles_memory_size_changed_cb)
+        self.__waveform_tiles_memory_size_changed_cb(self.settings)
+        ThumbnailCache.storage = self.settings.thumbnailsStorage
+        AudioPreviewer.offline = self.settings.waveformsOffline
+        self.previews_cache_manager = Previewer.cache_manager
+        self.settings.connect("previewsCacheQuotaChanged",
+                              self.__previews_cache_quota_changed_cb)
+        self.previews_cache_manager.quota = \
+            self.settings.previewsCacheQuota * 1024 * 1024
+        self.previews_cache_manager.start()
+        self.settings.connect("previewGeneratorsPerTrackTypeChanged",
+                              self.__preview_generators_limits_changed_cb)
+        self.settings.connect("previewGeneratorsCpuBudgetChanged",
+                              self.__preview_generators_limits_changed_cb)
+        self.__preview_generators_limits_changed_cb(self.settings)
+        FileHashIndex.get_default().connect("hash-changed",
+                                            self.__file_hash_changed_cb)
+
         self.project_manager.connect(
             "new-project-loading", self._newProjectLoadingCb)
         self.project_manager.connect(
@@ -154,6 +191,25 @@ class Pitivi(Gtk.Application, Loggable):
         self._createActions()
         self._syncDoUndo()
 
+    def __thumbnails_memory_cache_size_changed_cb(self, settings):
+        ThumbnailCache.memory_cache.set_max_size(
+            settings.thumbnailsMemoryCacheSize * 1024 * 1024)
+
+    def __waveform_tiles_memory_size_changed_cb(self, settings):
+        AudioPreviewer.tiles_cache.set_max_size(
+            settings.waveformTilesMemorySize * 1024 * 1024)
+
+    def __previews_cache_quota_changed_cb(self, settings):
+        self.previews_cache_manager.set_quota(
+            settings.previewsCacheQuota * 1024 * 1024)
+
+    def __file_hash_changed_cb(self, unused_index, path, unused_filehash):
+        forget_file_previews(path)
+
+    def __preview_generators_limits_changed_cb(self, settings):
+        Previewer.manager.set_limits(settings.previewGeneratorsPerTrackType,
+                                     settings.previewGeneratorsCpuBudget)
+
     def _createActions(self):
         self.shortcuts.register_group("app", _("General"), position=10)
         self.undo_action = Gio.SimpleAction.new("undo", None)
@@ -241,6 +297,8 @@ class Pitivi(Gtk.Application, Loggable):
         if self.gui:
             self.gui.destroy()
         self.threads.stopAllThreads()
+        self.previews_cache_manager.stop()
+        FileHashIndex.get_default().stop()
         self.settings.storeSettings()
         self.quit()
         return True
@@ -280,8 +338,36 @@ class Pitivi(Gtk.Application, Loggable):
         self.action_log.connect("move", self._action_log_move_cb)
 
         self.project_observer = ProjectObserver(project, self.action_log)
+        project.pipeline.connect("state-change", self.__pipeline_state_change_cb)
+
+    def __pipeline_state_change_cb(self, pipeline, state, unused_prev):
+        # The user's playback and rendering come first.
+        if pipeline.props.mode & GES.PipelineFlags.RENDER:
+            reason = BackgroundWorkPauseReason.RENDERING
+        else:
+            reason = BackgroundWorkPauseReason.PLAYBACK
+        if state == Gst.State.PLAYING:
+            self.__cancel_background_work_resume()
+            self.background_work.pause(reason)
+        elif not self.__resume_background_work_id:
+            self.__resume_background_work_id = GLib.timeout_add(
+                BACKGROUND_WORK_RESUME_DELAY_MS, self.__resume_background_work_cb)
+
+    def __cancel_background_work_resume(self):
+        if self.__resume_background_work_id:
+            GLib.source_remove(self.__resume_background_work_id)
+            self.__resume_background_work_id = 0
+
+    def __resume_background_work_cb(self):
+        self.__resume_background_work_id = 0
+        self.background_work.resume(BackgroundWorkPauseReason.PLAYBACK)
+        self.background_work.resume(BackgroundWorkPauseReason.RENDERING)
+        return False
 
     def _projectClosed(self, unused_project_manager, project):
+        self.__cancel_background_work_resume()
+        self.background_work.resume(BackgroundWorkPauseReason.PLAYBACK)
+        self.background_work.resume(BackgroundWorkPauseReason.RENDERING)
         if project.loaded:
             self.action_log = None
             self._syncDoUndo()
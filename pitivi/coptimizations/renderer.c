@@ -1,5 +1,6 @@
 #include <Python.h>
 #include <stdio.h>
+#include <string.h>
 #include <cairo.h>
 #include <py3cairo.h>
 #include <gst/gst.h>
@@ -53,8 +54,8 @@ py_fill_surface (PyObject * self, PyObject * args)
 
     /* If the object was not a float or convertible to float */
     if (PyErr_Occurred ()) {
-      cairo_surface_finish (surface);
-      Py_DECREF (samples);
+      cairo_destroy (ctx);
+      cairo_surface_destroy (surface);
       return NULL;
     }
 
@@ -71,16 +72,301 @@ py_fill_surface (PyObject * self, PyObject * args)
     x += pixelsPerSample;
   }
 
-  Py_DECREF (samples);
   cairo_line_to (ctx, width, height);
   cairo_close_path (ctx);
   cairo_fill_preserve (ctx);
+  cairo_destroy (ctx);
 
   return PycairoSurface_FromSurface (surface, NULL);
 }
 
+/*
+ * The samples exported by an object supporting the buffer protocol, such
+ * as a numpy array or a memoryview, accessed without copying them.
+ * The 1-D buffers have a single channel, the 2-D buffers are indexed by
+ * channel and sample.
+ */
+typedef struct
+{
+  Py_buffer view;
+  char format;                  /* 'f', 'd' or 'h' */
+  Py_ssize_t channels;
+  Py_ssize_t length;
+  Py_ssize_t channel_stride;
+  Py_ssize_t sample_stride;
+} Samples;
+
+static int
+samples_get (PyObject * obj, Samples * samples)
+{
+  const char *format;
+  Py_ssize_t itemsize;
+
+  if (PyObject_GetBuffer (obj, &samples->view,
+          PyBUF_STRIDED_RO | PyBUF_FORMAT) < 0)
+    return -1;
+
+  format = samples->view.format ? samples->view.format : "B";
+  /* Only the native byte order is supported. */
+  if (*format == '@' || *format == '='
+      || (*format == '<' && G_BYTE_ORDER == G_LITTLE_ENDIAN)
+      || (*format == '>' && G_BYTE_ORDER == G_BIG_ENDIAN))
+    format++;
+
+  switch (format[0]) {
+    case 'f':
+      itemsize = sizeof (float);
+      break;
+    case 'd':
+      itemsize = sizeof (double);
+      break;
+    case 'h':
+      itemsize = sizeof (gint16);
+      break;
+    default:
+      itemsize = 0;
+  }
+  if (!itemsize || format[1] != '\0' || samples->view.itemsize != itemsize) {
+    PyErr_Format (PyExc_TypeError,
+        "Unsupported samples format: %s, expected float32, float64 or int16",
+        samples->view.format ? samples->view.format : "B");
+    PyBuffer_Release (&samples->view);
+    return -1;
+  }
+  samples->format = format[0];
+
+  if (samples->view.ndim == 1) {
+    samples->channels = 1;
+    samples->length = samples->view.shape[0];
+    samples->channel_stride = 0;
+    samples->sample_stride = samples->view.strides[0];
+  } else if (samples->view.ndim == 2) {
+    samples->channels = samples->view.shape[0];
+    samples->length = samples->view.shape[1];
+    samples->channel_stride = samples->view.strides[0];
+    samples->sample_stride = samples->view.strides[1];
+  } else {
+    PyErr_SetString (PyExc_ValueError,
+        "The samples must have one or two dimensions");
+    PyBuffer_Release (&samples->view);
+    return -1;
+  }
+
+  return 0;
+}
+
+/*
+ * Gets a sample, the int16 samples being scaled to the -100..100 range
+ * of the float samples.
+ */
+static inline double
+samples_value (const Samples * samples, Py_ssize_t channel, Py_ssize_t i)
+{
+  const char *p = (const char *) samples->view.buf +
+      channel * samples->channel_stride + i * samples->sample_stride;
+  float f;
+  double d;
+  gint16 h;
+
+  /* The strided views are not necessarily aligned. */
+  switch (samples->format) {
+    case 'f':
+      memcpy (&f, p, sizeof (f));
+      return f;
+    case 'd':
+      memcpy (&d, p, sizeof (d));
+      return d;
+    default:
+      memcpy (&h, p, sizeof (h));
+      return h * 100.0 / 32768.0;
+  }
+}
+
+static int
+check_size (int width, int height)
+{
+  if (width <= 0 || height <= 0) {
+    PyErr_SetString (PyExc_ValueError, "The size of the surface must be positive");
+    return -1;
+  }
+  return 0;
+}
+
+/*
+ * Draws the same shape as fill_surface, averaging the channels.
+ * Can be called without holding the GIL.
+ */
+static void
+draw_filled_line (cairo_t * ctx, const Samples * samples, int width,
+    int height)
+{
+  Py_ssize_t i, channel;
+  float pixelsPerSample = width / (float) samples->length;
+  float currentPixel = 0.;
+  int samplesInAccum = 0;
+  float x = 0.;
+  double accum = 0.;
+  double sample;
+
+  cairo_set_source_rgb (ctx, 0.2, 0.6, 0.0);
+  cairo_set_line_width (ctx, 0.5);
+  cairo_move_to (ctx, 0, height);
+
+  for (i = 0; i < samples->length; i++) {
+    sample = 0.;
+    for (channel = 0; channel < samples->channels; channel++)
+      sample += samples_value (samples, channel, i);
+    sample /= samples->channels;
+
+    currentPixel += pixelsPerSample;
+    samplesInAccum += 1;
+    accum += sample;
+    if (currentPixel > 1.0) {
+      accum /= samplesInAccum;
+      cairo_line_to (ctx, x, height - accum);
+      accum = 0;
+      currentPixel -= 1.0;
+      samplesInAccum = 0;
+    }
+    x += pixelsPerSample;
+  }
+
+  cairo_line_to (ctx, width, height);
+  cairo_close_path (ctx);
+  cairo_fill (ctx);
+}
+
+/*
+ * Same as fill_surface, for samples supporting the buffer protocol. The
+ * GIL is released while drawing.
+ */
+static PyObject *
+py_fill_surface_from_buffer (PyObject * self, PyObject * args)
+{
+  PyObject *obj;
+  Samples samples;
+  cairo_surface_t *surface;
+  cairo_t *ctx;
+  int width, height;
+
+  if (!PyArg_ParseTuple (args, "Oii", &obj, &width, &height))
+    return NULL;
+  if (check_size (width, height) < 0 || samples_get (obj, &samples) < 0)
+    return NULL;
+
+  Py_BEGIN_ALLOW_THREADS;
+  surface = cairo_image_surface_create (CAIRO_FORMAT_ARGB32, width, height);
+  if (samples.length && samples.channels) {
+    ctx = cairo_create (surface);
+    draw_filled_line (ctx, &samples, width, height);
+    cairo_destroy (ctx);
+  }
+  Py_END_ALLOW_THREADS;
+
+  PyBuffer_Release (&samples.view);
+  return PycairoSurface_FromSurface (surface, NULL);
+}
+
+/*
+ * Draws the envelope between the mins and the maxs of each channel, in a
+ * lane of the surface per channel, one column per pixel.
+ * Can be called without holding the GIL.
+ */
+static void
+draw_envelope (cairo_t * ctx, const Samples * mins, const Samples * maxs,
+    int width, int height)
+{
+  Py_ssize_t channel, i, first, last;
+  double lane_height = height / (double) mins->channels;
+  double center, lo, hi, value;
+  double *los = g_new (double, width);
+  int x;
+
+  cairo_set_source_rgb (ctx, 0.2, 0.6, 0.0);
+
+  for (channel = 0; channel < mins->channels; channel++) {
+    center = lane_height * (channel + 0.5);
+
+    for (x = 0; x < width; x++) {
+      first = x * mins->length / width;
+      last = MAX (first + 1, (x + 1) * mins->length / width);
+      lo = samples_value (mins, channel, first);
+      hi = samples_value (maxs, channel, first);
+      for (i = first + 1; i < last; i++) {
+        value = samples_value (mins, channel, i);
+        lo = MIN (lo, value);
+        value = samples_value (maxs, channel, i);
+        hi = MAX (hi, value);
+      }
+
+      /* The -100..100 range fills the lane. */
+      hi = CLAMP (center - hi * lane_height / 200, 0, height);
+      los[x] = CLAMP (center - lo * lane_height / 200, 0, height);
+      if (x == 0)
+        cairo_move_to (ctx, x, hi);
+      cairo_line_to (ctx, x + 1, hi);
+    }
+
+    for (x = width - 1; x >= 0; x--) {
+      cairo_line_to (ctx, x + 1, los[x]);
+      cairo_line_to (ctx, x, los[x]);
+    }
+    cairo_close_path (ctx);
+  }
+
+  cairo_fill (ctx);
+  g_free (los);
+}
+
+/*
+ * This function must be called with the mins and the maxs of the samples,
+ * supporting the buffer protocol, and a desired width and height.
+ * The mono samples are 1-D, the stereo ones are 2-D, indexed by channel
+ * and sample. The GIL is released while drawing.
+ */
+static PyObject *
+py_fill_envelope (PyObject * self, PyObject * args)
+{
+  PyObject *mins_obj, *maxs_obj;
+  Samples mins, maxs;
+  cairo_surface_t *surface;
+  cairo_t *ctx;
+  int width, height;
+
+  if (!PyArg_ParseTuple (args, "OOii", &mins_obj, &maxs_obj, &width, &height))
+    return NULL;
+  if (check_size (width, height) < 0 || samples_get (mins_obj, &mins) < 0)
+    return NULL;
+  if (samples_get (maxs_obj, &maxs) < 0) {
+    PyBuffer_Release (&mins.view);
+    return NULL;
+  }
+  if (mins.channels != maxs.channels || mins.length != maxs.length) {
+    PyErr_SetString (PyExc_ValueError,
+        "The mins and the maxs must have the same shape");
+    PyBuffer_Release (&mins.view);
+    PyBuffer_Release (&maxs.view);
+    return NULL;
+  }
+
+  Py_BEGIN_ALLOW_THREADS;
+  surface = cairo_image_surface_create (CAIRO_FORMAT_ARGB32, width, height);
+  if (mins.length && mins.channels) {
+    ctx = cairo_create (surface);
+    draw_envelope (ctx, &mins, &maxs, width, height);
+    cairo_destroy (ctx);
+  }
+  Py_END_ALLOW_THREADS;
+
+  PyBuffer_Release (&mins.view);
+  PyBuffer_Release (&maxs.view);
+  return PycairoSurface_FromSurface (surface, NULL);
+}
+
 static PyMethodDef renderer_methods[] = {
   {"fill_surface", py_fill_surface, METH_VARARGS},
+  {"fill_surface_from_buffer", py_fill_surface_from_buffer, METH_VARARGS},
+  {"fill_envelope", py_fill_envelope, METH_VARARGS},
   {NULL, NULL}
 };
 
@@ -171,7 +171,12 @@ class FileChooserExtraWidget(Gtk.Grid, Loggable):
 
 
 class AssetThumbnail(Loggable):
-    """Provider of decorated thumbnails for an asset."""
+    """Provider of decorated thumbnails for an asset.
+
+    Attributes:
+        poster_uri (str): The URI of the video whose poster frame is
+            waiting to be set with `set_poster`, if any.
+    """
 
     EMBLEMS = {}
     PROXIED = "asset-proxied"
@@ -192,6 +197,7 @@ class AssetThumbnail(Loggable):
     def __init__(self, asset, proxy_manager):
         Loggable.__init__(self)
         self.__asset = asset
+        self.poster_uri = None
         self.src_small, self.src_large = self.__get_thumbnails()
         self.proxy_manager = proxy_manager
         self.decorate()
@@ -230,27 +236,35 @@ class AssetThumbnail(Loggable):
                         self.debug("Failed loading thumbnail because: %s", error)
                         small_thumb, large_thumb = self.__get_icons("image-x-generic")
                 else:
-                    # Build or reuse a ThumbnailCache.
-                    thumb_cache = ThumbnailCache.get(self.__asset)
-                    small_thumb = thumb_cache.getPreviewThumbnail()
-                    if not small_thumb:
-                        small_thumb, large_thumb = self.__get_icons("video-x-generic")
-                    else:
-                        width = small_thumb.props.width
-                        height = small_thumb.props.height
-                        large_thumb = small_thumb.scale_simple(
-                            LARGE_THUMB_WIDTH,
-                            LARGE_THUMB_WIDTH * height / width,
-                            GdkPixbuf.InterpType.BILINEAR)
-                        if width > SMALL_THUMB_WIDTH:
-                            small_thumb = small_thumb.scale_simple(
-                                SMALL_THUMB_WIDTH,
-                                SMALL_THUMB_WIDTH * height / width,
-                                GdkPixbuf.InterpType.BILINEAR)
+                    # The poster frame is retrieved in a batch, see
+                    # MediaLibraryWidget._addAsset.
+                    self.poster_uri = real_uri
+                    small_thumb, large_thumb = self.__get_icons("video-x-generic")
         else:
             small_thumb, large_thumb = self.__get_icons("audio-x-generic")
         return small_thumb, large_thumb
 
+    def set_poster(self, poster):
+        """Uses the specified poster frame as source thumbnail.
+
+        Args:
+            poster (GdkPixbuf.Pixbuf): The poster frame of the video.
+        """
+        self.poster_uri = None
+        width = poster.props.width
+        height = poster.props.height
+        self.src_large = poster.scale_simple(
+            LARGE_THUMB_WIDTH,
+            LARGE_THUMB_WIDTH * height / width,
+            GdkPixbuf.InterpType.BILINEAR)
+        self.src_small = poster
+        if width > SMALL_THUMB_WIDTH:
+            self.src_small = poster.scale_simple(
+                SMALL_THUMB_WIDTH,
+                SMALL_THUMB_WIDTH * height / width,
+                GdkPixbuf.InterpType.BILINEAR)
+        self.decorate()
+
     def __get_thumbnails_from_xdg_cache(self, real_uri):
         """Gets pixbufs for the specified thumbnail from the user's cache dir.
 
@@ -365,6 +379,12 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
         Loggable.__init__(self)
 
         self.pending_rows = []
+        # The durations of the videos whose poster frames are to be
+        # retrieved, by URI.
+        self.__pending_posters = {}
+        self.__posters_source_id = 0
+        # The references to the rows waiting for their poster frame, by URI.
+        self.__poster_rows = {}
 
         self.app = app
         self._errors = []
@@ -578,6 +598,10 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
     def finalize(self):
         self.debug("Finalizing %s", self)
 
+        if self.__posters_source_id:
+            GLib.source_remove(self.__posters_source_id)
+            self.__posters_source_id = 0
+
         self.app.project_manager.disconnect_by_func(self._new_project_loading_cb)
         self.app.project_manager.disconnect_by_func(self._newProjectLoadedCb)
         self.app.project_manager.disconnect_by_func(self._newProjectFailedCb)
@@ -802,10 +826,42 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
                                   thumbs_decorator))
         self._flushPendingRows()
 
+        if thumbs_decorator.poster_uri:
+            # Retrieve the poster frames of the assets added meanwhile
+            # in a single batch.
+            self.__pending_posters[thumbs_decorator.poster_uri] = \
+                info.get_duration()
+            if not self.__posters_source_id:
+                self.__posters_source_id = GLib.idle_add(
+                    self.__get_posters_cb, priority=GLib.PRIORITY_LOW)
+
+    def __get_posters_cb(self):
+        self.__posters_source_id = 0
+        durations = self.__pending_posters
+        self.__pending_posters = {}
+        ThumbnailCache.get_posters(durations, self.__poster_cb)
+        return False
+
+    def __poster_cb(self, uri, poster):
+        for row_ref in self.__poster_rows.pop(uri, []):
+            if not row_ref.valid():
+                # The asset has been removed meanwhile.
+                continue
+            row = self.storemodel[row_ref.get_path()]
+            thumbs_decorator = row[COL_THUMB_DECORATOR]
+            thumbs_decorator.set_poster(poster)
+            row[COL_ICON_64] = thumbs_decorator.small_thumb
+            row[COL_ICON_128] = thumbs_decorator.large_thumb
+
     def _flushPendingRows(self):
         self.debug("Flushing %d pending model rows", len(self.pending_rows))
         for row in self.pending_rows:
-            self.storemodel.append(row)
+            tree_iter = self.storemodel.append(row)
+            poster_uri = row[COL_THUMB_DECORATOR].poster_uri
+            if poster_uri:
+                row_ref = Gtk.TreeRowReference.new(
+                    self.storemodel, self.storemodel.get_path(tree_iter))
+                self.__poster_rows.setdefault(poster_uri, []).append(row_ref)
 
         del self.pending_rows[:]
 
@@ -1353,6 +1409,7 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
         self._project = project
         self._resetErrorList()
         self.storemodel.clear()
+        self.__poster_rows.clear()
         self._welcome_infobar.show_all()
         self._connectToProject(project)
 
@@ -1362,12 +1419,14 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
 
     def _newProjectFailedCb(self, unused_project_manager, unused_uri, unused_reason):
         self.storemodel.clear()
+        self.__poster_rows.clear()
         self._project = None
 
     def _projectClosedCb(self, unused_project_manager, unused_project):
         self.__disconnectFromProject()
         self._project_settings_infobar.hide()
         self.storemodel.clear()
+        self.__poster_rows.clear()
         self._project = None
 
     def __paths_walked_cb(self, uris):
@@ -38,6 +38,7 @@ from pitivi.preset import VideoPresetManager
 from pitivi.render import Encoders
 from pitivi.undo.project import AssetAddedIntention
 from pitivi.undo.project import AssetProxiedIntention
+from pitivi.utils.fileindex import FileHashIndex
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import isWritable
 from pitivi.utils.misc import path_from_uri
@@ -1064,6 +1065,12 @@ class Project(Loggable, GES.Project):
             # Ignore for example the assets producing GES.TitleClips.
             return
 
+        # Index the file out of the main loop, before the previewers
+        # need its hash.
+        location = Gst.uri_get_location(asset.get_id())
+        if location:
+            FileHashIndex.get_default().revalidate([location])
+
         self._prepare_asset_processing(asset)
 
     def _prepare_asset_processing(self, asset):
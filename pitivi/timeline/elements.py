@@ -787,10 +787,20 @@ class AudioUriSource(TimelineElement):
     def _getPreviewer(self):
         previewer = AudioPreviewer(self._ges_elem)
         previewer.get_style_context().add_class("AudioUriSource")
+        previewer.connect("progress", self.__waveform_progress_cb)
         previewer.startLevelsDiscoveryWhenIdle()
 
         return previewer
 
+    def __waveform_progress_cb(self, unused_previewer, fraction):
+        if fraction < 1.0:
+            # Translators: Tooltip of an audio clip while its waveform is
+            # being extracted.
+            self.set_tooltip_text(_("Generating the waveform: %d%%") %
+                                  int(fraction * 100))
+        else:
+            self.set_tooltip_text(None)
+
     def _getBackground(self):
         return AudioBackground()
 
@@ -17,10 +17,14 @@
 # Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
 # Boston, MA 02110-1301, USA.
 """Previewers for the timeline."""
+import bisect
+import json
+import multiprocessing
 import os
 import pickle
-import random
-import sqlite3
+import time
+from collections import OrderedDict
+from functools import partial
 
 import cairo
 import numpy
@@ -33,15 +37,23 @@ from gi.repository import Gst
 from gi.repository import Gtk
 
 from pitivi.settings import get_dir
+from pitivi.settings import GlobalSettings
 from pitivi.settings import xdg_cache_home
+from pitivi.utils.analysis import register_analyzer
+from pitivi.utils.cachemanager import get_filehash
+from pitivi.utils.cachemanager import PreviewsCacheManager
+from pitivi.utils.fileindex import get_file_hash
 from pitivi.utils.loggable import Loggable
-from pitivi.utils.misc import binary_search
 from pitivi.utils.misc import filename_from_uri
 from pitivi.utils.misc import get_proxy_target
-from pitivi.utils.misc import hash_file
 from pitivi.utils.misc import quantize
 from pitivi.utils.misc import quote_uri
-from pitivi.utils.system import CPUUsageTracker
+from pitivi.utils.scheduler import BackgroundWorkScheduler
+from pitivi.utils.scheduler import PipelineCpuThrottler
+from pitivi.utils.threads import WorkerPool
+from pitivi.utils.thumbstore import create_thumbnail_store
+from pitivi.utils.thumbstore import get_poster_jpegs
+from pitivi.utils.thumbstore import ThumbnailStorage
 from pitivi.utils.timeline import Zoomable
 from pitivi.utils.ui import EXPANDED_SIZE
 
@@ -53,16 +65,73 @@ except ImportError:
     import renderer
 
 
+class ThumbnailingMode:
+    """The ways of decoding the frames used as thumbnails.
+
+    ACCURATE seeks precisely to each thumbnail position, FAST seeks to the
+    nearest keyframe and SEQUENTIAL plays the file once with no seeks.
+    """
+
+    AUTOMATIC = "automatic"
+    ACCURATE = "accurate"
+    FAST = "fast"
+    SEQUENTIAL = "sequential"
+
+
+GlobalSettings.addConfigSection("previews")
+GlobalSettings.addConfigOption("thumbnailingMode",
+                               section="previews",
+                               key="thumbnailing-mode",
+                               default=ThumbnailingMode.AUTOMATIC)
+GlobalSettings.addConfigOption("thumbnailsMemoryCacheSize",
+                               section="previews",
+                               key="thumbnails-memory-cache-size",
+                               default=64,
+                               notify=True)
+GlobalSettings.addConfigOption("waveformTilesMemorySize",
+                               section="previews",
+                               key="waveform-tiles-memory-size",
+                               default=32,
+                               notify=True)
+GlobalSettings.addConfigOption("previewGeneratorsPerTrackType",
+                               section="previews",
+                               key="generators-per-track-type",
+                               default=max(1, min(8, multiprocessing.cpu_count() // 4)),
+                               notify=True)
+GlobalSettings.addConfigOption("previewGeneratorsCpuBudget",
+                               section="previews",
+                               key="generators-cpu-budget",
+                               default=50,
+                               notify=True)
+GlobalSettings.addConfigOption("previewsCacheQuota",
+                               section="previews",
+                               key="cache-quota",
+                               default=2048,
+                               notify=True)
+GlobalSettings.addConfigOption("thumbnailsStorage",
+                               section="previews",
+                               key="thumbnails-storage",
+                               default=ThumbnailStorage.SQLITE)
+GlobalSettings.addConfigOption("waveformsOffline",
+                               section="previews",
+                               key="waveforms-offline",
+                               default=True)
+
 WAVEFORMS_CPU_USAGE = 30
+# How often the progress of the waveforms extraction is reported.
+WAVEFORMS_PROGRESS_INTERVAL_MS = 500
 SAMPLE_DURATION = Gst.SECOND / 100
 
 # A little lower as it's more fluctuating
 THUMBNAILS_CPU_USAGE = 20
+# The period of the levels measured by LoudnessPreviewer.
+LOUDNESS_INTERVAL = Gst.SECOND / 10
 
 THUMB_MARGIN_PX = 3
-# For the waveforms, ensures we always have a little extra surface when
-# scrolling while playing.
-MARGIN = 500
+# The key of the poster frames in the ThumbnailsMemoryCache.
+THUMBS_POSTER_KEY = "poster"
+# The width of the tiles in which the waveforms are rendered.
+WAVEFORM_TILE_WIDTH = 256
 
 PREVIEW_GENERATOR_SIGNALS = {
     "done": (GObject.SIGNAL_RUN_LAST, None, ()),
@@ -71,17 +140,64 @@ PREVIEW_GENERATOR_SIGNALS = {
 
 THUMB_HEIGHT = EXPANDED_SIZE - 2 * THUMB_MARGIN_PX
 
+# The distances between the thumbnails which can be generated, finest first.
+# Each one is a multiple of the previous one, so the thumbnails generated
+# when zoomed out are reused when zooming in.
+THUMB_PERIODS = tuple(Gst.SECOND // 2 * 2 ** i for i in range(8))
+
+# The distances between the thumbnails of the coarse levels of the pyramid of
+# thumbnails, coarsest first, generated in the background.
+THUMB_PYRAMID_PERIODS = (64 * Gst.SECOND, 8 * Gst.SECOND)
+
+# How often PreviewGeneratorManager checks whether to start or stop previewers.
+PREVIEW_GENERATORS_CHECK_INTERVAL_MS = 1000
+
+# The maximum number of screens ahead of the viewport which are prefetched.
+PREFETCH_MAX_SCREENS = 2
+# The minimum interval between two scroll events taken into account when
+# measuring the scrolling speed, to ignore the bursts.
+PREFETCH_MIN_INTERVAL_S = 0.01
+
+# How often the CPU usage is checked when thumbnailing sequentially.
+SEQUENTIAL_THUMBNAILING_INTERVAL_MS = 200
+# The minimum span of cached thumbnails skipped by seeking when thumbnailing
+# sequentially, if longer than the distance between the keyframes.
+SEQUENTIAL_SKIP_MIN_DISTANCE = 10 * Gst.SECOND
+
+# The maximum number of threads compressing and decompressing thumbnails.
+THUMBS_CODEC_WORKERS = min(4, multiprocessing.cpu_count())
+# The number of thumbnails accumulated before writing them to disk.
+THUMBS_WRITE_BATCH_SIZE = 32
+# The maximum time the thumbnails wait before being written to disk.
+THUMBS_WRITE_INTERVAL_MS = 2000
+
 
 class PreviewerBin(Gst.Bin, Loggable):
-    """Baseclass for elements gathering datas to create previews."""
+    """Baseclass for elements gathering datas to create previews.
+
+    The previewer bins are the analyzers run by `AnalysisPipeline`, see
+    `register_analyzer`.
+
+    Attributes:
+        media_type (str): The type of the raw streams analyzed, "audio"
+            or "video".
+    """
+
+    media_type = None
+
     def __init__(self, bin_desc):
         Gst.Bin.__init__(self)
         Loggable.__init__(self)
 
         self.internal_bin = Gst.parse_bin_from_description(bin_desc, True)
         self.add(self.internal_bin)
-        self.add_pad(Gst.GhostPad.new(None, self.internal_bin.sinkpads[0]))
-        self.add_pad(Gst.GhostPad.new(None, self.internal_bin.srcpads[0]))
+        self.add_pad(Gst.GhostPad.new("sink", self.internal_bin.sinkpads[0]))
+        if self.internal_bin.srcpads:
+            self.add_pad(Gst.GhostPad.new("src", self.internal_bin.srcpads[0]))
+
+    def is_cached(self):
+        """Checks whether the previews have been generated already."""
+        return False
 
     def finalize(self, proxy=None):
         """Finalizes the previewer, saving data to the disk if needed."""
@@ -89,7 +205,16 @@ class PreviewerBin(Gst.Bin, Loggable):
 
 
 class ThumbnailBin(PreviewerBin):
-    """Bin to generate and save thumbnails to an SQLite database."""
+    """Bin to generate and save thumbnails to an SQLite database.
+
+    When run as analyzer, only the thumbnails of the coarse levels of the
+    pyramid, see THUMB_PYRAMID_PERIODS, and the poster frame are generated,
+    as fast as the file can be decoded. The other frames are dropped before
+    being converted and scaled. The finer levels are generated by the
+    ThumbnailGenerator when the clips are displayed.
+    """
+
+    media_type = "video"
 
     __gproperties__ = {
         "uri": (str,
@@ -97,19 +222,57 @@ class ThumbnailBin(PreviewerBin):
                 "A URI",
                 "",
                 GObject.PARAM_READWRITE),
+        "duration": (GObject.TYPE_UINT64,
+                     "Duration",
+                     "Duration",
+                     0, GLib.MAXUINT64 - 1, 0, GObject.PARAM_READWRITE)
     }
 
-    def __init__(self, bin_desc="videoconvert ! videorate ! "
-                 "videoscale method=lanczos ! "
-                 "capsfilter caps=video/x-raw,format=(string)RGBA,"
-                 "height=(int)%d,pixel-aspect-ratio=(fraction)1/1,"
-                 "framerate=2/1 ! gdkpixbufsink name=gdkpixbufsink " %
-                 THUMB_HEIGHT):
+    def __init__(self, bin_desc=None):
+        analyzer = bin_desc is None
+        if analyzer:
+            bin_desc = ("videorate name=videorate ! videoconvert ! "
+                        "videoscale method=lanczos ! "
+                        "capsfilter caps=video/x-raw,format=(string)RGBA,"
+                        "height=(int)%d,pixel-aspect-ratio=(fraction)1/1,"
+                        "framerate=2/1 ! gdkpixbufsink name=gdkpixbufsink " %
+                        THUMB_HEIGHT)
         PreviewerBin.__init__(self, bin_desc)
 
         self.uri = None
+        self.duration = 0
         self.thumb_cache = None
         self.gdkpixbufsink = self.internal_bin.get_by_name("gdkpixbufsink")
+        if analyzer:
+            self.gdkpixbufsink.props.sync = False
+            videorate = self.internal_bin.get_by_name("videorate")
+            videorate.get_static_pad("src").add_probe(
+                Gst.PadProbeType.BUFFER, self.__drop_fine_frames_probe_cb)
+
+    def is_coarse_position(self, stream_time):
+        """Checks whether a thumbnail is generated when run as analyzer.
+
+        Args:
+            stream_time (int): The position of a frame output by videorate.
+
+        Returns:
+            bool: True for the positions of the coarse levels of the
+            pyramid and for the position of the poster frame.
+        """
+        position = int(round(stream_time / THUMB_PERIODS[0])) * THUMB_PERIODS[0]
+        return position % THUMB_PYRAMID_PERIODS[-1] == 0 or \
+            position == get_poster_position(self.duration)
+
+    def __drop_fine_frames_probe_cb(self, pad, info):
+        event = pad.get_sticky_event(Gst.EventType.SEGMENT, 0)
+        if not event:
+            return Gst.PadProbeReturn.OK
+
+        segment = event.parse_segment()
+        stream_time = segment.to_stream_time(Gst.Format.TIME, info.get_buffer().pts)
+        if self.is_coarse_position(stream_time):
+            return Gst.PadProbeReturn.OK
+        return Gst.PadProbeReturn.DROP
 
     def __addThumbnail(self, message):
         struct = message.get_structure()
@@ -130,15 +293,20 @@ class ThumbnailBin(PreviewerBin):
 
         return Gst.Bin.do_post_message(self, message)
 
+    def is_cached(self):
+        return self.thumb_cache.backfill_poster(self.duration) is not None
+
     def finalize(self, proxy=None):
         """Finalizes the previewer, saving data to file if needed."""
-        self.thumb_cache.commit()
+        self.thumb_cache.commit(get_poster_position(self.duration))
         if proxy:
             self.thumb_cache.copy(proxy.get_id())
 
     def do_get_property(self, prop):
         if prop.name == 'uri':
             return self.uri
+        elif prop.name == 'duration':
+            return self.duration
         else:
             raise AttributeError('unknown property %s' % prop.name)
 
@@ -146,6 +314,8 @@ class ThumbnailBin(PreviewerBin):
         if prop.name == 'uri':
             self.uri = value
             self.thumb_cache = ThumbnailCache.get(self.uri)
+        elif prop.name == 'duration':
+            self.duration = value
         else:
             raise AttributeError('unknown property %s' % prop.name)
 
@@ -164,9 +334,35 @@ class TeedThumbnailBin(ThumbnailBin):
             "t. ! queue " % THUMB_HEIGHT)
 
 
+def levels_to_samples(levels):
+    """Converts the RMS levels collected by WaveformPreviewer to samples.
+
+    Args:
+        levels (numpy.ndarray): The (channels, n) RMS levels in dB, -inf
+            where missing. The non-negative values are considered glitches
+            and replaced by the previous value.
+
+    Returns:
+        numpy.ndarray: The mono float32 samples, in the 0..100 range.
+    """
+    # Let's go mono, using the first two channels.
+    levels = levels[:2]
+    glitches = levels >= 0
+    values = numpy.power(10, levels / 20) * 100
+    values[glitches] = 0
+    # Index of the last good value at each position, for each channel.
+    indexes = numpy.where(glitches, 0, numpy.arange(levels.shape[1]))
+    numpy.maximum.accumulate(indexes, axis=1, out=indexes)
+    # Fancy indexing, numpy.take_along_axis needs numpy 1.15.
+    values = values[numpy.arange(len(values))[:, None], indexes]
+    return values.mean(axis=0).astype(numpy.float32)
+
+
 # pylint: disable=too-many-instance-attributes
 class WaveformPreviewer(PreviewerBin):
-    """Bin to generate and save waveforms as a pickle file."""
+    """Bin to generate and save waveforms as a numpy file."""
+
+    media_type = "audio"
 
     __gproperties__ = {
         "uri": (str,
@@ -186,12 +382,14 @@ class WaveformPreviewer(PreviewerBin):
                               " ! audioconvert ! audioresample")
         self.level = self.internal_bin.get_by_name("level")
         self.debug("Creating waveforms!!")
+        # The (channels, n_samples) RMS levels in dB, allocated when the
+        # first level message is received.
         self.peaks = None
 
         self.uri = None
         self.wavefile = None
         self.passthrough = False
-        self.samples = []
+        self.samples = numpy.zeros(0, dtype=numpy.float32)
         self.n_samples = 0
         self.duration = 0
 
@@ -207,6 +405,8 @@ class WaveformPreviewer(PreviewerBin):
         if prop.name == 'uri':
             self.uri = value
             self.wavefile = get_wavefile_location_for_uri(self.uri)
+            Previewer.cache_manager.touch(
+                get_filehash(os.path.basename(self.wavefile)))
             self.passthrough = os.path.exists(self.wavefile)
         elif prop.name == 'duration':
             self.duration = value
@@ -216,48 +416,41 @@ class WaveformPreviewer(PreviewerBin):
 
     # pylint: disable=arguments-differ
     def do_post_message(self, message):
-        if not self.passthrough and \
-                message.type == Gst.MessageType.ELEMENT and \
-                message.src == self.level:
-            struct = message.get_structure()
-            peaks = None
-            if struct:
-                peaks = struct.get_value("rms")
+        if message.type != Gst.MessageType.ELEMENT or \
+                message.src != self.level:
+            return Gst.Bin.do_post_message(self, message)
 
-            if peaks:
-                stream_time = struct.get_value("stream-time")
+        struct = message.get_structure()
+        peaks = None
+        if struct and not self.passthrough:
+            peaks = struct.get_value("rms")
 
-                if self.peaks is None:
-                    self.peaks = []
-                    for unused_channel in peaks:
-                        self.peaks.append([0] * int(self.n_samples))
+        if peaks:
+            stream_time = struct.get_value("stream-time")
 
-                pos = int(stream_time / SAMPLE_DURATION)
-                if pos >= len(self.peaks[0]):
-                    return
+            if self.peaks is None:
+                self.peaks = numpy.full((len(peaks), int(self.n_samples)),
+                                        -numpy.inf, dtype=numpy.float32)
 
-                for i, val in enumerate(peaks):
-                    if val < 0:
-                        val = 10 ** (val / 20) * 100
-                        self.peaks[i][pos] = val
-                    else:
-                        self.peaks[i][pos] = self.peaks[i][pos - 1]
+            pos = int(stream_time / SAMPLE_DURATION)
+            if pos < self.peaks.shape[1]:
+                self.peaks[:, pos] = peaks
 
-        return Gst.Bin.do_post_message(self, message)
+        # The levels are not posted on the bus, it would call the Python
+        # bus handlers for every 10ms of audio.
+        return True
+
+    def is_cached(self):
+        return self.passthrough
 
     def finalize(self, proxy=None):
         """Finalizes the previewer, saving data to file if needed."""
-        if not self.passthrough and self.peaks:
-            # Let's go mono.
-            if len(self.peaks) > 1:
-                samples = (
-                    numpy.array(self.peaks[0]) + numpy.array(self.peaks[1])) / 2
-            else:
-                samples = numpy.array(self.peaks[0])
+        if not self.passthrough and self.peaks is not None:
+            WaveformCache.save(self.uri, levels_to_samples(self.peaks))
 
-            self.samples = list(samples)
-            with open(self.wavefile, 'wb') as wavefile:
-                pickle.dump(list(samples), wavefile)
+        samples = WaveformCache.get(self.uri)
+        if samples is not None:
+            self.samples = samples
 
         if proxy:
             proxy_wavefile = get_wavefile_location_for_uri(proxy.get_id())
@@ -265,58 +458,487 @@ class WaveformPreviewer(PreviewerBin):
             os.symlink(self.wavefile, proxy_wavefile)
 
 
+def get_loudness_file_location(uri):
+    """Computes the path where the loudness of the asset should be stored."""
+    filename = get_file_hash(Gst.uri_get_location(uri)) + ".loudness.json"
+    cache_dir = get_dir(os.path.join(xdg_cache_home(), "waves"))
+
+    return os.path.join(cache_dir, filename)
+
+
+def get_loudness(uri):
+    """Gets the loudness of the specified asset, as measured on import.
+
+    Args:
+        uri (str): The URI of the asset.
+
+    Returns:
+        dict: The "peak" and "rms" levels of the whole asset in dB, or
+        None if not measured.
+    """
+    try:
+        with open(get_loudness_file_location(uri)) as loudness_file:
+            return json.load(loudness_file)
+    except (OSError, ValueError):
+        return None
+
+
+class LoudnessPreviewer(PreviewerBin):
+    """Bin to measure and save the loudness of the audio.
+
+    The loudness is the highest peak and the RMS level of the whole asset,
+    computed from the "level" messages. See `get_loudness`.
+    """
+
+    media_type = "audio"
+
+    __gproperties__ = {
+        "uri": (str,
+                "uri of the media file",
+                "A URI",
+                "",
+                GObject.PARAM_READWRITE),
+    }
+
+    def __init__(self):
+        PreviewerBin.__init__(self,
+                              "audioconvert ! level name=level interval=%d"
+                              " ! audioconvert" % LOUDNESS_INTERVAL)
+        self.level = self.internal_bin.get_by_name("level")
+        self.uri = None
+        self.passthrough = False
+        self.peak = -numpy.inf
+        # The sum of the mean square levels, in the linear scale.
+        self._power_sum = 0.0
+        self._power_count = 0
+
+    def do_get_property(self, prop):
+        if prop.name == 'uri':
+            return self.uri
+        else:
+            raise AttributeError('unknown property %s' % prop.name)
+
+    def do_set_property(self, prop, value):
+        if prop.name == 'uri':
+            self.uri = value
+            self.passthrough = os.path.exists(get_loudness_file_location(self.uri))
+        else:
+            raise AttributeError('unknown property %s' % prop.name)
+
+    # pylint: disable=arguments-differ
+    def do_post_message(self, message):
+        if message.type != Gst.MessageType.ELEMENT or \
+                message.src != self.level:
+            return Gst.Bin.do_post_message(self, message)
+
+        struct = message.get_structure()
+        if struct and not self.passthrough:
+            self.add_levels(struct.get_value("peak"), struct.get_value("rms"))
+        # Not posted on the bus, like the levels of WaveformPreviewer.
+        return True
+
+    def add_levels(self, peaks, rms):
+        """Accumulates the levels of the channels in an interval.
+
+        Args:
+            peaks (List[float]): The peak level of each channel, in dB.
+            rms (List[float]): The RMS level of each channel, in dB.
+        """
+        if peaks:
+            self.peak = max(self.peak, max(peaks))
+        if rms:
+            powers = numpy.power(10, numpy.asarray(rms, dtype=numpy.float64) / 10)
+            self._power_sum += float(powers.mean())
+            self._power_count += 1
+
+    def get_levels(self):
+        """Gets the loudness of the audio processed so far.
+
+        Returns:
+            dict: The "peak" and "rms" levels in dB.
+        """
+        if self._power_count and self._power_sum > 0:
+            rms = 10 * numpy.log10(self._power_sum / self._power_count)
+        else:
+            rms = -numpy.inf
+        return {"peak": float(self.peak), "rms": float(rms)}
+
+    def is_cached(self):
+        return self.passthrough
+
+    def finalize(self, proxy=None):
+        """Finalizes the previewer, saving data to file if needed."""
+        path = get_loudness_file_location(self.uri)
+        if not self.passthrough and self._power_count:
+            with open(path + ".tmp", "w") as loudness_file:
+                json.dump(self.get_levels(), loudness_file)
+            os.replace(path + ".tmp", path)
+
+        if proxy and os.path.exists(path):
+            proxy_path = get_loudness_file_location(proxy.get_id())
+            self.debug("symlinking %s and %s", path, proxy_path)
+            os.symlink(path, proxy_path)
+
+
 Gst.Element.register(None, "waveformbin", Gst.Rank.NONE,
                      WaveformPreviewer)
 Gst.Element.register(None, "thumbnailbin", Gst.Rank.NONE,
                      ThumbnailBin)
 Gst.Element.register(None, "teedthumbnailbin", Gst.Rank.NONE,
                      TeedThumbnailBin)
+Gst.Element.register(None, "loudnessbin", Gst.Rank.NONE,
+                     LoudnessPreviewer)
+
+
+register_analyzer("thumbnailbin")
+register_analyzer("waveformbin")
+register_analyzer("loudnessbin")
+
 
+class PreviewGeneratorManager(Loggable):
+    """Manager for running the previewers.
 
-# pylint: disable=too-few-public-methods
-class PreviewGeneratorManager():
-    """Manager for running the previewers."""
+    The first previewer of each GES.TrackType is started right away. While
+    the CPU usage of the process is below `cpu_budget`, one more previewer
+    per track type is started every PREVIEW_GENERATORS_CHECK_INTERVAL_MS, up
+    to `max_jobs`. Otherwise, the last started resumable previewer is
+    stopped and queued again. While the background work is paused, all the
+    resumable previewers are stopped.
+
+    The queued previewers are started by priority: first the ones visible
+    in the viewport of the timeline, closest to the playhead first, then
+    the others by their distance to the viewport. See `set_viewport`.
+
+    Attributes:
+        max_jobs (int): The maximum number of previewers running in
+            parallel for each track type.
+        cpu_budget (int): The CPU usage of the process above which no more
+            previewers are started, in percents of all the cores.
+    """
 
     def __init__(self):
-        # The current Previewer per GES.TrackType.
-        self._current_previewers = {}
-        # The queue of Previewers.
+        Loggable.__init__(self)
+        self.max_jobs = GlobalSettings.defaults["previewGeneratorsPerTrackType"]
+        self.cpu_budget = GlobalSettings.defaults["previewGeneratorsCpuBudget"]
+        # The running Previewers per GES.TrackType, in the starting order.
+        self._current_previewers = {
+            GES.TrackType.AUDIO: [],
+            GES.TrackType.VIDEO: []
+        }
+        # The queue of Previewers, oldest first.
         self._previewers = {
             GES.TrackType.AUDIO: [],
             GES.TrackType.VIDEO: []
         }
+        self._scheduler = BackgroundWorkScheduler.get_default()
+        self._scheduler.connect("paused-changed", self.__paused_changed_cb)
+        self._check_source_id = 0
+        # The visible interval of the timeline, or None if unknown.
+        self._viewport = None
+        self._playhead_position = 0
+
+    def set_limits(self, max_jobs, cpu_budget):
+        """Sets the maximum number of parallel previewers and the CPU budget.
+
+        Args:
+            max_jobs (int): The maximum number of previewers running in
+                parallel for each track type.
+            cpu_budget (int): The CPU usage in percents of all the cores.
+        """
+        self.max_jobs = max(1, max_jobs)
+        self.cpu_budget = cpu_budget
+        self.__schedule_check()
+
+    def set_viewport(self, start, end, playhead_position):
+        """Sets the visible part of the timeline, to prioritize the previewers.
+
+        If a queued previewer is visible while all the slots are taken, a
+        running resumable previewer which is not visible is stopped to make
+        room for it.
+
+        Args:
+            start (int): The timeline position at the left of the viewport.
+            end (int): The timeline position at the right of the viewport.
+            playhead_position (int): The position of the playhead.
+        """
+        self._viewport = (start, end)
+        self._playhead_position = playhead_position
+
+        for track_type, current in self._current_previewers.items():
+            queue = self._previewers[track_type]
+            if not queue or len(current) < self.max_jobs:
+                continue
+
+            previewer = self.__get_next_previewer(track_type)
+            if self._get_priority(previewer)[0] > 0:
+                # Not visible.
+                continue
+
+            hidden = [running for running in current
+                      if running.resumable and self._get_priority(running)[0] > 0]
+            if hidden:
+                self._stop_previewer(max(hidden, key=self._get_priority))
+                queue.remove(previewer)
+                self._start_previewer(previewer)
+
+    def _get_priority(self, previewer):
+        """Gets the priority of the specified previewer, lowest first.
+
+        Returns:
+            (int, int): The distance from the viewport and the distance from
+            the playhead of the closest interval displaying the previews.
+        """
+        if self._viewport is None:
+            return 0, 0
+
+        start, end = self._viewport
+        priorities = [(max(0, interval_start - end, start - interval_end),
+                       max(0, interval_start - self._playhead_position,
+                           self._playhead_position - interval_end))
+                      for interval_start, interval_end in previewer.get_timeline_intervals()]
+        # The previewers not displayed anymore are quickly done.
+        return min(priorities, default=(0, 0))
+
+    def __get_next_previewer(self, track_type):
+        queue = self._previewers[track_type]
+        # Between equals, the oldest one is preferred.
+        unused_index, previewer = min(
+            enumerate(queue),
+            key=lambda item: (self._get_priority(item[1]), item[0]))
+        return previewer
+
+    def __pop_next_previewer(self, track_type):
+        previewer = self.__get_next_previewer(track_type)
+        self._previewers[track_type].remove(previewer)
+        return previewer
 
     def add_previewer(self, previewer):
         """Adds the specified previewer to the queue.
 
         Args:
-            previewer (Previewer): The previewer to control.
+            previewer (Previewer or ThumbnailGenerator): The previewer
+                to control.
         """
         track_type = previewer.track_type
 
-        current = self._current_previewers.get(track_type)
-        if previewer in self._previewers[track_type] or previewer is current:
+        current = self._current_previewers[track_type]
+        if previewer in self._previewers[track_type] or previewer in current:
             # Already in the queue or already processing.
             return
 
-        if not self._previewers[track_type] and current is None:
+        if not self._previewers[track_type] and not current and \
+                not self._scheduler.paused:
             self._start_previewer(previewer)
         else:
-            self._previewers[track_type].insert(0, previewer)
+            self._previewers[track_type].append(previewer)
+            self.__schedule_check()
 
     def _start_previewer(self, previewer):
-        self._current_previewers[previewer.track_type] = previewer
+        self._current_previewers[previewer.track_type].append(previewer)
         previewer.connect("done", self.__previewer_done_cb)
         previewer.startGeneration()
 
+    def _stop_previewer(self, previewer):
+        """Stops the specified previewer and queues it first."""
+        self.debug("Stopping %s", previewer)
+        self._current_previewers[previewer.track_type].remove(previewer)
+        previewer.disconnect_by_func(self.__previewer_done_cb)
+        previewer.stopGeneration()
+        self._previewers[previewer.track_type].insert(0, previewer)
+
+    def __schedule_check(self):
+        if not self._check_source_id:
+            self._check_source_id = GLib.timeout_add(
+                PREVIEW_GENERATORS_CHECK_INTERVAL_MS, self._check_cpu_usage_cb)
+
+    def __paused_changed_cb(self, unused_scheduler, paused):
+        if paused:
+            for current in self._current_previewers.values():
+                for previewer in reversed(list(current)):
+                    if previewer.resumable:
+                        self._stop_previewer(previewer)
+        else:
+            for track_type, current in self._current_previewers.items():
+                if self._previewers[track_type] and not current:
+                    self._start_previewer(self.__pop_next_previewer(track_type))
+            self.__schedule_check()
+
+    def _check_cpu_usage_cb(self):
+        if self._scheduler.paused:
+            # Checking again when resumed.
+            self._check_source_id = 0
+            return False
+
+        allowed = self._scheduler.is_below(self.cpu_budget)
+        for track_type, current in self._current_previewers.items():
+            queue = self._previewers[track_type]
+            if allowed:
+                if queue and len(current) < self.max_jobs:
+                    self._start_previewer(self.__pop_next_previewer(track_type))
+            else:
+                resumable = [previewer for previewer in current[1:]
+                             if previewer.resumable]
+                if resumable:
+                    self._stop_previewer(resumable[-1])
+
+        if any(self._previewers.values()) or \
+                any(len(current) > 1 for current in self._current_previewers.values()):
+            return True
+
+        self._check_source_id = 0
+        return False
+
     def __previewer_done_cb(self, previewer):
         track_type = previewer.track_type
-        next_previewer = self._current_previewers.pop(track_type, None)
-        if next_previewer:
-            next_previewer.disconnect_by_func(self.__previewer_done_cb)
+        current = self._current_previewers[track_type]
+        if previewer not in current:
+            return
+        current.remove(previewer)
+        previewer.disconnect_by_func(self.__previewer_done_cb)
+
+        # The CPU used by the previewer which finished is available.
+        if self._previewers[track_type] and len(current) < self.max_jobs and \
+                not self._scheduler.paused:
+            self._start_previewer(self.__pop_next_previewer(track_type))
+
+
+class PreviewsPrefetcher(Loggable):
+    """Prepares the previews about to be scrolled into view.
 
-        if self._previewers[track_type]:
-            self._start_previewer(self._previewers[track_type].pop())
+    Tracks the direction and the speed of the horizontal scrolling of the
+    timeline, see `set_viewport`, and asks the clients displayed one to two
+    screens ahead to prepare their previews, the faster the scrolling the
+    further. When the direction reverses, the clients are asked to cancel
+    the prefetching.
+
+    The clients implement `get_timeline_intervals`, `prefetch(start, end,
+    direction)` and `cancel_prefetch()`.
+
+    Attributes:
+        direction (int): 1 when scrolling to the right, -1 when scrolling
+            to the left, 0 when not scrolling.
+        velocity (float): The scrolling speed, in screens per second.
+    """
+
+    def __init__(self):
+        Loggable.__init__(self)
+        self.direction = 0
+        self.velocity = 0.0
+        self._clients = []
+        # The visible interval of the timeline, or None if unknown.
+        self._viewport = None
+        self._last_time = 0
+        self._prefetch_source_id = 0
+
+    def add_client(self, previewer):
+        """Registers a previewer to be asked to prefetch its previews."""
+        if previewer not in self._clients:
+            self._clients.append(previewer)
+
+    def remove_client(self, previewer):
+        """Unregisters a previewer."""
+        if previewer in self._clients:
+            self._clients.remove(previewer)
+
+    def set_viewport(self, start, end):
+        """Sets the visible part of the timeline, to track the scrolling.
+
+        Args:
+            start (int): The timeline position at the left of the viewport.
+            end (int): The timeline position at the right of the viewport.
+        """
+        now = time.monotonic()
+        viewport = self._viewport
+        self._viewport = (start, end)
+        if viewport is None or \
+                abs((end - start) - (viewport[1] - viewport[0])) > (end - start) / 100:
+            # Zoomed, not scrolled.
+            self.__set_direction(0)
+            self._last_time = now
+            return
+
+        delta = start - viewport[0]
+        if not delta or end <= start:
+            return
+
+        interval = max(now - self._last_time, PREFETCH_MIN_INTERVAL_S)
+        self._last_time = now
+        self.__set_direction(1 if delta > 0 else -1)
+        # Smooth the speed of the successive scroll events.
+        speed = abs(delta) / (end - start) / interval
+        self.velocity = (self.velocity + speed) / 2
+
+        if not self._prefetch_source_id:
+            self._prefetch_source_id = GLib.idle_add(
+                self.__prefetch_cb, priority=GLib.PRIORITY_LOW)
+
+    def __set_direction(self, direction):
+        if direction == self.direction:
+            return
+
+        previous_direction = self.direction
+        self.direction = direction
+        self.velocity = 0.0
+        if previous_direction:
+            self.log("The scrolling direction changed to %d", direction)
+            for client in list(self._clients):
+                client.cancel_prefetch()
+
+    def get_prefetch_interval(self):
+        """Gets the part of the timeline to be prefetched.
+
+        Returns:
+            (int, int): The start and end of the interval, or None if not
+            scrolling.
+        """
+        if not self.direction or self._viewport is None:
+            return None
+
+        start, end = self._viewport
+        # Two screens ahead when scrolling a screen per second or faster.
+        length = int((end - start) * min(PREFETCH_MAX_SCREENS, 1 + self.velocity))
+        if self.direction > 0:
+            return end, end + length
+        return max(0, start - length), start
+
+    def get_priority(self, position):
+        """Gets the priority of the previews at the specified position.
+
+        Args:
+            position (int): A timeline position.
+
+        Returns:
+            (int, int): The priority, lowest first: the visible previews
+            from left to right, then the ones to be prefetched, closest
+            first, then the others from left to right.
+        """
+        if self._viewport is None:
+            return 0, position
+
+        start, end = self._viewport
+        if start <= position < end:
+            return 0, position
+
+        interval = self.get_prefetch_interval()
+        if interval and interval[0] <= position < interval[1]:
+            if self.direction > 0:
+                return 1, position - end
+            return 1, start - position
+
+        return 2, position
+
+    def __prefetch_cb(self):
+        self._prefetch_source_id = 0
+        interval = self.get_prefetch_interval()
+        if not interval:
+            return False
+
+        start, end = interval
+        for client in list(self._clients):
+            if any(client_start < end and start < client_end
+                   for client_start, client_end in client.get_timeline_intervals()):
+                client.prefetch(start, end, self.direction)
+        return False
 
 
 class Previewer(Gtk.Layout):
@@ -324,10 +946,23 @@ class Previewer(Gtk.Layout):
 
     Attributes:
         track_type (GES.TrackType): The type of content.
+        resumable (bool): Whether the generation can be stopped and started
+            again without starting over.
+        manager (PreviewGeneratorManager): The manager running the previewers.
+        cache_manager (PreviewsCacheManager): The manager of the disk space
+            used by the previews.
+        prefetcher (PreviewsPrefetcher): The prefetcher of the previews
+            about to be scrolled into view.
     """
 
+    resumable = False
+
     # We only need one PreviewGeneratorManager to manage all previewers.
-    __manager = PreviewGeneratorManager()
+    manager = PreviewGeneratorManager()
+
+    cache_manager = PreviewsCacheManager()
+
+    prefetcher = PreviewsPrefetcher()
 
     def __init__(self, track_type):
         Gtk.Layout.__init__(self)
@@ -342,70 +977,210 @@ class Previewer(Gtk.Layout):
         """Stops preview generation."""
         raise NotImplementedError
 
+    def get_timeline_intervals(self):
+        """Gets the intervals of the timeline where the previews are displayed.
+
+        Returns:
+            List[(int, int)]: The start and end of the intervals.
+        """
+        start = self.ges_elem.props.start
+        return [(start, start + self.ges_elem.props.duration)]
+
     def becomeControlled(self):
         """Lets the PreviewGeneratorManager control our execution."""
-        Previewer.__manager.add_previewer(self)
+        Previewer.manager.add_previewer(self)
+
+    def get_asset_interval(self, start, end):
+        """Gets the part of the asset displayed in the specified interval.
+
+        Args:
+            start (int): The start of an interval of the timeline.
+            end (int): The end of the interval.
+
+        Returns:
+            (int, int): The start and end of the part of the asset, or None
+            if the previewer is not displayed in the interval.
+        """
+        elem_start = self.ges_elem.props.start
+        elem_end = elem_start + self.ges_elem.props.duration
+        start = max(start, elem_start)
+        end = min(end, elem_end)
+        if start >= end:
+            return None
+        in_point = self.ges_elem.props.in_point
+        return start - elem_start + in_point, end - elem_start + in_point
+
+    def prefetch(self, start, end, direction):
+        """Prepares the previews displayed in the specified interval.
+
+        Args:
+            start (int): The start of an interval of the timeline.
+            end (int): The end of the interval.
+            direction (int): 1 when scrolling to the right, -1 otherwise.
+        """
+        pass
+
+    def cancel_prefetch(self):
+        """Cancels the preparation of the previews not yet prefetched."""
+        pass
 
     def setSelected(self, selected):
         """Marks this instance as being selected."""
         pass
 
 
-class VideoPreviewer(Previewer, Zoomable, Loggable):
-    """A video previewer widget, drawing thumbnails.
+class ThumbnailGenerator(GObject.Object, Loggable):
+    """Generator of the thumbnails of an asset, shared by its clips.
+
+    The VideoPreviewers of the clips using the same asset are clients of the
+    same generator, which decodes the file with a single pipeline, fills the
+    shared ThumbnailCache and notifies the clients about the new thumbnails.
 
     Attributes:
-        ges_elem (GES.TrackElement): The previewed element.
-        thumbs (dict): Maps (quantized) times to Thumbnail objects.
+        track_type (GES.TrackType): The type of content.
+        uri (str): The URI of the asset.
+        mode (str): The ThumbnailingMode used for generating the thumbnails.
+        duration (int): The duration to use if the pipeline cannot tell it.
         thumb_cache (ThumbnailCache): The pixmaps persistent cache.
+        thumb_period (int): The distance between two thumbnails, the finest
+            period wished by the clients when the generation started. See
+            `set_wishlist`.
+        thumbs_per_second (float): The rate at which the thumbnails have
+            been generated, once the generation is over.
+        resumable (bool): Always True, the missing thumbnails are looked up
+            in the cache when the generation starts. In sequential mode the
+            decoding starts at the first missing thumbnail and skips the
+            long spans of cached ones.
+
+    Signals:
+        thumbnail: A thumbnail has been generated at the specified position.
     """
 
-    # We could define them in Previewer, but for some reason they are ignored.
-    __gsignals__ = PREVIEW_GENERATOR_SIGNALS
+    __gsignals__ = dict(PREVIEW_GENERATOR_SIGNALS, thumbnail=(
+        GObject.SIGNAL_RUN_LAST, None, (object, object)))
 
-    def __init__(self, ges_elem):
-        Previewer.__init__(self, GES.TrackType.VIDEO)
-        Zoomable.__init__(self)
+    generators_by_uri = {}
+
+    resumable = True
+
+    def __init__(self, uri, mode):
+        GObject.Object.__init__(self)
         Loggable.__init__(self)
 
-        # Variables related to the timeline objects
-        self.timeline = ges_elem.get_parent().get_timeline().ui
-        self.ges_elem = ges_elem
+        self.track_type = GES.TrackType.VIDEO
+        self.uri = uri
+        self.mode = mode
+        self.duration = 0
 
-        # Guard against malformed URIs
-        self.uri = quote_uri(get_proxy_target(ges_elem).props.id)
+        # The wishlist of each client VideoPreviewer.
+        self._wishlists = OrderedDict()
+        # The period of the thumbnails wished by each client.
+        self._periods = {}
 
         # Variables related to thumbnailing
-        self.wishlist = []
-        self.queue = []
+        # The positions generated so far.
+        self._generated = set()
+        # The positions of the coarse levels of the pyramid not yet generated.
+        self._coarse_queue = []
+        # The position of the poster frame, see get_poster_position.
+        self._poster_position = None
+        # The positions not cached yet, sorted, when thumbnailing sequentially.
+        self._sequential_missing = []
         self._thumb_cb_id = None
-        self._running = False
 
-        # We should have one thumbnail per thumb_period.
-        # TODO: get this from the user settings
-        self.thumb_period = int(0.5 * Gst.SECOND)
+        self.thumb_period = THUMB_PERIODS[0]
+        self._automatic = mode == ThumbnailingMode.AUTOMATIC
+        self._keyframes_distance = None
+        # The keyframes found while estimating their distance, if estimating.
+        self._keyframes = None
         self.thumb_height = THUMB_HEIGHT
+        self.thumb_width = None
 
-        self.__image_pixbuf = None
-        if isinstance(ges_elem, GES.ImageSource):
-            self.__image_pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
-                Gst.uri_get_location(self.uri), -1, self.thumb_height, True)
+        # The position of the last seek.
+        self._seek_position = None
+        self._thumbs_generated = 0
+        self._generation_start_time = None
 
-        self.thumbs = {}
         self.thumb_cache = ThumbnailCache.get(self.uri)
-        self.thumb_width, unused_height = self.thumb_cache.getImagesSize()
 
-        self.cpu_usage_tracker = CPUUsageTracker()
+        self._scheduler = BackgroundWorkScheduler.get_default()
         self.interval = 500  # Every 0.5 second, reevaluate the situation
-
-        # Connect signals and fire things up
-        self.ges_elem.connect("notify::in-point", self._inpoint_changed_cb)
+        self.thumbs_per_second = None
 
         self.pipeline = None
         self.gdkpixbufsink = None
-        self.becomeControlled()
 
-        self.connect("notify::height-request", self._heightChangedCb)
+    @classmethod
+    def get(cls, uri, mode):
+        """Gets the generator for the specified URI.
+
+        Args:
+            uri (str): The URI of the asset.
+            mode (str): The ThumbnailingMode to use if the generator is
+                created.
+
+        Returns:
+            ThumbnailGenerator: The generator for the asset.
+        """
+        if uri not in cls.generators_by_uri:
+            cls.generators_by_uri[uri] = ThumbnailGenerator(uri, mode)
+        return cls.generators_by_uri[uri]
+
+    def add_client(self, previewer):
+        """Registers a previewer interested in the thumbnails."""
+        self._wishlists[previewer] = []
+        ges_elem = previewer.ges_elem
+        self.duration = max(self.duration,
+                            ges_elem.props.in_point + ges_elem.props.duration)
+        Previewer.manager.add_previewer(self)
+
+    def remove_client(self, previewer):
+        """Unregisters a previewer, stopping the generation if it's the last."""
+        self._wishlists.pop(previewer, None)
+        self._periods.pop(previewer, None)
+        if self._wishlists:
+            return
+
+        self.stopGeneration()
+        if self.generators_by_uri.get(self.uri) is self:
+            del self.generators_by_uri[self.uri]
+            self.thumb_cache.release()
+
+    def get_timeline_intervals(self):
+        """Gets the intervals of the timeline where the clients are displayed.
+
+        Returns:
+            List[(int, int)]: The start and end of the intervals.
+        """
+        intervals = []
+        for previewer in self._wishlists:
+            intervals.extend(previewer.get_timeline_intervals())
+        return intervals
+
+    def set_wishlist(self, previewer, wishlist, period=THUMB_PERIODS[0]):
+        """Sets the positions of the thumbnails missing for a previewer.
+
+        The wishes of all the clients are merged into the queue of the
+        generator, the generation restarting if it was over.
+
+        Args:
+            previewer (VideoPreviewer): The client.
+            wishlist (List[int]): The missing positions, by priority.
+            period (int): The distance between the thumbnails displayed by
+                the client, one of THUMB_PERIODS.
+        """
+        if previewer not in self._wishlists:
+            return
+
+        self._wishlists[previewer] = list(wishlist)
+        self._periods[previewer] = period
+        if self.pipeline and self.mode == ThumbnailingMode.SEQUENTIAL and \
+                wishlist and period < self.thumb_period:
+            # The pipeline outputs the thumbnails at a coarser period.
+            self.debug("Restarting the generation for a %s period", period)
+            self.stopGeneration()
+        if wishlist:
+            Previewer.manager.add_previewer(self)
 
     # Internal API
     def _setupPipeline(self):
@@ -414,15 +1189,18 @@ class VideoPreviewer(Previewer, Zoomable, Loggable):
         It has the form "playbin ! thumbnailsink" where thumbnailsink
         is a Bin made out of "videorate ! capsfilter ! gdkpixbufsink"
         """
-        # TODO: don't hardcode framerate
+        self.thumb_period = min(self._periods.values(), default=THUMB_PERIODS[0])
+        # The framerate is one frame per thumb_period, a multiple of 0.5s.
         self.pipeline = Gst.parse_launch(
             "uridecodebin uri={uri} name=decode ! "
             "videoconvert ! "
             "videorate ! "
             "videoscale method=lanczos ! "
             "capsfilter caps=video/x-raw,format=(string)RGBA,height=(int){height},"
-            "pixel-aspect-ratio=(fraction)1/1,framerate=2/1 ! "
-            "gdkpixbufsink name=gdkpixbufsink".format(uri=self.uri, height=self.thumb_height))
+            "pixel-aspect-ratio=(fraction)1/1,framerate=2/{frames} ! "
+            "gdkpixbufsink name=gdkpixbufsink".format(
+                uri=self.uri, height=self.thumb_height,
+                frames=max(1, self.thumb_period * 2 // Gst.SECOND)))
 
         # get the gdkpixbufsink and the sinkpad
         self.gdkpixbufsink = self.pipeline.get_by_name("gdkpixbufsink")
@@ -455,6 +1233,70 @@ class VideoPreviewer(Previewer, Zoomable, Loggable):
         self.pipeline.get_bus().add_signal_watch()
         self.pipeline.get_bus().connect("message", self.__bus_message_handler)
 
+    def __choose_mode(self):
+        """Chooses the thumbnailing mode, in automatic mode."""
+        if self._automatic:
+            # The mode depends on the period and on the missing thumbnails,
+            # chosen again every time.
+            wishes = [wish
+                      for wishlist in self._wishlists.values()
+                      for wish in wishlist
+                      if wish not in self._generated]
+            self.mode = choose_thumbnailing_mode(self._keyframes_distance,
+                                                 self.thumb_period, wishes)
+            self.debug("Keyframes every %s, thumbnailing every %s in %s mode: %s",
+                       self._keyframes_distance, self.thumb_period, self.mode,
+                       filename_from_uri(self.uri))
+        if self.mode == ThumbnailingMode.SEQUENTIAL:
+            # Decode as fast as allowed by _modulate_sequential_cb. All the
+            # frames are decoded, the period only limiting the ones scaled
+            # and converted, so the coarser periods are generated by
+            # seeking, see choose_thumbnailing_mode.
+            self.gdkpixbufsink.props.sync = False
+
+    def _estimate_keyframes_distance(self):
+        """Starts estimating the distance between two keyframes of the video.
+
+        Seeks with the KEY_UNIT flag before and after the middle of the
+        prerolled pipeline, which is cheap since only keyframes are decoded.
+        The position reached by each seek is read when it's done, see
+        `__keyframe_reached`, and the thumbnailing starts after the second.
+        """
+        self._keyframes = []
+        self.__seek_keyframe(Gst.SeekFlags.SNAP_BEFORE)
+
+    def __seek_keyframe(self, snap_flag):
+        res, duration = self.pipeline.query_duration(Gst.Format.TIME)
+        if not res or duration <= 0 or not self.pipeline.seek_simple(
+                Gst.Format.TIME,
+                Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT | snap_flag,
+                duration // 2):
+            self.__keyframes_estimated(0)
+
+    def __keyframe_reached(self):
+        res, position = self.pipeline.query_position(Gst.Format.TIME)
+        if not res:
+            self.__keyframes_estimated(0)
+            return
+
+        self._keyframes.append(position)
+        if len(self._keyframes) == 1:
+            self.__seek_keyframe(Gst.SeekFlags.SNAP_AFTER)
+        else:
+            self.__keyframes_estimated(self._keyframes[1] - self._keyframes[0])
+
+    def __keyframes_estimated(self, keyframes_distance):
+        """Starts thumbnailing once the keyframes distance is known.
+
+        Args:
+            keyframes_distance (int): The distance in nanoseconds, or 0 if
+                it cannot be computed.
+        """
+        self._keyframes = None
+        self._keyframes_distance = keyframes_distance
+        self.__choose_mode()
+        self._startThumbnailingWhenIdle()
+
     def _checkCPU(self):
         """Adjusts when the next thumbnail is generated.
 
@@ -462,8 +1304,7 @@ class VideoPreviewer(Previewer, Zoomable, Loggable):
         thumbnail will be generated +/- 10%. Even then, it will only
         happen when the gobject loop is idle to avoid blocking the UI.
         """
-        usage_percent = self.cpu_usage_tracker.usage()
-        if usage_percent < THUMBNAILS_CPU_USAGE:
+        if self._scheduler.allows(self):
             self.interval *= 0.9
             self.log(
                 'Thumbnailing sped up (+10%%) to a %.1f ms interval for "%s"',
@@ -473,7 +1314,6 @@ class VideoPreviewer(Previewer, Zoomable, Loggable):
             self.log(
                 'Thumbnailing slowed down (-10%%) to a %.1f ms interval for "%s"',
                 self.interval, filename_from_uri(self.uri))
-        self.cpu_usage_tracker.reset()
         self._thumb_cb_id = GLib.timeout_add(self.interval,
                                              self._create_next_thumb,
                                              priority=GLib.PRIORITY_LOW)
@@ -495,160 +1335,450 @@ class VideoPreviewer(Previewer, Zoomable, Loggable):
         query_success, duration = self.pipeline.query_duration(Gst.Format.TIME)
         if not query_success or duration == -1:
             self.debug("Could not determine duration of: %s", self.uri)
-            duration = self.ges_elem.props.duration
-
-        self.queue = list(range(0, duration, self.thumb_period))
-
-        self._checkCPU()
-
-        # Save periodically to avoid the common situation where the user exits
-        # the app before a long clip has been fully thumbnailed.
-        # Spread timeouts between 30-80 secs to avoid concurrent disk writes.
-        random_time = random.randrange(30, 80)
-        GLib.timeout_add_seconds(random_time, self._autosave)
+            duration = self.duration
+
+        # Fill the coarse levels of the pyramid first, so the timeline
+        # shows complete strips when zoomed out.
+        self._coarse_queue = []
+        for period in THUMB_PYRAMID_PERIODS:
+            missing = self.thumb_cache.get_missing_positions(0, duration, period)
+            self._coarse_queue.extend(sorted(missing - set(self._coarse_queue)))
+        # The poster frame is saved once its thumbnail exists.
+        self._poster_position = get_poster_position(duration)
+        if self._poster_position not in self._coarse_queue and \
+                not self.thumb_cache.has_poster() and \
+                self._poster_position not in self.thumb_cache:
+            self._coarse_queue.insert(0, self._poster_position)
+        self._thumbs_generated = 0
+        self._generation_start_time = time.monotonic()
+        self._seek_position = None
+
+        if self.mode == ThumbnailingMode.SEQUENTIAL:
+            self._sequential_missing = sorted(self.thumb_cache.get_missing_positions(
+                0, duration, self.thumb_period))
+            if not self._sequential_missing:
+                self.debug("All the thumbnails are cached already")
+                self.stopGeneration()
+                self.thumb_cache.commit(self._poster_position)
+                return False
+
+            # Resume after the thumbnails generated before being stopped.
+            self.__seek_sequential(self._sequential_missing[0])
+            self.pipeline.set_state(Gst.State.PLAYING)
+            self._thumb_cb_id = GLib.timeout_add(
+                SEQUENTIAL_THUMBNAILING_INTERVAL_MS,
+                self._modulate_sequential_cb, priority=GLib.PRIORITY_LOW)
+        else:
+            self._checkCPU()
 
         # Remove the GSource
         return False
 
     def _create_next_thumb(self):
-        if not self.wishlist or not self.queue:
+        wish = self._get_wish()
+        if wish is not None:
+            # If the seek fails, the position is wished again by the clients
+            # the next time they are updated.
+            position = wish
+        elif self._coarse_queue:
+            # Nothing visible is missing, refine the pyramid in the background.
+            # The position is tried once, the seek can fail, for example
+            # past the last frame.
+            position = self._coarse_queue.pop(0)
+        else:
             # nothing left to do
             self.debug("Thumbnails generation complete")
             self.stopGeneration()
-            self.thumb_cache.commit()
-            return
-        else:
-            self.debug("Missing %d thumbs", len(self.wishlist))
+            self.thumb_cache.commit(self._poster_position)
+            return False
 
-        wish = self._get_wish()
-        if wish:
-            time = wish
-            self.queue.remove(wish)
-        else:
-            time = self.queue.pop(0)
+        self.debug("Missing %d thumbs",
+                   sum(len(wishlist) for wishlist in self._wishlists.values()) +
+                   len(self._coarse_queue))
         self.log('Creating thumb for "%s"' % filename_from_uri(self.uri))
-        # append the time to the end of the queue so that if this seek fails
-        # another try will be started later
-        self.queue.append(time)
+        self._seek_position = position
+        if self.mode == ThumbnailingMode.FAST:
+            # Accept the keyframe closest to the position.
+            flags = Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT | \
+                Gst.SeekFlags.SNAP_NEAREST
+        else:
+            flags = Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE
         self.pipeline.seek(1.0,
-                           Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
-                           Gst.SeekType.SET, time,
+                           Gst.Format.TIME, flags,
+                           Gst.SeekType.SET, position,
                            Gst.SeekType.NONE, -1)
 
         # Remove the GSource
         return False
 
-    def _autosave(self):
-        if self.wishlist:
-            self.log("Periodic thumbnail autosave")
-            self.thumb_cache.commit()
-            return True
+    def _modulate_sequential_cb(self):
+        """Pauses the sequential decoding while the CPU usage is too high."""
+        if self._scheduler.allows(self):
+            self.pipeline.set_state(Gst.State.PLAYING)
         else:
-            return False  # Stop the timer
+            self.log("Sequential thumbnailing paused for \"%s\"",
+                     filename_from_uri(self.uri))
+            self.pipeline.set_state(Gst.State.PAUSED)
+        # Keep the glib timer running.
+        return True
+
+    def __seek_sequential(self, position):
+        self._seek_position = position
+        self.pipeline.seek_simple(Gst.Format.TIME,
+                                  Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                                  position)
+
+    def _set_sequential_pixbuf(self, position, pixbuf):
+        """Stores the pixbuf decoded sequentially, unless cached already.
+
+        Seeks over the following cached thumbnails, if they span more than
+        the distance between two keyframes.
+        """
+        if self._seek_position is not None:
+            if position < self._seek_position:
+                # Decoded before the seek.
+                return
+            self._seek_position = None
+
+        missing = self._sequential_missing
+        index = bisect.bisect_left(missing, position)
+        if index < len(missing) and missing[index] == position:
+            self._set_pixbuf(position, pixbuf)
+            index += 1
+        del missing[:index]
+
+        if not missing:
+            self.debug("Sequential thumbnails generation complete")
+            self.stopGeneration()
+            self.thumb_cache.commit(self._poster_position)
+        elif missing[0] - position > max(SEQUENTIAL_SKIP_MIN_DISTANCE,
+                                         self._keyframes_distance or 0):
+            self.log("Skipping the cached thumbnails until %s", missing[0])
+            self.__seek_sequential(missing[0])
+
+    def _get_wish(self):
+        """Returns a wish not generated yet, if any."""
+        for wishlist in self._wishlists.values():
+            while wishlist:
+                wish = wishlist.pop(0)
+                if wish not in self._generated:
+                    return wish
+        return None
 
+    def _set_pixbuf(self, position, pixbuf):
+        """Stores the pixbuf generated at the specified position."""
+        self._generated.add(position)
+        if position in self._coarse_queue:
+            self._coarse_queue.remove(position)
+        self.thumb_cache[position] = pixbuf
+        self._thumbs_generated += 1
+        self.emit("thumbnail", position, pixbuf)
+
+    # Callbacks
+
+    def __bus_message_handler(self, unused_bus, message):
+        if self._keyframes is not None:
+            # Estimating the keyframes distance, the frames are not used.
+            if message.type == Gst.MessageType.ASYNC_DONE and \
+                    message.src == self.pipeline:
+                self.__keyframe_reached()
+        elif message.type == Gst.MessageType.ELEMENT and \
+                message.src == self.gdkpixbufsink:
+            struct = message.get_structure()
+            struct_name = struct.get_name()
+            if struct_name == "preroll-pixbuf" and \
+                    self.mode != ThumbnailingMode.SEQUENTIAL:
+                stream_time = struct.get_value("stream-time")
+                if self._seek_position is not None:
+                    # The reported position can differ from the requested
+                    # one, for example when accepting a keyframe.
+                    stream_time = self._seek_position
+                    self._seek_position = None
+                pixbuf = struct.get_value("pixbuf")
+                self._set_pixbuf(stream_time, pixbuf)
+            elif struct_name == "pixbuf" and \
+                    self.mode == ThumbnailingMode.SEQUENTIAL:
+                stream_time = struct.get_value("stream-time")
+                # videorate outputs one frame per thumb_period.
+                position = int(round(stream_time / self.thumb_period)) * self.thumb_period
+                pixbuf = struct.get_value("pixbuf")
+                self._set_sequential_pixbuf(position, pixbuf)
+        elif message.type == Gst.MessageType.ASYNC_DONE and \
+                message.src == self.pipeline and \
+                self.mode != ThumbnailingMode.SEQUENTIAL:
+            self._checkCPU()
+        elif message.type == Gst.MessageType.EOS and \
+                message.src == self.pipeline:
+            self.debug("Sequential thumbnails generation complete")
+            self.stopGeneration()
+            self.thumb_cache.commit(self._poster_position)
+        return Gst.BusSyncReply.PASS
+
+    # pylint: disable=no-self-use
+    def _autoplugSelectCb(self, unused_decode, unused_pad, unused_caps, factory):
+        # Don't plug audio decoders / parsers.
+        if "Audio" in factory.get_klass():
+            return True
+        return False
+
+    def startGeneration(self):
+        """Starts preview generation."""
+        if not self._wishlists:
+            # All the clients went away while waiting in the queue.
+            self.emit("done")
+            return
+
+        self._scheduler.add_producer(self, THUMBNAILS_CPU_USAGE)
+        self._setupPipeline()
+        if self._automatic and self._keyframes_distance is None:
+            # The thumbnailing starts once the estimation is done.
+            self._estimate_keyframes_distance()
+            return
+
+        self.__choose_mode()
+        self._startThumbnailingWhenIdle()
+
+    def stopGeneration(self):
+        """Stops preview generation."""
+        self._scheduler.remove_producer(self)
+        self._keyframes = None
+        if self._thumb_cb_id:
+            GLib.source_remove(self._thumb_cb_id)
+            self._thumb_cb_id = None
+
+        if self.pipeline:
+            self.pipeline.set_state(Gst.State.NULL)
+            self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+            self.pipeline = None
+
+        if self._generation_start_time is not None:
+            elapsed = time.monotonic() - self._generation_start_time
+            self._generation_start_time = None
+            if elapsed > 0:
+                self.thumbs_per_second = self._thumbs_generated / elapsed
+                self.info("Generated %d thumbnails in %.1f s (%.1f thumbnails/s)"
+                          " in %s mode for: %s",
+                          self._thumbs_generated, elapsed, self.thumbs_per_second,
+                          self.mode, filename_from_uri(self.uri))
+        self.emit("done")
+
+
+class VideoPreviewer(Previewer, Zoomable, Loggable):
+    """A video previewer widget, drawing thumbnails.
+
+    The thumbnails are painted in `do_draw`, only the ones in the area
+    being drawn.
+
+    Attributes:
+        ges_elem (GES.TrackElement): The previewed element.
+        generator (ThumbnailGenerator): The generator of the thumbnails,
+            shared by the previewers of the same asset.
+        thumbs (dict): Maps (quantized) times to the displayed pixbufs,
+            None if not available yet.
+        thumb_cache (ThumbnailCache): The pixmaps persistent cache.
+    """
+
+    def __init__(self, ges_elem):
+        Previewer.__init__(self, GES.TrackType.VIDEO)
+        Zoomable.__init__(self)
+        Loggable.__init__(self)
+
+        # Variables related to the timeline objects
+        self.timeline = ges_elem.get_parent().get_timeline().ui
+        self.ges_elem = ges_elem
+
+        # Guard against malformed URIs
+        self.uri = quote_uri(get_proxy_target(ges_elem).props.id)
+
+        # Variables related to thumbnailing
+        self.wishlist = []
+        self.thumb_height = THUMB_HEIGHT
+
+        self.__image_pixbuf = None
+        if isinstance(ges_elem, GES.ImageSource):
+            self.__image_pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
+                Gst.uri_get_location(self.uri), -1, self.thumb_height, True)
+
+        self.thumbs = {}
+        # The positions of the thumbnails, sorted.
+        self._positions = []
+        # Maps the positions of the displayed pixbufs to thumbnail positions.
+        self._positions_by_source = {}
+        # The period of the displayed thumbnails.
+        self._level_period = THUMB_PERIODS[0]
+        self._opacity = 1.0
+        self.thumb_cache = ThumbnailCache.get(self.uri)
+        self.thumb_width, unused_height = self.thumb_cache.getImagesSize()
+
+        # Connect signals and fire things up
+        self.ges_elem.connect("notify::in-point", self._inpoint_changed_cb)
+
+        self.generator = ThumbnailGenerator.get(
+            self.uri, self.timeline.app.settings.thumbnailingMode)
+        self.generator.connect("thumbnail", self._thumbnail_cb)
+        self.generator.add_client(self)
+        Previewer.prefetcher.add_client(self)
+
+        self.connect("notify::height-request", self._heightChangedCb)
+
+    # Internal API
     def _get_thumb_duration(self):
         thumb_duration_tmp = Zoomable.pixelToNs(self.thumb_width + THUMB_MARGIN_PX)
-        # quantize thumb length to thumb_period
-        thumb_duration = quantize(thumb_duration_tmp, self.thumb_period)
+        # quantize thumb length to the finest period
+        thumb_duration = quantize(thumb_duration_tmp, THUMB_PERIODS[0])
         # make sure that the thumb duration after the quantization isn't
         # smaller than before
         if thumb_duration < thumb_duration_tmp:
-            thumb_duration += self.thumb_period
-        # make sure that we don't show thumbnails more often than thumb_period
-        return max(thumb_duration, self.thumb_period)
+            thumb_duration += THUMB_PERIODS[0]
+        # make sure that we don't show thumbnails more often than the
+        # finest period
+        return max(thumb_duration, THUMB_PERIODS[0])
+
+    @staticmethod
+    def _get_level_period(thumb_duration):
+        """Gets the period of the thumbnails fitting the thumbnails spacing.
+
+        Args:
+            thumb_duration (int): The distance between the displayed thumbnails.
+
+        Returns:
+            int: The coarsest of THUMB_PERIODS with thumbnails at least as
+            close as `thumb_duration`.
+        """
+        for period in reversed(THUMB_PERIODS):
+            if period <= thumb_duration:
+                return period
+        return THUMB_PERIODS[0]
 
     def _update_thumbnails(self):
         """Updates the thumbnails for the currently visible clip portion."""
         if self.thumb_width is None:
             return False
 
-        thumbs = {}
-        self.wishlist = []
+        self.thumbs = {}
+        self._positions_by_source = {}
         thumb_duration = self._get_thumb_duration()
         element_left = quantize(self.ges_elem.props.in_point, thumb_duration)
         element_right = self.ges_elem.props.in_point + self.ges_elem.props.duration
-        for position in range(element_left, element_right, thumb_duration):
-            x = Zoomable.nsToPixel(position) - self.nsToPixel(self.ges_elem.props.in_point)
-            y = (self.props.height_request - self.thumb_height) / 2
-            try:
-                thumb = self.thumbs.pop(position)
-                self.move(thumb, x, y)
-            except KeyError:
-                thumb = Thumbnail(self.thumb_width, self.thumb_height)
-                self.put(thumb, x, y)
-
-            thumbs[position] = thumb
+        positions = range(element_left, element_right, thumb_duration)
+        # Each thumbnail shows the closest preceding thumbnail of the
+        # coarsest period it covers, so the finer periods are generated
+        # only for the regions the user zooms into.
+        level_period = self._get_level_period(thumb_duration)
+        self._level_period = level_period
+        sources = {position: quantize(position, level_period)
+                   for position in positions}
+        if self.__image_pixbuf:
+            pixbufs, missing = {}, set()
+        else:
+            pixbufs, missing = self.thumb_cache.get_many(
+                set(sources.values()), decoded_cb=self._thumbnail_decoded_cb)
+        for position in positions:
+            source = sources[position]
+            self._positions_by_source.setdefault(source, []).append(position)
             if self.__image_pixbuf:
                 # The thumbnail is fixed, probably it's an image clip.
-                thumb.set_from_pixbuf(self.__image_pixbuf)
-                thumb.set_visible(True)
-            elif position in self.thumb_cache:
-                pixbuf = self.thumb_cache[position]
-                thumb.set_from_pixbuf(pixbuf)
-                thumb.set_visible(True)
+                self.thumbs[position] = self.__image_pixbuf
             else:
-                self.wishlist.append(position)
-        for thumb in self.thumbs.values():
-            self.remove(thumb)
-        self.thumbs = thumbs
+                self.thumbs[position] = pixbufs.get(source)
+        self._positions = list(positions)
+
+        self.wishlist = list(missing)
+        self.__sort_wishlist()
+        self.queue_draw()
 
         return True
 
-    def _get_wish(self):
-        """Returns a wish that is also in the queue, if any."""
-        while True:
-            if not self.wishlist:
-                return None
-            wish = self.wishlist.pop(0)
-            if wish in self.queue:
-                return wish
+    def __sort_wishlist(self):
+        """Orders the wishlist by priority, see `PreviewsPrefetcher`."""
+        offset = self.ges_elem.props.start - self.ges_elem.props.in_point
+        self.wishlist.sort(
+            key=lambda position: Previewer.prefetcher.get_priority(position + offset))
+        self.generator.set_wishlist(self, self.wishlist, self._level_period)
 
-    def _set_pixbuf(self, position, pixbuf):
-        """Sets the pixbuf for the thumbnail at the specified position."""
-        if position in self.thumbs:
-            thumb = self.thumbs[position]
-        else:
-            # The pixbufs we get from gdkpixbufsink are not always
-            # exactly the ones requested, the reported position can differ.
-            # Try to find the closest thumbnail for the specified position.
-            sorted_times = sorted(self.thumbs.keys())
-            index = binary_search(sorted_times, position)
-            position = sorted_times[index]
-            thumb = self.thumbs[position]
-
-        thumb.set_from_pixbuf(pixbuf)
-        if position in self.queue:
-            self.queue.remove(position)
-        self.thumb_cache[position] = pixbuf
-        self.queue_draw()
+    def prefetch(self, start, end, direction):
+        if self.thumb_width is None or self.__image_pixbuf:
+            return
 
-    # Interface (Zoomable)
+        interval = self.get_asset_interval(start, end)
+        if not interval:
+            return
 
-    def zoomChanged(self):
-        self._update_thumbnails()
+        first = max(0, bisect.bisect_left(self._positions, interval[0]) - 1)
+        last = bisect.bisect_right(self._positions, interval[1])
+        sources = []
+        for position in self._positions[first:last]:
+            source = quantize(position, self._level_period)
+            if not sources or sources[-1] != source:
+                sources.append(source)
+        if direction < 0:
+            sources.reverse()
+
+        # Decode the thumbnails not in the memory cache anymore.
+        pixbufs, unused_missing = self.thumb_cache.get_many(
+            sources, decoded_cb=self._thumbnail_decoded_cb)
+        for source, pixbuf in pixbufs.items():
+            self._thumbnail_decoded_cb(source, pixbuf)
+        # Generate the missing ones first.
+        self.__sort_wishlist()
+
+    def cancel_prefetch(self):
+        if self.wishlist:
+            self.__sort_wishlist()
 
-    # Callbacks
+    # pylint: disable=arguments-differ
+    def do_draw(self, context):
+        if not self._positions:
+            return
 
-    def __bus_message_handler(self, unused_bus, message):
-        if message.type == Gst.MessageType.ELEMENT and \
-                message.src == self.gdkpixbufsink:
-            struct = message.get_structure()
-            struct_name = struct.get_name()
-            if struct_name == "preroll-pixbuf":
-                stream_time = struct.get_value("stream-time")
-                pixbuf = struct.get_value("pixbuf")
-                self._set_pixbuf(stream_time, pixbuf)
-        elif message.type == Gst.MessageType.ASYNC_DONE and \
-                message.src == self.pipeline:
-            self._checkCPU()
-        return Gst.BusSyncReply.PASS
+        clipped_rect = Gdk.cairo_get_clip_rectangle(context)[1]
+        inpoint_x = self.nsToPixel(self.ges_elem.props.in_point)
+        # The thumbnails overlapping the area being drawn.
+        first = max(0, bisect.bisect_right(
+            self._positions,
+            Zoomable.pixelToNs(inpoint_x + clipped_rect.x - self.thumb_width)) - 1)
+        last = bisect.bisect_right(
+            self._positions,
+            Zoomable.pixelToNs(inpoint_x + clipped_rect.x + clipped_rect.width))
+
+        y = (self.props.height_request - self.thumb_height) / 2
+        for position in self._positions[first:last]:
+            pixbuf = self.thumbs[position]
+            if not pixbuf:
+                continue
+            x = Zoomable.nsToPixel(position) - inpoint_x
+            # Center the pixbuf in the thumbnail area, as a Gtk.Image would.
+            x += max(0, (self.thumb_width - pixbuf.get_width()) / 2)
+            pixbuf_y = y + max(0, (self.thumb_height - pixbuf.get_height()) / 2)
+            Gdk.cairo_set_source_pixbuf(context, pixbuf, x, pixbuf_y)
+            context.rectangle(x, pixbuf_y, pixbuf.get_width(), pixbuf.get_height())
+            context.save()
+            context.clip()
+            context.paint_with_alpha(self._opacity)
+            context.restore()
+
+    # Interface (Zoomable)
 
-    # pylint: disable=no-self-use
-    def _autoplugSelectCb(self, unused_decode, unused_pad, unused_caps, factory):
-        # Don't plug audio decoders / parsers.
-        if "Audio" in factory.get_klass():
-            return True
-        return False
+    def zoomChanged(self):
+        self._update_thumbnails()
+
+    # Callbacks
+
+    def _thumbnail_cb(self, unused_generator, position, pixbuf):
+        if self.thumb_width is None:
+            # The first thumbnail of the asset.
+            self.thumb_width = pixbuf.get_width()
+            self._update_thumbnails()
+            return
+
+        self._thumbnail_decoded_cb(position, pixbuf)
+
+    def _thumbnail_decoded_cb(self, position, pixbuf):
+        positions = self._positions_by_source.get(position, [])
+        for thumb_position in positions:
+            self.thumbs[thumb_position] = pixbuf
+        if positions:
+            self.queue_draw()
 
     def _heightChangedCb(self, unused_widget, unused_param_spec):
         self._update_thumbnails()
@@ -662,59 +1792,229 @@ class VideoPreviewer(Previewer, Zoomable, Loggable):
         else:
             opacity = 1.0
 
-        for thumb in self.get_children():
-            thumb.props.opacity = opacity
-
-    def startGeneration(self):
-        self._setupPipeline()
-        self._startThumbnailingWhenIdle()
-
-    def stopGeneration(self):
-        if self._thumb_cb_id:
-            GLib.source_remove(self._thumb_cb_id)
-            self._thumb_cb_id = None
-
-        if self.pipeline:
-            self.pipeline.set_state(Gst.State.NULL)
-            self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
-            self.pipeline = None
-        self.emit("done")
+        self._opacity = opacity
+        self.queue_draw()
 
     def release(self):
         """Stops preview generation and cleans the object."""
-        self.stopGeneration()
+        Previewer.prefetcher.remove_client(self)
+        self.generator.disconnect_by_func(self._thumbnail_cb)
+        self.generator.remove_client(self)
+        # Ignore the thumbnails still being decoded.
+        self._positions_by_source = {}
         Zoomable.__del__(self)
 
 
-class Thumbnail(Gtk.Image):
-    """Simple widget representing a Thumbnail."""
+def choose_thumbnailing_mode(keyframes_distance, thumb_period, missing=None):
+    """Chooses the cheapest way to generate thumbnails for a video.
+
+    Args:
+        keyframes_distance (int): The distance between two keyframes, or None
+            if unknown.
+        thumb_period (int): The distance between two thumbnails.
+        missing (Optional[List[int]]): The positions of the thumbnails to be
+            generated, or None if all of them.
+
+    Returns:
+        str: The ThumbnailingMode to be used.
+    """
+    if not keyframes_distance or keyframes_distance <= thumb_period:
+        # Accurate seeks are cheap when most of the frames are keyframes.
+        return ThumbnailingMode.ACCURATE
+
+    if keyframes_distance <= 2 * thumb_period:
+        # The closest keyframe is never further than one thumbnail away.
+        return ThumbnailingMode.FAST
+
+    if missing is not None:
+        # Each accurate seek decodes half a GOP on average, while decoding
+        # sequentially decodes the whole span of the missing positions.
+        span = max(missing, default=0) - min(missing, default=0) + thumb_period
+        if len(missing) * keyframes_distance / 2 < span:
+            return ThumbnailingMode.ACCURATE
+
+    # Each accurate seek would decode half a GOP on average, more than
+    # decoding the whole file once.
+    return ThumbnailingMode.SEQUENTIAL
+
+
+def get_poster_position(duration):
+    """Gets the position of the thumbnail used as poster frame of an asset.
+
+    Args:
+        duration (int): The duration of the asset.
+
+    Returns:
+        int: The position of the thumbnail in the middle of the asset.
+    """
+    return quantize(duration // 2, THUMB_PERIODS[0])
+
+
+def encode_jpeg(pixbuf):
+    """Compresses the specified pixbuf.
+
+    Returns:
+        bytes: The JPEG data, or None if the compression failed.
+    """
+    success, jpeg = pixbuf.save_to_bufferv("jpeg", ["quality", None], ["90"])
+    if not success:
+        return None
+    return jpeg
+
+
+def decode_jpeg(jpeg):
+    """Decompresses the specified JPEG data.
+
+    Returns:
+        GdkPixbuf.Pixbuf: The pixbuf.
+    """
+    loader = GdkPixbuf.PixbufLoader.new()
+    # TODO: what do to if any of the following calls fails?
+    loader.write(jpeg)
+    loader.close()
+    return loader.get_pixbuf()
+
+
+class MemoryLRUCache(Loggable):
+    """LRU cache of objects holding memory, limited by a byte budget.
+
+    Attributes:
+        max_size (int): The maximum number of bytes taken by the values.
+        size (int): The number of bytes currently taken by the values.
+    """
+
+    def __init__(self, max_size, get_size):
+        """Initializes the cache.
+
+        Args:
+            max_size (int): The maximum number of bytes taken by the values.
+            get_size (function): Returns the number of bytes taken by
+                a value.
+        """
+        Loggable.__init__(self)
+        self.max_size = max_size
+        self.size = 0
+        self._get_size = get_size
+        self._values = OrderedDict()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key):
+        """Gets the value for the specified key, if any.
+
+        Returns:
+            object: The value or None if not in the cache.
+        """
+        value = self._values.get(key)
+        if value:
+            self._values.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """Adds or replaces the value for the specified key."""
+        self.remove(key)
+        self._values[key] = value
+        self.size += self._get_size(value)
+        self.__evict()
+
+    def remove(self, key):
+        """Removes the value for the specified key, if any."""
+        value = self._values.pop(key, None)
+        if value:
+            self.size -= self._get_size(value)
+
+    def remove_matching(self, predicate):
+        """Removes the values whose key satisfies the specified predicate."""
+        for key in [key for key in self._values if predicate(key)]:
+            self.remove(key)
+
+    def set_max_size(self, max_size):
+        """Sets the byte budget, evicting the least recently used values."""
+        self.max_size = max_size
+        self.__evict()
+
+    def __evict(self):
+        while self.size > self.max_size and self._values:
+            unused_key, value = self._values.popitem(last=False)
+            self.size -= self._get_size(value)
+
+
+class ThumbnailsMemoryCache(MemoryLRUCache):
+    """LRU cache of decoded thumbnails, shared by all the ThumbnailCaches.
+
+    The keys are (file hash, time) tuples identifying the thumbnails.
+    """
+
+    def __init__(self, max_size):
+        MemoryLRUCache.__init__(self, max_size,
+                                lambda pixbuf: pixbuf.get_byte_length())
+
 
-    def __init__(self, width, height):
-        Gtk.Image.__init__(self)
-        self.props.width_request = width
-        self.props.height_request = height
+class WaveformTilesCache(MemoryLRUCache):
+    """LRU cache of rendered waveform tiles, shared by all the AudioPreviewers.
+
+    The keys are (URI, zoom ratio, tile index, height) tuples identifying
+    the tiles.
+    """
+
+    def __init__(self, max_size):
+        MemoryLRUCache.__init__(
+            self, max_size,
+            lambda surface: surface.get_stride() * surface.get_height())
 
 
 class ThumbnailCache(Loggable):
     """Caches an asset's thumbnails by key, using LRU policy.
 
     Uses a two stage caching mechanism. A limited number of elements are
-    held in memory, the rest is being cached on disk in an SQLite db.
+    held in memory, the rest is being cached on disk in a `ThumbnailStore`,
+    by default an SQLite db per asset. The kind of store is set by
+    `storage`, see `ThumbnailStorage`.
+
+    The decoded thumbnails of all the assets are held in `memory_cache`,
+    so scrolling over the same region does not decode the same JPEG twice.
+
+    The thumbnails are not written to disk right away. They are kept in a
+    write-behind queue and written in a single transaction when the queue
+    gets big enough or after a while, see `flush`.
+
+    The thumbnails are compressed and decompressed in `codec_pool`, out of
+    the main loop.
+
+    The poster frame, the thumbnail representing the asset, is saved
+    separately when the thumbnails are committed, so it can be retrieved
+    without looking at the other thumbnails, see `get_posters`.
     """
 
     caches_by_uri = {}
 
+    memory_cache = ThumbnailsMemoryCache(
+        GlobalSettings.defaults["thumbnailsMemoryCacheSize"] * 1024 * 1024)
+
+    codec_pool = WorkerPool("thumbnails-codec", THUMBS_CODEC_WORKERS)
+
+    storage = ThumbnailStorage.SQLITE
+
     def __init__(self, uri):
         Loggable.__init__(self)
-        self._filehash = hash_file(Gst.uri_get_location(uri))
+        self._filehash = get_file_hash(Gst.uri_get_location(uri))
         self._filename = filename_from_uri(uri)
         thumbs_cache_dir = get_dir(os.path.join(xdg_cache_home(), "thumbs"))
-        self._dbfile = os.path.join(thumbs_cache_dir, self._filehash)
-        self._db = sqlite3.connect(self._dbfile)
-        self._cur = self._db.cursor()  # Use this for normal db operations
-        self._cur.execute("CREATE TABLE IF NOT EXISTS Thumbs\
-                          (Time INTEGER NOT NULL PRIMARY KEY,\
-                          Jpeg BLOB NOT NULL)")
+        self._store = create_thumbnail_store(self.storage, thumbs_cache_dir,
+                                             self._filehash)
+        Previewer.cache_manager.touch(self._filehash)
+
+        # The thumbnails waiting to be written to disk, by time.
+        self._pending = {}
+        # The JPEG data of the pending thumbnails already compressed, by time.
+        self._encoded = {}
+        # The positions of the thumbnails being decompressed.
+        self._decoding = set()
+        self._flush_source_id = 0
 
     @classmethod
     def get(cls, obj):
@@ -738,17 +2038,26 @@ class ThumbnailCache(Loggable):
             cls.caches_by_uri[uri] = ThumbnailCache(uri)
         return cls.caches_by_uri[uri]
 
+    def release(self):
+        """Saves the pending thumbnails and forgets `self`.
+
+        The users of `self` can continue using it, but `get` will create a
+        new ThumbnailCache for the same URI.
+        """
+        self.flush()
+        for uri, cache in list(self.caches_by_uri.items()):
+            if cache is self:
+                del self.caches_by_uri[uri]
+
     def copy(self, uri):
         """Copies `self` to the specified `uri`.
 
         Args:
             uri (str): The place where to copy/save the ThumbnailCache
         """
-        filehash = hash_file(Gst.uri_get_location(uri))
-        thumbs_cache_dir = get_dir(os.path.join(xdg_cache_home(), "thumbs"))
-        dbfile = os.path.join(thumbs_cache_dir, filehash)
-
-        os.symlink(self._dbfile, dbfile)
+        self.flush()
+        filehash = get_file_hash(Gst.uri_get_location(uri))
+        self._store.link(filehash)
 
     def getImagesSize(self):
         """Gets the image size.
@@ -756,63 +2065,307 @@ class ThumbnailCache(Loggable):
         Returns:
             List[int]: The width and height of the images in the cache.
         """
-        self._cur.execute("SELECT * FROM Thumbs LIMIT 1")
-        row = self._cur.fetchone()
-        if not row:
+        if self._pending:
+            pixbuf = next(iter(self._pending.values()))
+            return pixbuf.get_width(), pixbuf.get_height()
+
+        jpeg = self._store.get_any_jpeg()
+        if not jpeg:
             return None, None
 
-        pixbuf = self.__getPixbufFromRow(row)
+        pixbuf = decode_jpeg(jpeg)
         return pixbuf.get_width(), pixbuf.get_height()
 
-    def getPreviewThumbnail(self):
-        """Gets a thumbnail contained 'at the middle' of the cache."""
-        self._cur.execute("SELECT Time FROM Thumbs")
-        timestamps = self._cur.fetchall()
-        if not timestamps:
-            return None
+    def has_poster(self):
+        """Checks whether the poster frame of the asset has been saved."""
+        return self._store.get_poster_jpeg() is not None
 
-        return self[timestamps[int(len(timestamps) / 2)][0]]
+    def get_poster(self):
+        """Gets the poster frame of the asset.
 
-    # pylint: disable=no-self-use
-    def __getPixbufFromRow(self, row):
-        jpeg = row[1]
-        loader = GdkPixbuf.PixbufLoader.new()
-        # TODO: what do to if any of the following calls fails?
-        loader.write(jpeg)
-        loader.close()
-        pixbuf = loader.get_pixbuf()
+        Until the poster frame is saved, see `commit`, the thumbnail in the
+        middle of the existing ones is used instead.
+
+        Returns:
+            GdkPixbuf.Pixbuf: The thumbnail or None if there is none.
+        """
+        pixbuf = self.memory_cache.get((self._filehash, THUMBS_POSTER_KEY))
+        if pixbuf:
+            return pixbuf
+
+        jpeg = self._store.get_poster_jpeg()
+        if not jpeg:
+            positions = sorted(set(self._store.get_positions()) |
+                               set(self._pending.keys()))
+            if not positions:
+                return None
+            return self[positions[len(positions) // 2]]
+
+        pixbuf = decode_jpeg(jpeg)
+        self.memory_cache.set((self._filehash, THUMBS_POSTER_KEY), pixbuf)
         return pixbuf
 
+    def backfill_poster(self, duration):
+        """Saves the poster frame if the thumbnails have been saved without.
+
+        The previous versions did not save the poster frame, so the
+        existing thumbnail nearest to its position is used.
+
+        Args:
+            duration (int): The duration of the asset.
+
+        Returns:
+            bytes: The JPEG data of the poster frame, or None if there is
+            no thumbnail.
+        """
+        jpeg = self._store.get_poster_jpeg()
+        if jpeg:
+            return jpeg
+
+        positions = self._store.get_positions()
+        if not positions:
+            return None
+        poster_position = get_poster_position(duration)
+        position = min(positions,
+                       key=lambda position: abs(position - poster_position))
+        self.debug("Saving the thumbnail at %s as poster frame of: %s",
+                   position, self._filename)
+        return self.__save_poster(position)
+
+    def __save_poster(self, position):
+        """Saves the thumbnail at the specified position as poster frame.
+
+        Args:
+            position (int): The position of the poster frame, see
+                `get_poster_position`.
+
+        Returns:
+            bytes: The JPEG data of the poster frame, or None if there is
+            no thumbnail at the position.
+        """
+        jpeg = self._store.get_jpegs([position]).get(position)
+        if not jpeg:
+            self.debug("No thumbnail at %s for the poster frame of: %s",
+                       position, self._filename)
+            return None
+
+        if jpeg != self._store.get_poster_jpeg():
+            self._store.put_poster_jpeg(jpeg)
+            self.memory_cache.remove((self._filehash, THUMBS_POSTER_KEY))
+        return jpeg
+
+    @classmethod
+    def get_posters(cls, durations, callback):
+        """Gets the poster frames of the specified assets in a single call.
+
+        The poster frames are read in a batch and decoded in `codec_pool`.
+        The poster frames missing from the thumbnails saved by the previous
+        versions are saved first, see `backfill_poster`. The assets without
+        thumbnails are skipped.
+
+        Args:
+            durations (dict): The durations of the assets, by URI.
+            callback (function): The function called in the main loop with
+                the URI and the thumbnail of each poster frame.
+        """
+        filehashes = {}
+        for uri in durations:
+            filehash = get_file_hash(Gst.uri_get_location(uri))
+            pixbuf = cls.memory_cache.get((filehash, THUMBS_POSTER_KEY))
+            if pixbuf:
+                callback(uri, pixbuf)
+            else:
+                filehashes[filehash] = uri
+        if not filehashes:
+            return
+
+        thumbs_cache_dir = get_dir(os.path.join(xdg_cache_home(), "thumbs"))
+        jpegs = get_poster_jpegs(cls.storage, thumbs_cache_dir, filehashes)
+        for filehash in set(filehashes) - set(jpegs):
+            uri = filehashes[filehash]
+            jpeg = cls.get(uri).backfill_poster(durations[uri])
+            if jpeg:
+                jpegs[filehash] = jpeg
+        for filehash, jpeg in jpegs.items():
+            cls.codec_pool.submit(
+                decode_jpeg, jpeg,
+                callback=partial(cls.__poster_decoded_cb, filehash,
+                                 filehashes[filehash], callback))
+
+    @classmethod
+    def __poster_decoded_cb(cls, filehash, uri, callback, pixbuf):
+        cls.memory_cache.set((filehash, THUMBS_POSTER_KEY), pixbuf)
+        callback(uri, pixbuf)
+
     def __contains__(self, key):
-        # check if item is present in on disk cache
-        self._cur.execute("SELECT Time FROM Thumbs WHERE Time = ?", (key,))
-        if self._cur.fetchone():
+        if key in self._pending:
             return True
-        return False
+        # check if item is present in on disk cache
+        return bool(self._store.get_existing_positions(key, key + 1, 1))
 
     def __getitem__(self, key):
-        self._cur.execute("SELECT * FROM Thumbs WHERE Time = ?", (key,))
-        row = self._cur.fetchone()
-        if not row:
+        pixbuf = self._pending.get(key)
+        if pixbuf:
+            return pixbuf
+
+        pixbuf = self.memory_cache.get((self._filehash, key))
+        if pixbuf:
+            return pixbuf
+
+        jpeg = self._store.get_jpegs([key]).get(key)
+        if not jpeg:
             raise KeyError(key)
-        return self.__getPixbufFromRow(row)
+        pixbuf = decode_jpeg(jpeg)
+        self.memory_cache.set((self._filehash, key), pixbuf)
+        return pixbuf
+
+    def get_many(self, positions, decoded_cb=None):
+        """Gets the thumbnails for the specified positions.
+
+        The thumbnails not already decoded are retrieved with a single query.
+
+        Args:
+            positions (Iterable[int]): The positions of the thumbnails.
+            decoded_cb (Optional[function]): When specified, the thumbnails
+                not already decoded are decoded in `codec_pool` and passed
+                to this function in the main loop, with their position.
+
+        Returns:
+            (dict, set): The pixbufs by position and the missing positions.
+            The positions of the thumbnails being decoded are in neither.
+        """
+        pixbufs = {}
+        missing = set()
+        for position in positions:
+            pixbuf = self._pending.get(position)
+            if not pixbuf:
+                pixbuf = self.memory_cache.get((self._filehash, position))
+            if pixbuf:
+                pixbufs[position] = pixbuf
+            elif decoded_cb and position in self._decoding:
+                continue
+            else:
+                missing.add(position)
+
+        if not missing:
+            return pixbufs, missing
+
+        for position, jpeg in self._store.get_jpegs(missing).items():
+            missing.remove(position)
+            if decoded_cb:
+                self._decoding.add(position)
+                self.codec_pool.submit(
+                    decode_jpeg, jpeg,
+                    callback=partial(self.__jpeg_decoded_cb, position, decoded_cb))
+                continue
+
+            pixbuf = decode_jpeg(jpeg)
+            self.memory_cache.set((self._filehash, position), pixbuf)
+            pixbufs[position] = pixbuf
+
+        return pixbufs, missing
+
+    def __jpeg_decoded_cb(self, position, decoded_cb, pixbuf):
+        self._decoding.discard(position)
+        self.memory_cache.set((self._filehash, position), pixbuf)
+        decoded_cb(position, pixbuf)
+
+    def get_missing_positions(self, start, end, step):
+        """Gets the positions in the specified interval with no thumbnail.
+
+        Args:
+            start (int): The first position.
+            end (int): The end of the interval, excluded.
+            step (int): The distance between the positions.
+
+        Returns:
+            set: The positions with no thumbnail.
+        """
+        missing = set(range(start, end, step)) - set(self._pending.keys())
+        if not missing:
+            return missing
+
+        missing.difference_update(
+            self._store.get_existing_positions(start, end, step))
+        return missing
 
     def __setitem__(self, key, value):
-        success, jpeg = value.save_to_bufferv(
-            "jpeg", ["quality", None], ["90"])
-        if not success:
+        self._pending[key] = value
+        self._encoded.pop(key, None)
+        self.memory_cache.set((self._filehash, key), value)
+        self.codec_pool.submit(
+            encode_jpeg, value,
+            callback=partial(self.__jpeg_encoded_cb, key, value))
+
+    def __jpeg_encoded_cb(self, key, pixbuf, jpeg):
+        if self._pending.get(key) is not pixbuf:
+            # The thumbnail has been replaced or already written.
+            return
+
+        if jpeg is None:
             self.warning("JPEG compression failed")
+            del self._pending[key]
+            return
+
+        self._encoded[key] = jpeg
+        if len(self._encoded) >= THUMBS_WRITE_BATCH_SIZE:
+            self.__write_encoded()
+        elif not self._flush_source_id:
+            self._flush_source_id = GLib.timeout_add(
+                THUMBS_WRITE_INTERVAL_MS, self.__flush_timeout_cb,
+                priority=GLib.PRIORITY_LOW)
+
+    def __flush_timeout_cb(self):
+        self._flush_source_id = 0
+        self.__write_encoded()
+        return False
+
+    def __write_encoded(self):
+        """Writes the compressed thumbnails to the store in a single batch."""
+        if self._flush_source_id:
+            GLib.source_remove(self._flush_source_id)
+            self._flush_source_id = 0
+
+        if not self._encoded:
             return
-        blob = sqlite3.Binary(jpeg)
-        # Replace if a row with the same time already exists.
-        self._cur.execute("DELETE FROM Thumbs WHERE  time=?", (key,))
-        self._cur.execute("INSERT INTO Thumbs VALUES (?,?)", (key, blob,))
 
-    def commit(self):
-        """Saves the cache on disk (in the database)."""
+        rows = list(self._encoded.items())
+        for key in self._encoded:
+            del self._pending[key]
+        self._encoded = {}
+
+        self.log("Writing %d thumbnails for: %s", len(rows), self._filename)
+        self._store.put_jpegs(rows)
+
+    def flush(self):
+        """Writes all the pending thumbnails to disk.
+
+        The thumbnails not compressed yet are compressed in the main loop.
+        """
+        for key, pixbuf in list(self._pending.items()):
+            if key in self._encoded:
+                continue
+            jpeg = encode_jpeg(pixbuf)
+            if jpeg is None:
+                self.warning("JPEG compression failed")
+                del self._pending[key]
+                continue
+            self._encoded[key] = jpeg
+        self.__write_encoded()
+
+    def commit(self, poster_position=None):
+        """Saves the cache on disk (in the database).
+
+        Args:
+            poster_position (Optional[int]): The position of the thumbnail
+                to be saved as poster frame, see `get_poster_position`. The
+                poster frame is saved only if this thumbnail exists.
+        """
         self.debug(
             'Saving thumbnail cache file to disk for: %s', self._filename)
-        self._db.commit()
+        self.flush()
+        if poster_position is not None:
+            self.__save_poster(poster_position)
         self.log("Saved thumbnail cache file: %s" % self._filehash)
 
         return False
@@ -831,7 +2384,7 @@ class PipelineCpuAdapter(Loggable):
         self.pipeline = pipeline
         self.bus = self.pipeline.get_bus()
 
-        self.cpu_usage_tracker = CPUUsageTracker()
+        self._scheduler = BackgroundWorkScheduler.get_default()
         self.rate = 1.0
         self.done = False
         self.ready = False
@@ -843,12 +2396,14 @@ class PipelineCpuAdapter(Loggable):
 
         This avoid using too much CPU.
         """
+        self._scheduler.add_producer(self, WAVEFORMS_CPU_USAGE)
         GLib.timeout_add(200, self._modulateRate)
         self._bus_cb_id = self.bus.connect("message", self._messageCb)
         self.done = False
 
     def stop(self):
         """Stops modulating the rate on the controlled pipeline."""
+        self._scheduler.remove_producer(self)
         if self._bus_cb_id is not None:
             self.bus.disconnect(self._bus_cb_id)
             self._bus_cb_id = None
@@ -860,10 +2415,8 @@ class PipelineCpuAdapter(Loggable):
         if self.done:
             return False
 
-        usage_percent = self.cpu_usage_tracker.usage()
-        self.cpu_usage_tracker.reset()
-        if usage_percent >= WAVEFORMS_CPU_USAGE:
-            if self.rate < 0.1:
+        if not self._scheduler.allows(self):
+            if self.rate < 0.1 or self._scheduler.paused:
                 if not self.ready:
                     res, position = self.pipeline.query_position(
                         Gst.Format.TIME)
@@ -922,17 +2475,221 @@ class PipelineCpuAdapter(Loggable):
 
 
 def get_wavefile_location_for_uri(uri):
-    """Computes the URI where the pickled wave file should be stored."""
-    filename = hash_file(Gst.uri_get_location(uri)) + ".wave"
+    """Computes the path where the waveform samples should be stored."""
+    filename = get_file_hash(Gst.uri_get_location(uri)) + ".npy"
     cache_dir = get_dir(os.path.join(xdg_cache_home(), "waves"))
 
     return os.path.join(cache_dir, filename)
 
 
+def get_peaks_file_location(wavefile):
+    """Computes the path of the peaks pyramid of the specified wave file."""
+    return os.path.splitext(wavefile)[0] + ".peaks.npy"
+
+
+def compute_peaks_pyramid(samples):
+    """Computes the levels of the peaks pyramid of the specified samples.
+
+    Each level has half the resolution of the previous one, the first level
+    having half the resolution of the samples. The last level has a single
+    value. The samples being amplitudes, the waveform is drawn from the
+    bottom up to their max, so their min is not kept.
+
+    Args:
+        samples (numpy.ndarray): The samples of the waveform.
+
+    Returns:
+        List[numpy.ndarray]: The maxs of each level.
+    """
+    level = numpy.asarray(samples)
+    levels = []
+    while len(level) > 1:
+        if len(level) % 2:
+            level = numpy.concatenate((level, level[-1:]))
+        level = level.reshape(-1, 2).max(axis=1)
+        levels.append(level)
+    return levels
+
+
+def choose_peaks_level(samples_count, width):
+    """Chooses the pyramid level with one or two values per pixel.
+
+    Args:
+        samples_count (int): The number of samples to draw.
+        width (int): The number of pixels where they are drawn.
+
+    Returns:
+        int: The level, 0 being the samples themselves.
+    """
+    if width <= 0:
+        return 0
+    return max(0, int(samples_count / width).bit_length() - 1)
+
+
+class WaveformCache:
+    """Registry of the waveforms, shared by the clips of the same asset.
+
+    The samples are saved as float32 numpy arrays and memory-mapped, so
+    the clips of an asset share one read-only mapping backed by the page
+    cache. Next to the samples is saved a pyramid of their peaks, see
+    `get_peaks`.
+    """
+
+    samples_by_uri = {}
+
+    peaks_by_uri = {}
+
+    @classmethod
+    def get(cls, uri):
+        """Gets the samples of the waveform of the specified asset.
+
+        Args:
+            uri (str): The URI of the asset.
+
+        Returns:
+            numpy.ndarray: The read-only samples, or None if not generated.
+        """
+        samples = cls.samples_by_uri.get(uri)
+        if samples is not None:
+            return samples
+
+        wavefile = get_wavefile_location_for_uri(uri)
+        if not os.path.exists(wavefile):
+            if not cls.__migrate_pickle(uri, wavefile):
+                return None
+
+        try:
+            samples = numpy.load(wavefile, mmap_mode="r")
+        except ValueError:
+            # An empty array cannot be mapped.
+            samples = numpy.load(wavefile)
+        cls.samples_by_uri[uri] = samples
+        return samples
+
+    @classmethod
+    def save(cls, uri, samples):
+        """Saves the samples of the waveform of the specified asset.
+
+        Args:
+            uri (str): The URI of the asset.
+            samples (numpy.ndarray): The samples.
+        """
+        wavefile = get_wavefile_location_for_uri(uri)
+        samples = numpy.asarray(samples, dtype=numpy.float32)
+        cls.__save_peaks(wavefile, samples)
+        cls.__save_array(wavefile, samples)
+        cls.forget(uri)
+
+    @classmethod
+    def forget(cls, uri):
+        """Forgets the waveform of the specified asset held in memory."""
+        cls.samples_by_uri.pop(uri, None)
+        cls.peaks_by_uri.pop(uri, None)
+
+    @classmethod
+    def get_peaks(cls, uri):
+        """Gets the peaks pyramid of the waveform of the specified asset.
+
+        Args:
+            uri (str): The URI of the asset.
+
+        Returns:
+            List[numpy.ndarray]: The maxs of each level, the level 0 being
+            the samples themselves, or None if the waveform has not been
+            generated.
+        """
+        peaks = cls.peaks_by_uri.get(uri)
+        if peaks is not None:
+            return peaks
+
+        samples = cls.get(uri)
+        if samples is None:
+            return None
+
+        wavefile = get_wavefile_location_for_uri(uri)
+        peaks_file = get_peaks_file_location(wavefile)
+        pyramid = None
+        if os.path.exists(peaks_file):
+            pyramid = cls.__load_array(peaks_file)
+        if pyramid is None or pyramid.ndim != 1:
+            # Saved by a previous version, missing or with the mins.
+            cls.__save_peaks(wavefile, samples)
+            pyramid = cls.__load_array(peaks_file)
+
+        peaks = [samples]
+        offset = 0
+        length = len(samples)
+        while length > 1:
+            length = (length + 1) // 2
+            peaks.append(pyramid[offset:offset + length])
+            offset += length
+        cls.peaks_by_uri[uri] = peaks
+        return peaks
+
+    @staticmethod
+    def __load_array(path):
+        try:
+            return numpy.load(path, mmap_mode="r")
+        except ValueError:
+            # An empty array cannot be mapped.
+            return numpy.load(path)
+
+    @staticmethod
+    def __save_array(path, array):
+        with open(path + ".tmp", "wb") as tmp_file:
+            numpy.save(tmp_file, array)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def __save_peaks(cls, wavefile, samples):
+        levels = compute_peaks_pyramid(samples)
+        if levels:
+            pyramid = numpy.concatenate(levels)
+        else:
+            pyramid = numpy.zeros(0, dtype=numpy.float32)
+        cls.__save_array(get_peaks_file_location(wavefile), pyramid)
+
+    @classmethod
+    def __migrate_pickle(cls, uri, wavefile):
+        """Converts the waveform pickled by the previous versions, if any."""
+        pickled_wavefile = os.path.splitext(wavefile)[0] + ".wave"
+        if not os.path.exists(pickled_wavefile):
+            return False
+
+        with open(pickled_wavefile, "rb") as samples:
+            cls.save(uri, pickle.load(samples))
+        os.remove(pickled_wavefile)
+        return True
+
+
 class AudioPreviewer(Previewer, Zoomable, Loggable):
-    """Audio previewer using the results from the "level" GStreamer element."""
+    """Audio previewer using the results from the "level" GStreamer element.
+
+    The waveform is drawn with tiles of WAVEFORM_TILE_WIDTH pixels, aligned
+    with the start of the asset so the clips of the same asset share them.
+    The tiles next to the visible ones are rendered ahead when idle.
+
+    In offline mode, the waveform is extracted as fast as the audio can be
+    decoded, under the WAVEFORMS_CPU_USAGE budget. Otherwise it's extracted
+    while playing the audio, slowed down when using too much CPU.
+
+    Attributes:
+        tiles_cache (WaveformTilesCache): The rendered tiles of all the
+            previewers.
+        offline (bool): Whether the waveforms are extracted offline.
 
-    __gsignals__ = PREVIEW_GENERATOR_SIGNALS
+    Signals:
+        progress: The waveform extraction progressed. The argument is the
+            fraction of the asset processed, between 0 and 1.
+    """
+
+    __gsignals__ = dict(PREVIEW_GENERATOR_SIGNALS, progress=(
+        GObject.SIGNAL_RUN_LAST, None, (float,)))
+
+    offline = GlobalSettings.defaults["waveformsOffline"]
+
+    tiles_cache = WaveformTilesCache(
+        GlobalSettings.defaults["waveformTilesMemorySize"] * 1024 * 1024)
 
     def __init__(self, ges_elem):
         Previewer.__init__(self, GES.TrackType.AUDIO)
@@ -950,9 +2707,6 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
         self.n_samples = asset.get_duration() / SAMPLE_DURATION
         self.samples = None
         self.peaks = None
-        self._start = 0
-        self._end = 0
-        self._surface_x = 0
 
         # Guard against malformed URIs
         self.wavefile = None
@@ -960,18 +2714,24 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
 
         self._num_failures = 0
         self.adapter = None
-        self.surface = None
+        self.throttler = None
+        self._progress_source_id = 0
 
-        self._force_redraw = True
+        # The tiles to be rendered ahead, as (index, height) tuples.
+        self._tiles_to_prerender = []
+        # The tiles to be scrolled into view, as (index, height) tuples.
+        self._tiles_to_prefetch = []
+        self._prerender_source_id = 0
+        Previewer.prefetcher.add_client(self)
 
         self.ges_elem.connect("notify::in-point", self._inpoint_changed_cb)
         self.connect("notify::height-request", self._height_changed_cb)
 
     def _inpoint_changed_cb(self, unused_b_element, unused_value):
-        self._force_redraw = True
+        self.queue_draw()
 
     def _height_changed_cb(self, unused_widget, unused_param_spec):
-        self._force_redraw = True
+        self.queue_draw()
 
     def startLevelsDiscoveryWhenIdle(self):
         """Starts processing waveform (whenever possible)."""
@@ -982,9 +2742,10 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
     def _startLevelsDiscovery(self):
         filename = get_wavefile_location_for_uri(self._uri)
 
-        if os.path.exists(filename):
-            with open(filename, "rb") as samples:
-                self.samples = pickle.load(samples)
+        Previewer.cache_manager.touch(get_filehash(os.path.basename(filename)))
+        self.samples = WaveformCache.get(self._uri)
+        if self.samples is not None:
+            self.peaks = WaveformCache.get_peaks(self._uri) or [self.samples]
             self._startRendering()
         else:
             self.wavefile = filename
@@ -997,7 +2758,7 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
                                          self._uri + " ! waveformbin name=wave"
                                          " ! fakesink qos=false name=faked")
         faked = self.pipeline.get_by_name("faked")
-        faked.props.sync = True
+        faked.props.sync = not self.offline
         self._wavebin = self.pipeline.get_by_name("wave")
         asset = self.ges_elem.get_parent().get_asset()
         self._wavebin.props.uri = asset.get_id()
@@ -1010,14 +2771,19 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
         asset = self.ges_elem.get_parent().get_asset()
         self.n_samples = asset.get_duration() / SAMPLE_DURATION
         bus.connect("message", self._busMessageCb)
+        if self.offline:
+            self.throttler = PipelineCpuThrottler(self.pipeline,
+                                                  WAVEFORMS_CPU_USAGE)
         self.becomeControlled()
 
     def zoomChanged(self):
-        self._force_redraw = True
+        self.queue_draw()
 
     def _prepareSamples(self):
         self._wavebin.finalize()
         self.samples = self._wavebin.samples
+        self.peaks = WaveformCache.get_peaks(self._wavebin.uri) or \
+            [self.samples]
 
     def _startRendering(self):
         self.n_samples = len(self.samples)
@@ -1030,6 +2796,7 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
             self._prepareSamples()
             self._startRendering()
             self.stopGeneration()
+            self.emit("progress", 1.0)
 
         elif message.type == Gst.MessageType.ERROR:
             if self.adapter:
@@ -1066,7 +2833,8 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
                                        -1)
 
                 # In case we failed previously, we won't modulate next time
-                elif not self.adapter and prev == Gst.State.PAUSED and \
+                elif not self.adapter and not self.offline and \
+                        prev == Gst.State.PAUSED and \
                         new == Gst.State.PLAYING and self._num_failures == 0:
                     self.adapter = PipelineCpuAdapter(self.pipeline)
                     self.adapter.start()
@@ -1078,12 +2846,74 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
             return True
         return False
 
-    def _get_num_inpoint_samples(self):
-        if self.ges_elem.props.in_point:
-            asset_duration = self.ges_elem.get_asset().get_filesource_asset().get_duration()
-            return int(self.n_samples / (float(asset_duration) / float(self.ges_elem.props.in_point)))
+    def __get_tile(self, index, height):
+        """Gets the rendered tile at the specified index, rendering it if needed.
 
-        return 0
+        Args:
+            index (int): The index of the tile, the first tile being at the
+                start of the asset.
+            height (int): The height of the tile.
+
+        Returns:
+            cairo.ImageSurface: The tile, or None if beyond the waveform.
+        """
+        key = (self._uri, Zoomable.zoomratio, index, height)
+        surface = self.tiles_cache.get(key)
+        if surface:
+            return surface
+
+        tile_x = index * WAVEFORM_TILE_WIDTH
+        start = int(self.pixelToNs(tile_x) / SAMPLE_DURATION)
+        end = min(len(self.samples),
+                  int(self.pixelToNs(tile_x + WAVEFORM_TILE_WIDTH) / SAMPLE_DURATION))
+        if start >= end:
+            return None
+
+        width = min(WAVEFORM_TILE_WIDTH,
+                    max(1, self.nsToPixel(end * SAMPLE_DURATION) - tile_x))
+        # Draw the peaks of the level having about one value per pixel.
+        level = min(choose_peaks_level(end - start, width), len(self.peaks) - 1)
+        values = self.peaks[level][start >> level:((end - 1) >> level) + 1]
+        surface = renderer.fill_surface_from_buffer(values, width, height)
+        self.tiles_cache.set(key, surface)
+        return surface
+
+    def __prerender_tiles_cb(self):
+        for tiles in (self._tiles_to_prerender, self._tiles_to_prefetch):
+            while tiles:
+                index, height = tiles.pop(0)
+                if (self._uri, Zoomable.zoomratio, index, height) not in self.tiles_cache:
+                    self.__get_tile(index, height)
+                    # Render a single tile per idle iteration.
+                    return True
+
+        self._prerender_source_id = 0
+        return False
+
+    def __schedule_prerender(self):
+        if not self._prerender_source_id:
+            self._prerender_source_id = GLib.idle_add(
+                self.__prerender_tiles_cb, priority=GLib.PRIORITY_LOW)
+
+    def prefetch(self, start, end, direction):
+        if not self.discovered:
+            return
+
+        interval = self.get_asset_interval(start, end)
+        if not interval:
+            return
+
+        height = int(self.get_parent().get_allocation().height)
+        first_index = self.nsToPixel(interval[0]) // WAVEFORM_TILE_WIDTH
+        last_index = (self.nsToPixel(interval[1]) - 1) // WAVEFORM_TILE_WIDTH
+        indexes = range(first_index, last_index + 1)
+        if direction < 0:
+            indexes = reversed(indexes)
+        self._tiles_to_prefetch = [(index, height) for index in indexes]
+        self.__schedule_prerender()
+
+    def cancel_prefetch(self):
+        self._tiles_to_prefetch = []
 
     # pylint: disable=arguments-differ
     def do_draw(self, context):
@@ -1091,42 +2921,60 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
             return
 
         clipped_rect = Gdk.cairo_get_clip_rectangle(context)[1]
-
-        num_inpoint_samples = self._get_num_inpoint_samples()
-        drawn_start = self.pixelToNs(clipped_rect.x)
-        drawn_duration = self.pixelToNs(clipped_rect.width)
-        start = int(drawn_start / SAMPLE_DURATION) + num_inpoint_samples
-        end = int((drawn_start + drawn_duration) / SAMPLE_DURATION) + num_inpoint_samples
-
-        if self._force_redraw or self._surface_x > clipped_rect.x or self._end < end:
-            self._start = start
-            end = int(min(self.n_samples, end + (self.pixelToNs(MARGIN) /
-                                                 SAMPLE_DURATION)))
-            self._end = end
-            self._surface_x = clipped_rect.x
-            surface_width = min(self.props.width_request - clipped_rect.x,
-                                clipped_rect.width + MARGIN)
-            surface_height = int(self.get_parent().get_allocation().height)
-            self.surface = renderer.fill_surface(self.samples[start:end],
-                                                 surface_width,
-                                                 surface_height)
-
-            self._force_redraw = False
+        height = int(self.get_parent().get_allocation().height)
+        # The position of the previewer relative to the start of the asset.
+        inpoint_x = self.nsToPixel(self.ges_elem.props.in_point)
+        first_index = (inpoint_x + clipped_rect.x) // WAVEFORM_TILE_WIDTH
+        last_index = (inpoint_x + clipped_rect.x + clipped_rect.width - 1) // \
+            WAVEFORM_TILE_WIDTH
 
         context.set_operator(cairo.OPERATOR_OVER)
-        context.set_source_surface(self.surface, self._surface_x, 0)
-        context.paint()
+        for index in range(first_index, last_index + 1):
+            surface = self.__get_tile(index, height)
+            if not surface:
+                break
+            x = index * WAVEFORM_TILE_WIDTH - inpoint_x
+            context.set_source_surface(surface, x, 0)
+            context.rectangle(x, 0, surface.get_width(), height)
+            context.fill()
+
+        # Get ready for scrolling.
+        self._tiles_to_prerender = [(last_index + 1, height)]
+        if first_index > 0:
+            self._tiles_to_prerender.append((first_index - 1, height))
+        self.__schedule_prerender()
+
+    def __update_progress_cb(self):
+        res, position = self.pipeline.query_position(Gst.Format.TIME)
+        if res and self.n_samples:
+            self.emit("progress",
+                      min(1.0, position / (self.n_samples * SAMPLE_DURATION)))
+        return True
 
     def startGeneration(self):
         self.pipeline.set_state(Gst.State.PLAYING)
         if self.adapter is not None:
             self.adapter.start()
+        if self.throttler is not None:
+            self.throttler.start()
+        if not self._progress_source_id:
+            self._progress_source_id = GLib.timeout_add(
+                WAVEFORMS_PROGRESS_INTERVAL_MS, self.__update_progress_cb,
+                priority=GLib.PRIORITY_LOW)
 
     def stopGeneration(self):
+        if self._progress_source_id:
+            GLib.source_remove(self._progress_source_id)
+            self._progress_source_id = 0
+
         if self.adapter is not None:
             self.adapter.stop()
             self.adapter = None
 
+        if self.throttler is not None:
+            self.throttler.stop()
+            self.throttler = None
+
         if self.pipeline:
             self.pipeline.set_state(Gst.State.NULL)
             self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
@@ -1135,5 +2983,30 @@ class AudioPreviewer(Previewer, Zoomable, Loggable):
 
     def release(self):
         """Stops preview generation and cleans the object."""
+        Previewer.prefetcher.remove_client(self)
+        if self._prerender_source_id:
+            GLib.source_remove(self._prerender_source_id)
+            self._prerender_source_id = 0
         self.stopGeneration()
         Zoomable.__del__(self)
+
+
+def forget_file_previews(path):
+    """Forgets the previews of the specified file held in memory.
+
+    Meant to be called when the file has been modified, so the previews
+    are retrieved again using the new hash of the file.
+
+    Args:
+        path (str): The path of the file.
+    """
+    uris = set(ThumbnailCache.caches_by_uri)
+    uris.update(WaveformCache.samples_by_uri, WaveformCache.peaks_by_uri)
+    uris = {uri for uri in uris if Gst.uri_get_location(uri) == path}
+    for uri in uris:
+        cache = ThumbnailCache.caches_by_uri.get(uri)
+        if cache:
+            cache.release()
+        WaveformCache.forget(uri)
+    AudioPreviewer.tiles_cache.remove_matching(
+        lambda key: Gst.uri_get_location(key[0]) == path)
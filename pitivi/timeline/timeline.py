@@ -38,6 +38,7 @@ from pitivi.timeline.elements import TrimHandle
 from pitivi.timeline.layer import Layer
 from pitivi.timeline.layer import LayerControls
 from pitivi.timeline.layer import SpacedSeparator
+from pitivi.timeline.previewers import Previewer
 from pitivi.timeline.ruler import ScaleRuler
 from pitivi.undo.timeline import CommitTimelineFinalizingAction
 from pitivi.utils.loggable import Loggable
@@ -373,6 +374,8 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
 
         self.__last_position = 0
         self._scrubbing = False
+        self.hadj.connect("value-changed", self.__hadj_changed_cb)
+        self.hadj.connect("changed", self.__hadj_changed_cb)
         self._scrolling = False
 
         # Clip selection.
@@ -1031,6 +1034,20 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         self.zoomed_fitted = False
 
         self.updatePosition()
+        self.__update_previewers_viewport()
+
+    def __hadj_changed_cb(self, unused_hadj):
+        self.__update_previewers_viewport()
+
+    def __update_previewers_viewport(self):
+        """Lets the previewers in view and ahead be generated first."""
+        start = self.hadj.get_value()
+        end = start + self.hadj.get_page_size()
+        Previewer.manager.set_viewport(self.pixelToNs(start),
+                                       self.pixelToNs(end),
+                                       self.__last_position)
+        Previewer.prefetcher.set_viewport(self.pixelToNs(start),
+                                          self.pixelToNs(end))
 
     def set_best_zoom_ratio(self, allow_zoom_in=False):
         """Sets the zoom level so that the entire timeline is in view."""
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+"""Analysis of the imported assets, decoding them once for all analyzers."""
+import time
+
+from gi.repository import GObject
+from gi.repository import Gst
+
+from pitivi.settings import GlobalSettings
+from pitivi.utils import loggable
+from pitivi.utils.loggable import Loggable
+from pitivi.utils.scheduler import PipelineCpuThrottler
+
+GlobalSettings.addConfigOption("analyzeOnImport",
+                               section="previews",
+                               key="analyze-on-import",
+                               default=True)
+
+# The CPU usage allowed to the analysis of the imported assets.
+ANALYSIS_CPU_USAGE = 30
+
+# The factory names of the analyzers run by AnalysisPipeline.
+ANALYZERS = []
+
+
+def register_analyzer(factory_name):
+    """Registers an analyzer to be run by `AnalysisPipeline`.
+
+    An analyzer is a Gst.Bin having a sink pad and optionally a src pad,
+    with a `media_type` attribute, "audio" or "video", an `is_cached()`
+    method checking whether the analysis has been done already, and a
+    `finalize()` method saving the results.
+
+    Args:
+        factory_name (str): The name of the factory of the analyzer. The
+            "uri" and "duration" properties of the element, if any, are set
+            to the ones of the analyzed asset.
+    """
+    if factory_name not in ANALYZERS:
+        ANALYZERS.append(factory_name)
+
+
+def get_thread_cpu_time():
+    """Gets the CPU time used by the calling thread, in seconds."""
+    return time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID)
+
+
+class AnalyzerTiming(Loggable):
+    """Measures the CPU time an analyzer spends processing its stream.
+
+    Each analyzer runs in the streaming thread of its own queue, so the CPU
+    time of the thread between the first event and the EOS received by the
+    analyzer is the time spent in its elements. A single probe on the sink
+    pad of the analyzer records the thread CPU time, and only for the
+    events, so the buffers do not call back into Python.
+
+    Attributes:
+        seconds (float): The CPU time spent so far.
+    """
+
+    def __init__(self, analyzer):
+        Loggable.__init__(self)
+        self.seconds = 0.0
+        self._start_time = None
+        analyzer.get_static_pad("sink").add_probe(
+            Gst.PadProbeType.EVENT_DOWNSTREAM, self.__event_cb)
+
+    def __event_cb(self, unused_pad, info):
+        now = get_thread_cpu_time()
+        event_type = info.get_event().type
+        if event_type == Gst.EventType.STREAM_START:
+            self._start_time = now
+        elif event_type == Gst.EventType.EOS and self._start_time is not None:
+            self.seconds += now - self._start_time
+            self._start_time = None
+        return Gst.PadProbeReturn.OK
+
+
+# pylint: disable=too-many-instance-attributes
+class AnalysisPipeline(GObject.Object, Loggable):
+    """Pipeline decoding an asset once for all the registered analyzers.
+
+    Each decoded stream is teed to the analyzers of its media type, see
+    `register_analyzer`. The analyzers whose results are cached already
+    are not used. The pipeline runs as fast as it can, under the
+    ANALYSIS_CPU_USAGE budget.
+
+    Attributes:
+        asset (GES.UriClipAsset): The analyzed asset.
+        analyzers (List[Gst.Bin]): The analyzers of the asset.
+        timed (bool): Whether to measure how much each analyzer takes,
+            see `get_timings`. By default, only when the timings are logged.
+    """
+
+    __gsignals__ = {
+        "done": (GObject.SIGNAL_RUN_LAST, None, ()),
+        "error": (GObject.SIGNAL_RUN_LAST, None, ()),
+    }
+
+    def __init__(self, asset, timed=None):
+        GObject.Object.__init__(self)
+        Loggable.__init__(self)
+        self.asset = asset
+        if timed is None:
+            timed = loggable.getCategoryLevel(self.logCategory) >= loggable.INFO
+        self.timed = timed
+        self.analyzers = []
+        self.pipeline = None
+        self.throttler = None
+        self._timings = {}
+        self._start_time = 0
+
+    def __make_analyzers(self):
+        uri = self.asset.get_id()
+        info = self.asset.get_info()
+        media_types = set()
+        if info.get_audio_streams():
+            media_types.add("audio")
+        if info.get_video_streams() and not self.asset.is_image():
+            media_types.add("video")
+
+        analyzers = []
+        for factory_name in ANALYZERS:
+            analyzer = Gst.ElementFactory.make(factory_name)
+            if analyzer.media_type not in media_types:
+                continue
+            if analyzer.find_property("uri"):
+                analyzer.props.uri = uri
+            if analyzer.find_property("duration"):
+                analyzer.props.duration = self.asset.get_duration()
+            if analyzer.is_cached():
+                self.log("%s cached already for %s", factory_name, uri)
+                continue
+            analyzers.append(analyzer)
+        return analyzers
+
+    def start(self):
+        """Starts analyzing the asset.
+
+        Returns:
+            bool: False if there is nothing to analyze.
+        """
+        self.analyzers = self.__make_analyzers()
+        if not self.analyzers:
+            return False
+
+        self.debug("Analyzing %s with %s", self.asset.get_id(),
+                   [analyzer.get_factory().get_name() for analyzer in self.analyzers])
+        if self.timed:
+            self._timings = {analyzer: AnalyzerTiming(analyzer)
+                             for analyzer in self.analyzers}
+        self.pipeline = Gst.Pipeline.new("analysis")
+        decode = Gst.ElementFactory.make("uridecodebin")
+        decode.props.uri = self.asset.get_id()
+        decode.connect("pad-added", self._pad_added_cb)
+        decode.connect("autoplug-select", self._autoplug_select_cb)
+        self.pipeline.add(decode)
+
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self._bus_message_cb)
+
+        self.throttler = PipelineCpuThrottler(self.pipeline, ANALYSIS_CPU_USAGE)
+        self._start_time = time.monotonic()
+        self.pipeline.set_state(Gst.State.PLAYING)
+        self.throttler.start()
+        return True
+
+    def stop(self):
+        """Stops analyzing the asset, without saving the results."""
+        if self.throttler:
+            self.throttler.stop()
+            self.throttler = None
+        if self.pipeline:
+            self.pipeline.get_bus().remove_signal_watch()
+            self.pipeline.set_state(Gst.State.NULL)
+            self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+            self.pipeline = None
+
+    @staticmethod
+    def __get_media_type(caps):
+        name = caps.get_structure(0).get_name()
+        for media_type in ("audio", "video"):
+            if name == media_type + "/x-raw":
+                return media_type
+        return None
+
+    def _autoplug_select_cb(self, unused_decode, unused_pad, unused_caps, factory):
+        # Don't plug the decoders of the streams which are not analyzed.
+        for media_type in ("Audio", "Video"):
+            if media_type in factory.get_klass() and \
+                    not any(analyzer.media_type == media_type.lower()
+                            for analyzer in self.analyzers):
+                return True
+        return False
+
+    def __make_sink(self):
+        sink = Gst.ElementFactory.make("fakesink")
+        sink.props.sync = False
+        sink.props.qos = False
+        self.pipeline.add(sink)
+        return sink
+
+    def _pad_added_cb(self, unused_decode, pad):
+        media_type = self.__get_media_type(pad.query_caps(None))
+        analyzers = [analyzer for analyzer in self.analyzers
+                     if analyzer.media_type == media_type and not analyzer.get_parent()]
+        if not analyzers:
+            sink = self.__make_sink()
+            sink.sync_state_with_parent()
+            pad.link(sink.get_static_pad("sink"))
+            return
+
+        tee = Gst.ElementFactory.make("tee")
+        tee.props.allow_not_linked = True
+        self.pipeline.add(tee)
+        elements = [tee]
+        for analyzer in analyzers:
+            # The queue makes each analyzer run in its own thread.
+            queue = Gst.ElementFactory.make("queue")
+            self.pipeline.add(queue)
+            self.pipeline.add(analyzer)
+            tee.link(queue)
+            queue.link(analyzer)
+            elements.extend((queue, analyzer))
+            if analyzer.get_static_pad("src"):
+                sink = self.__make_sink()
+                analyzer.link(sink)
+                elements.append(sink)
+
+        for element in elements:
+            element.sync_state_with_parent()
+        pad.link(tee.get_static_pad("sink"))
+
+    def _bus_message_cb(self, unused_bus, message):
+        if message.type == Gst.MessageType.EOS:
+            for analyzer in self.analyzers:
+                analyzer.finalize()
+            if self.timed:
+                self.__log_timings()
+            self.stop()
+            self.emit("done")
+        elif message.type == Gst.MessageType.ERROR:
+            self.warning("Could not analyze %s: %s", self.asset.get_id(),
+                         message.parse_error())
+            self.stop()
+            self.emit("error")
+
+    def get_timings(self):
+        """Gets how much each analyzer took, if `timed`.
+
+        Returns:
+            dict: The CPU time in seconds, by factory name.
+        """
+        return {analyzer.get_factory().get_name(): timing.seconds
+                for analyzer, timing in self._timings.items()}
+
+    def __log_timings(self):
+        self.info("Analyzed %s in %.3fs", self.asset.get_id(),
+                  time.monotonic() - self._start_time)
+        for factory_name, seconds in self.get_timings().items():
+            self.info("  %s: %.3fs", factory_name, seconds)
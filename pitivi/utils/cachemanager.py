@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+"""Management of the disk space used by the cached previews."""
+import json
+import os
+import time
+
+from gi.repository import GLib
+
+from pitivi.settings import xdg_cache_home
+from pitivi.utils.loggable import Loggable
+from pitivi.utils.threads import WorkerPool
+from pitivi.utils.thumbstore import is_filehash
+from pitivi.utils.thumbstore import SQLiteThumbnailStore
+from pitivi.utils.thumbstore import ThumbnailPack
+from pitivi.utils.thumbstore import THUMBS_PACK_FILENAME
+
+# The dirs in the cache dir containing previews of the assets.
+PREVIEWS_CACHE_DIRS = ("thumbs", "waves")
+# The name of the file where the last access times are saved.
+PREVIEWS_ACCESS_TIMES_FILENAME = "previews-access.json"
+# How often the quota is enforced while running.
+PREVIEWS_CACHE_CHECK_INTERVAL_S = 10 * 60
+
+
+def get_filehash(filename):
+    """Gets the hash of the asset file of the specified preview file.
+
+    Args:
+        filename (str): The name of a file in one of PREVIEWS_CACHE_DIRS,
+            such as "<hash>", "<hash>-wal" or "<hash>.npy".
+
+    Returns:
+        str: The hash made by `hash_file`, or None.
+    """
+    filehash = filename[:64]
+    if not is_filehash(filehash):
+        return None
+    return filehash
+
+
+def get_pack(cache_dir):
+    """Gets the thumbnails pack in the specified cache dir, if any.
+
+    Args:
+        cache_dir (str): The dir containing PREVIEWS_CACHE_DIRS.
+
+    Returns:
+        ThumbnailPack: The pack, or None if it has not been created.
+    """
+    thumbs_dir = os.path.join(cache_dir, "thumbs")
+    if not os.path.exists(os.path.join(thumbs_dir, THUMBS_PACK_FILENAME)):
+        return None
+    return ThumbnailPack.get(thumbs_dir)
+
+
+def scan_previews(cache_dir):
+    """Lists the preview files in PREVIEWS_CACHE_DIRS, each dir once.
+
+    The thumbnails in the `ThumbnailPack` are listed with a None path.
+    Can be called out of the main loop.
+
+    Args:
+        cache_dir (str): The dir containing PREVIEWS_CACHE_DIRS.
+
+    Returns:
+        dict: The list of (path, size, mtime) of the files, by file hash.
+    """
+    files = {}
+    for dirname in PREVIEWS_CACHE_DIRS:
+        path = os.path.join(cache_dir, dirname)
+        try:
+            filenames = os.listdir(path)
+        except OSError:
+            continue
+        for filename in filenames:
+            filehash = get_filehash(filename)
+            if not filehash:
+                continue
+            file_path = os.path.join(path, filename)
+            try:
+                stat = os.lstat(file_path)
+            except OSError:
+                continue
+            files.setdefault(filehash, []).append(
+                (file_path, stat.st_size, stat.st_mtime))
+
+    pack = get_pack(cache_dir)
+    if pack:
+        pack_mtime = os.path.getmtime(pack.path)
+        for filehash, size in pack.get_sizes().items():
+            files.setdefault(filehash, []).append((None, size, pack_mtime))
+    return files
+
+
+def remove_files(paths):
+    """Removes the specified files, ignoring the missing ones.
+
+    Can be called out of the main loop.
+
+    Args:
+        paths (List[str]): The paths of the files.
+    """
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_previews(cache_dir, paths, filehashes):
+    """Removes the specified preview files and thumbnails in the pack.
+
+    The pack is compacted when more than half of it is not used anymore.
+    Can be called out of the main loop.
+
+    Args:
+        cache_dir (str): The dir containing PREVIEWS_CACHE_DIRS.
+        paths (List[str]): The paths of the preview files.
+        filehashes (List[str]): The hashes of the assets whose thumbnails
+            are removed from the pack.
+    """
+    remove_files(paths)
+    pack = get_pack(cache_dir)
+    if not pack:
+        return
+
+    with pack.lock:
+        for filehash in filehashes:
+            pack.remove(filehash)
+        if pack.get_unused_size() > os.path.getsize(pack.path) / 2:
+            pack.compact()
+
+
+class PreviewsCacheManager(Loggable):
+    """Keeps the previews cached on disk under a quota.
+
+    The previews of an asset are the files named after the hash of the
+    asset file in PREVIEWS_CACHE_DIRS, plus its thumbnails in the
+    `ThumbnailPack`, if any. When the quota is exceeded, the previews of
+    the least recently used assets are removed. The assets used since the
+    manager has been created are never evicted.
+
+    The preview files and the thumbnails in the pack are listed and
+    removed in `io_pool`, see `evict_async`. Only the choice of the
+    previews to be removed is done in the main loop.
+
+    Attributes:
+        quota (int): The maximum number of bytes, 0 for no limit.
+    """
+
+    io_pool = WorkerPool("previews-cache", 1)
+
+    def __init__(self):
+        Loggable.__init__(self)
+        self.quota = 0
+        # The last access times, by file hash.
+        self._access_times = None
+        self._access_times_changed = False
+        # The hashes of the assets used while running.
+        self._in_use = set()
+        self._check_source_id = 0
+        self._evicting = False
+
+    def touch(self, filehash):
+        """Marks the previews of the specified asset as being in use."""
+        self._in_use.add(filehash)
+
+    def set_quota(self, quota):
+        """Sets the quota and enforces it.
+
+        Args:
+            quota (int): The maximum number of bytes, 0 for no limit.
+        """
+        self.quota = quota
+        self.evict_async()
+
+    def start(self):
+        """Enforces the quota periodically, starting now."""
+        self.evict_async()
+        if not self._check_source_id:
+            self._check_source_id = GLib.timeout_add_seconds(
+                PREVIEWS_CACHE_CHECK_INTERVAL_S, self.__check_cb,
+                priority=GLib.PRIORITY_LOW)
+
+    def stop(self):
+        """Stops enforcing the quota and saves the last access times."""
+        if self._check_source_id:
+            GLib.source_remove(self._check_source_id)
+            self._check_source_id = 0
+        self.io_pool.shutdown()
+        self._evicting = False
+        self.__save_access_times()
+
+    def __check_cb(self):
+        self.evict_async()
+        return True
+
+    def get_usage(self):
+        """Gets the disk space used by the cached previews.
+
+        Returns:
+            int: The number of bytes.
+        """
+        sizes, unused_mtimes = self.__get_sizes(scan_previews(xdg_cache_home()))
+        return sum(sizes.values())
+
+    def evict(self):
+        """Removes the least recently used previews exceeding the quota.
+
+        Blocks until the files are removed, see `evict_async`.
+
+        Returns:
+            int: The number of freed bytes.
+        """
+        cache_dir = xdg_cache_home()
+        paths, filehashes, freed = self.__evict_scanned(scan_previews(cache_dir))
+        if paths or filehashes:
+            remove_previews(cache_dir, paths, filehashes)
+        return freed
+
+    def evict_async(self):
+        """Removes the least recently used previews exceeding the quota.
+
+        The previews are listed and removed in `io_pool`.
+        """
+        if self._evicting:
+            return
+
+        self._evicting = True
+        self.io_pool.submit(scan_previews, xdg_cache_home(),
+                            callback=self.__scanned_cb)
+
+    def __scanned_cb(self, files):
+        paths, filehashes, unused_freed = self.__evict_scanned(files)
+        if not paths and not filehashes:
+            self._evicting = False
+            return
+
+        self.io_pool.submit(remove_previews, xdg_cache_home(), paths, filehashes,
+                            callback=self.__removed_cb)
+
+    def __removed_cb(self, unused_result):
+        self._evicting = False
+
+    def __evict_scanned(self, files):
+        """Chooses the previews to be removed.
+
+        Args:
+            files (dict): The preview files, see `scan_previews`.
+
+        Returns:
+            (List[str], List[str], int): The preview files to be removed,
+            the hashes of the assets whose thumbnails are to be removed
+            from the pack, and the number of freed bytes.
+        """
+        sizes, mtimes = self.__get_sizes(files)
+        access_times = self.__get_access_times(mtimes)
+        now = time.time()
+        for filehash in self._in_use:
+            access_times[filehash] = now
+        self._access_times_changed |= bool(self._in_use)
+
+        usage = sum(sizes.values())
+        freed = 0
+        paths = []
+        filehashes = []
+        if self.quota:
+            for filehash in sorted(sizes, key=lambda filehash: access_times[filehash]):
+                if usage - freed <= self.quota:
+                    break
+                if filehash in self._in_use:
+                    continue
+                self.debug("Removing the previews of %s", filehash)
+                for path, unused_size, unused_mtime in files[filehash]:
+                    if path is None:
+                        filehashes.append(filehash)
+                        continue
+                    # The thumbnails db might be open.
+                    SQLiteThumbnailStore.connections.close(path)
+                    paths.append(path)
+                freed += sizes[filehash]
+                access_times.pop(filehash, None)
+            if freed:
+                self.info("Removing %d bytes of previews, %d bytes left",
+                          freed, usage - freed)
+
+        self.__save_access_times()
+        return paths, filehashes, freed
+
+    def __get_sizes(self, files):
+        """Gets the size and modification time of the previews of each asset.
+
+        Args:
+            files (dict): The preview files, see `scan_previews`.
+
+        Returns:
+            (dict, dict): The number of bytes and the last modification
+            time, by file hash.
+        """
+        sizes = {}
+        mtimes = {}
+        for filehash, entries in files.items():
+            sizes[filehash] = sum(size for unused_path, size, unused_mtime in entries)
+            # The pack is modified whenever any asset gets thumbnails, so
+            # its mtime is used only for the assets having no other files.
+            unused_path, unused_size, mtimes[filehash] = max(
+                entries, key=lambda entry: (entry[0] is not None, entry[2]))
+        return sizes, mtimes
+
+    def __get_access_times(self, mtimes):
+        """Gets the last access times of the assets with previews.
+
+        Args:
+            mtimes (dict): The last modification times, by file hash.
+
+        The assets not known yet are considered last accessed when their
+        previews have been last modified.
+        """
+        if self._access_times is None:
+            self._access_times = {}
+            try:
+                with open(self.__get_access_times_path()) as access_times_file:
+                    self._access_times = json.load(access_times_file)
+            except (OSError, ValueError) as e:
+                self.debug("Could not load the previews access times: %s", e)
+
+        for filehash in set(self._access_times) - set(mtimes):
+            # The previews have been removed.
+            del self._access_times[filehash]
+            self._access_times_changed = True
+
+        for filehash in set(mtimes) - set(self._access_times):
+            self._access_times[filehash] = mtimes[filehash]
+            self._access_times_changed = True
+
+        return self._access_times
+
+    @staticmethod
+    def __get_access_times_path():
+        return os.path.join(xdg_cache_home(), PREVIEWS_ACCESS_TIMES_FILENAME)
+
+    def __save_access_times(self):
+        if not self._access_times_changed:
+            return
+
+        path = self.__get_access_times_path()
+        try:
+            with open(path + ".tmp", "w") as access_times_file:
+                json.dump(self._access_times, access_times_file)
+            os.replace(path + ".tmp", path)
+            self._access_times_changed = False
+        except OSError as e:
+            self.warning("Could not save the previews access times: %s", e)
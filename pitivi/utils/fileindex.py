@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+"""Persistent index of the hashes of the media files."""
+import json
+import os
+
+from gi.repository import GLib
+from gi.repository import GObject
+
+from pitivi.settings import xdg_cache_home
+from pitivi.utils.loggable import Loggable
+from pitivi.utils.misc import hash_file
+from pitivi.utils.threads import WorkerPool
+
+# The name of the file in the cache dir where the index is saved.
+FILE_HASH_INDEX_FILENAME = "file-hashes.json"
+# The number of threads revalidating the cached hashes.
+FILE_HASH_INDEX_WORKERS = 2
+
+
+def get_file_identity(path):
+    """Gets the identity of the specified file, which changes when modified.
+
+    Returns:
+        (int, int, int, int): The device, inode, size and modification time
+        in nanoseconds.
+    """
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def hash_files(paths):
+    """Gets the identities and the hashes of the specified files.
+
+    Meant to be run out of the main loop.
+
+    Returns:
+        List[(str, tuple, str)]: The path, identity and hash of each file,
+        the identity and hash being None if the file cannot be read.
+    """
+    results = []
+    for path in paths:
+        try:
+            identity = get_file_identity(path)
+            filehash = hash_file(path)
+        except OSError:
+            identity = filehash = None
+        results.append((path, identity, filehash))
+    return results
+
+
+class FileHashIndex(GObject.Object, Loggable):
+    """Persistent index of the `hash_file` hashes of the media files.
+
+    The hashes are indexed by the (device, inode, size, mtime_ns) identity
+    of the files. The hash of a file already in the index is returned
+    right away, without accessing the file, and the file is revalidated
+    soon after in the background, together with the other files used
+    meanwhile.
+
+    Signals:
+        hash-changed: A file already in the index has been found modified
+            when revalidated. The arguments are the path and the new hash.
+    """
+
+    __gsignals__ = {
+        "hash-changed": (GObject.SignalFlags.RUN_LAST, None, (str, str)),
+    }
+
+    _default = None
+
+    def __init__(self, path):
+        GObject.Object.__init__(self)
+        Loggable.__init__(self)
+        self.path = path
+        self._hashes_by_identity = None
+        self._identities_by_path = None
+        self._changed = False
+        # The paths known to be up to date in the index.
+        self._validated = set()
+        # The paths to be revalidated in the next batch.
+        self._to_revalidate = set()
+        self._revalidate_source_id = 0
+        self._pool = WorkerPool("file-hashes", FILE_HASH_INDEX_WORKERS)
+
+    @classmethod
+    def get_default(cls):
+        """Gets the index saved in the cache dir."""
+        if not cls._default:
+            cls._default = FileHashIndex(
+                os.path.join(xdg_cache_home(), FILE_HASH_INDEX_FILENAME))
+        return cls._default
+
+    def get_cached_hash(self, path):
+        """Gets the hash of the specified file, without accessing it.
+
+        Returns:
+            str: The hash last computed for the file, or None if unknown.
+        """
+        self.__load()
+        identity = self._identities_by_path.get(path)
+        if not identity:
+            return None
+        return self._hashes_by_identity.get(identity)
+
+    def get_hash(self, path):
+        """Gets the hash of the specified file.
+
+        If the file is in the index, the cached hash is returned and the
+        file is revalidated in the background. Otherwise it is hashed
+        right away, so the files should be indexed in the background with
+        `revalidate` as soon as they are known.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            str: The `hash_file` hash of the file.
+        """
+        filehash = self.get_cached_hash(path)
+        if filehash:
+            if path not in self._validated:
+                self.revalidate([path])
+            return filehash
+
+        identity = get_file_identity(path)
+        filehash = self._hashes_by_identity.get(identity)
+        if not filehash:
+            self.debug("Hashing %s", path)
+            filehash = hash_file(path)
+        self.__set(path, identity, filehash)
+        return filehash
+
+    def revalidate(self, paths):
+        """Revalidates the hashes of the specified files in the background.
+
+        The files are revalidated in a batch when idle. The files not yet
+        in the index are hashed and added to it.
+
+        Args:
+            paths (List[str]): The paths of the files.
+        """
+        self.__load()
+        self._to_revalidate.update(paths)
+        if not self._revalidate_source_id:
+            self._revalidate_source_id = GLib.idle_add(
+                self.__revalidate_cb, priority=GLib.PRIORITY_LOW)
+
+    def __revalidate_cb(self):
+        self._revalidate_source_id = 0
+        paths = sorted(self._to_revalidate)
+        self._to_revalidate.clear()
+        self._pool.submit(self.__check_files, paths, self._identities_by_path.copy(),
+                          callback=self.__files_checked_cb)
+        return False
+
+    @staticmethod
+    def __check_files(paths, identities_by_path):
+        """Gets the identities and hashes of the modified files.
+
+        Returns:
+            List[(str, tuple, str)]: The results of `hash_files` for the
+            files whose identity changed, plus the path and identity of the
+            others, their hash being None.
+        """
+        results = []
+        modified = []
+        for path in paths:
+            try:
+                identity = get_file_identity(path)
+            except OSError:
+                continue
+            if identity == identities_by_path.get(path):
+                results.append((path, identity, None))
+            else:
+                modified.append(path)
+        results.extend(hash_files(modified))
+        return results
+
+    def __files_checked_cb(self, results):
+        for path, identity, filehash in results:
+            if not identity:
+                continue
+            if not filehash:
+                self._validated.add(path)
+                continue
+
+            old_hash = self.get_cached_hash(path)
+            self.__set(path, identity, filehash)
+            if old_hash and filehash != old_hash:
+                self.info("The file has been modified: %s", path)
+                self.emit("hash-changed", path, filehash)
+
+    def __set(self, path, identity, filehash):
+        old_identity = self._identities_by_path.get(path)
+        if old_identity and old_identity != identity:
+            self._hashes_by_identity.pop(old_identity, None)
+        self._identities_by_path[path] = identity
+        self._hashes_by_identity[identity] = filehash
+        self._validated.add(path)
+        self._changed = True
+
+    def __load(self):
+        if self._identities_by_path is not None:
+            return
+
+        self._hashes_by_identity = {}
+        self._identities_by_path = {}
+        try:
+            with open(self.path) as index_file:
+                entries = json.load(index_file)
+        except (OSError, ValueError) as e:
+            self.debug("Could not load the file hashes: %s", e)
+            return
+
+        for path, dev, ino, size, mtime_ns, filehash in entries:
+            identity = (dev, ino, size, mtime_ns)
+            self._identities_by_path[path] = identity
+            self._hashes_by_identity[identity] = filehash
+
+    def save(self):
+        """Saves the index, if changed."""
+        if not self._changed:
+            return
+
+        entries = [(path,) + identity + (self._hashes_by_identity[identity],)
+                   for path, identity in self._identities_by_path.items()]
+        try:
+            with open(self.path + ".tmp", "w") as index_file:
+                json.dump(entries, index_file)
+            os.replace(self.path + ".tmp", self.path)
+            self._changed = False
+        except OSError as e:
+            self.warning("Could not save the file hashes: %s", e)
+
+    def stop(self):
+        """Stops revalidating and saves the index."""
+        if self._revalidate_source_id:
+            GLib.source_remove(self._revalidate_source_id)
+            self._revalidate_source_id = 0
+        self._pool.shutdown()
+        self.save()
+
+
+def get_file_hash(path):
+    """Gets the `hash_file` hash of the specified file, using the index.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hash of the first bytes of the file.
+    """
+    return FileHashIndex.get_default().get_hash(path)
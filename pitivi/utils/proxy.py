@@ -29,7 +29,10 @@ from gi.repository import GstTranscoder
 
 from pitivi.configure import get_gstpresets_dir
 from pitivi.settings import GlobalSettings
+from pitivi.utils.analysis import AnalysisPipeline
 from pitivi.utils.loggable import Loggable
+from pitivi.utils.scheduler import BackgroundWorkScheduler
+from pitivi.utils.scheduler import PipelineCpuThrottler
 
 # Make sure gst knowns about our own GstPresets
 Gst.preset_set_app_dir(get_gstpresets_dir())
@@ -52,6 +55,9 @@ GlobalSettings.addConfigOption('numTranscodingJobs',
                                default=4)
 
 
+# The share of the CPU of each transcoder, in percents of all the cores.
+PROXIES_CPU_USAGE = 10
+
 ENCODING_FORMAT_PRORES = "prores-opus-in-matroska.gep"
 ENCODING_FORMAT_JPEG = "jpeg-opus-in-matroska.gep"
 
@@ -72,7 +78,12 @@ def createEncodingProfileSimple(container_caps, audio_caps, video_caps):
 
 
 class ProxyManager(GObject.Object, Loggable):
-    """Transcodes assets and manages proxies."""
+    """Transcodes assets and manages proxies.
+
+    The assets not needing a proxy are analyzed instead, one at a time,
+    decoding each of them once to generate all their previews, see
+    `AnalysisPipeline`. The proxies get their previews while transcoding.
+    """
 
     __gsignals__ = {
         "progress": (GObject.SIGNAL_RUN_LAST, None, (object, int, int)),
@@ -108,6 +119,12 @@ class ProxyManager(GObject.Object, Loggable):
         self._start_proxying_time = 0
         self.__running_transcoders = []
         self.__pending_transcoders = []
+        # The PipelineCpuThrottlers of the running transcoders.
+        self.__throttlers = {}
+        self.__running_analysis = None
+        self.__pending_analyses = []
+        self._scheduler = BackgroundWorkScheduler.get_default()
+        self._scheduler.connect("paused-changed", self.__paused_changed_cb)
 
         self.__encoding_target_file = None
         self.proxyingUnsupported = False
@@ -251,12 +268,77 @@ class ProxyManager(GObject.Object, Loggable):
         self.info("%s does not need proxy", asset.get_id())
         return False
 
+    def __paused_changed_cb(self, unused_scheduler, paused):
+        if paused:
+            # The running transcoders are paused by their throttlers.
+            return
+
+        while self.__pending_transcoders and \
+                len(self.__running_transcoders) < self.app.settings.numTranscodingJobs:
+            self.__startTranscoder(self.__pending_transcoders.pop())
+        self.__start_next_analysis()
+
+    def __analyze(self, asset):
+        """Queues the analysis of the specified asset not being proxied."""
+        for analysis in self.__pending_analyses:
+            if analysis.asset == asset:
+                return
+        if self.__running_analysis and self.__running_analysis.asset == asset:
+            return
+
+        self.__pending_analyses.append(AnalysisPipeline(asset))
+        self.__start_next_analysis()
+
+    def __start_next_analysis(self):
+        if self._scheduler.paused:
+            # Started when the background work is resumed.
+            return
+
+        while not self.__running_analysis and self.__pending_analyses:
+            analysis = self.__pending_analyses.pop(0)
+            analysis.connect("done", self.__analysis_done_cb)
+            analysis.connect("error", self.__analysis_done_cb)
+            if analysis.start():
+                self.__running_analysis = analysis
+            else:
+                analysis.disconnect_by_func(self.__analysis_done_cb)
+
+    def __analysis_done_cb(self, analysis):
+        analysis.disconnect_by_func(self.__analysis_done_cb)
+        self.__running_analysis = None
+        self.__start_next_analysis()
+
+    def __cancel_analysis(self, asset):
+        self.__pending_analyses = [analysis for analysis in self.__pending_analyses
+                                   if analysis.asset != asset]
+        analysis = self.__running_analysis
+        if analysis and analysis.asset == asset:
+            self.info("Cancelling the analysis of %s", asset.props.id)
+            analysis.disconnect_by_func(self.__analysis_done_cb)
+            analysis.stop()
+            self.__running_analysis = None
+            self.__start_next_analysis()
+
     def __startTranscoder(self, transcoder):
+        if self._scheduler.paused:
+            # Started when the background work is resumed.
+            self.__pending_transcoders.append(transcoder)
+            return
+
         self.debug("Starting %s", transcoder.props.src_uri)
         if self._start_proxying_time == 0:
             self._start_proxying_time = time.time()
         transcoder.run_async()
         self.__running_transcoders.append(transcoder)
+        throttler = PipelineCpuThrottler(transcoder.props.pipeline,
+                                         PROXIES_CPU_USAGE)
+        throttler.start()
+        self.__throttlers[transcoder] = throttler
+
+    def __stop_throttler(self, transcoder):
+        throttler = self.__throttlers.pop(transcoder, None)
+        if throttler:
+            throttler.stop()
 
     def __assetsMatch(self, asset, proxy):
         if self.__assetNeedsTranscoding(proxy):
@@ -293,6 +375,7 @@ class ProxyManager(GObject.Object, Loggable):
         self.__emitProgress(proxy, 100)
 
     def __transcoderErrorCb(self, transcoder, error, asset):
+        self.__stop_throttler(transcoder)
         self.emit("error-preparing-asset", asset, None, error)
 
     def __transcoderDoneCb(self, transcoder, asset):
@@ -303,6 +386,7 @@ class ProxyManager(GObject.Object, Loggable):
         self.debug("Transcoder done with %s", asset.get_id())
 
         self.__running_transcoders.remove(transcoder)
+        self.__stop_throttler(transcoder)
 
         proxy_uri = self.getProxyUri(asset)
         os.rename(Gst.uri_get_location(transcoder.props.dest_uri),
@@ -378,6 +462,7 @@ class ProxyManager(GObject.Object, Loggable):
 
         thumbnailbin = Gst.ElementFactory.make("teedthumbnailbin")
         thumbnailbin.props.uri = asset.get_id()
+        thumbnailbin.props.duration = asset.get_duration()
 
         waveformbin = Gst.ElementFactory.make("waveformbin")
         waveformbin.props.uri = asset.get_id()
@@ -386,7 +471,6 @@ class ProxyManager(GObject.Object, Loggable):
         transcoder.props.pipeline.props.video_filter = thumbnailbin
         transcoder.props.pipeline.props.audio_filter = waveformbin
 
-        transcoder.set_cpu_usage(10)
         transcoder.connect("position-updated",
                            self.__proxyingPositionChangedCb,
                            asset)
@@ -404,6 +488,7 @@ class ProxyManager(GObject.Object, Loggable):
         Args:
             asset (GES.Asset): The original asset.
         """
+        self.__cancel_analysis(asset)
         if not self.is_asset_queued(asset):
             return
 
@@ -413,6 +498,7 @@ class ProxyManager(GObject.Object, Loggable):
                           transcoder.props.src_uri,
                           transcoder.__grefcount__)
                 self.__running_transcoders.remove(transcoder)
+                self.__stop_throttler(transcoder)
                 self.emit("asset-preparing-cancelled", asset)
                 return
 
@@ -443,6 +529,8 @@ class ProxyManager(GObject.Object, Loggable):
                        self.proxyingUnsupported)
             # Make sure to notify we do not need a proxy for that asset.
             self.emit("proxy-ready", asset, None)
+            if self.app.settings.analyzeOnImport:
+                self.__analyze(asset)
             return
 
         proxy_uri = self.getProxyUri(asset)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+"""Scheduling of the work done in the background, such as previews."""
+import multiprocessing
+import resource
+import time
+
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import Gst
+
+from pitivi.utils.loggable import Loggable
+
+# The minimum interval between two measurements of the CPU usage.
+CPU_USAGE_SAMPLING_INTERVAL_S = 0.2
+# How often the throttled pipelines check whether they can run.
+THROTTLE_INTERVAL_MS = 200
+# The CPU usage of the whole system above which the background work is
+# slowed down, in percents of all the cores.
+SYSTEM_CPU_USAGE_LIMIT = 90
+
+
+class BackgroundWorkPauseReason(object):
+    """Reasons for pausing the background work."""
+
+    PLAYBACK = "playback"
+    RENDERING = "rendering"
+
+
+def get_process_cpu_time():
+    """Gets the CPU time used by the process, in seconds.
+
+    Both the user and the system times are counted, for all the threads.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_system_cpu_times():
+    """Gets the busy and total CPU times of the system from /proc/stat.
+
+    Returns:
+        (int, int): The busy and total times in clock ticks, for all the
+        cores, or None if not available.
+    """
+    try:
+        with open("/proc/stat") as stat_file:
+            fields = stat_file.readline().split()
+    except OSError:
+        return None
+    if len(fields) < 5 or fields[0] != "cpu":
+        return None
+
+    # user, nice, system, idle, iowait, irq, softirq, steal. The guest
+    # times are already included in user and nice.
+    times = [int(field) for field in fields[1:9]]
+    idle = sum(times[3:5])
+    total = sum(times)
+    return total - idle, total
+
+
+class BackgroundWorkScheduler(GObject.Object, Loggable):
+    """Hands out CPU budgets to the background producers.
+
+    The producers, such as the thumbnails and waveforms generators and the
+    proxies transcoders, declare their share of the CPU with `add_producer`
+    while running. The CPU usage of the process is measured as a whole, so
+    the producers are allowed to run, see `allows`, as long as it stays
+    below the sum of the shares of the running producers, `cpu_budget`.
+    The background work is paused while the user is playing or rendering
+    the project.
+
+    Attributes:
+        cpu_usage (float): The CPU usage of the process, in percents of all
+            the cores, as last measured.
+        system_cpu_usage (float): The CPU usage of the system, in percents
+            of all the cores, as last measured, or None if unknown.
+
+    Signals:
+        paused-changed: The background work has been paused or resumed.
+    """
+
+    __gsignals__ = {
+        "paused-changed": (GObject.SignalFlags.RUN_LAST, None, (bool,)),
+    }
+
+    _default = None
+
+    def __init__(self):
+        GObject.Object.__init__(self)
+        Loggable.__init__(self)
+        self.cpu_usage = 0.0
+        self.system_cpu_usage = None
+        self._pause_reasons = set()
+        # The shares of the running producers, by producer.
+        self._shares = {}
+
+        self._last_time = time.monotonic()
+        self._last_process_cpu_time = get_process_cpu_time()
+        self._last_system_cpu_times = get_system_cpu_times()
+
+    @classmethod
+    def get_default(cls):
+        """Gets the scheduler shared by all the background producers."""
+        if not cls._default:
+            cls._default = BackgroundWorkScheduler()
+        return cls._default
+
+    @property
+    def paused(self):
+        """Whether the background work should be paused."""
+        return bool(self._pause_reasons)
+
+    def pause(self, reason):
+        """Pauses the background work until `resume` is called.
+
+        Args:
+            reason (str): The BackgroundWorkPauseReason.
+        """
+        if reason in self._pause_reasons:
+            return
+        self._pause_reasons.add(reason)
+        self.debug("Pausing the background work for %s", reason)
+        if len(self._pause_reasons) == 1:
+            self.emit("paused-changed", True)
+
+    def resume(self, reason):
+        """Resumes the background work paused for the specified reason.
+
+        Args:
+            reason (str): The BackgroundWorkPauseReason.
+        """
+        if reason not in self._pause_reasons:
+            return
+        self._pause_reasons.remove(reason)
+        self.debug("Not pausing the background work for %s anymore", reason)
+        if not self._pause_reasons:
+            self.emit("paused-changed", False)
+
+    def add_producer(self, producer, cpu_usage):
+        """Declares a running producer and its share of the CPU.
+
+        Args:
+            producer (object): The producer.
+            cpu_usage (int): The CPU usage the producer is allowed to add
+                to the budget, in percents of all the cores.
+        """
+        self._shares[producer] = cpu_usage
+
+    def remove_producer(self, producer):
+        """Forgets the share of a producer which is not running anymore."""
+        self._shares.pop(producer, None)
+
+    @property
+    def cpu_budget(self):
+        """The CPU usage allowed for the process, in percents of all the cores."""
+        return min(100, sum(self._shares.values()))
+
+    def allows(self, producer):
+        """Checks whether a producer can keep going.
+
+        Args:
+            producer (object): A producer declared with `add_producer`.
+
+        Returns:
+            bool: False if the producer should slow down or pause.
+        """
+        if self.paused or producer not in self._shares:
+            return False
+
+        return self.is_below(self.cpu_budget)
+
+    def is_below(self, cpu_usage):
+        """Checks whether the process and the system are not too busy.
+
+        Args:
+            cpu_usage (int): The CPU usage of the process, in percents of
+                all the cores.
+
+        Returns:
+            bool: Whether the process uses less than `cpu_usage` and the
+            system is not busy.
+        """
+        self.__sample()
+        if self.cpu_usage >= cpu_usage:
+            return False
+        if self.system_cpu_usage is not None and \
+                self.system_cpu_usage >= SYSTEM_CPU_USAGE_LIMIT:
+            self.log("The system is busy: %d%% CPU", self.system_cpu_usage)
+            return False
+        return True
+
+    def __sample(self):
+        """Measures the CPU usage if not done recently."""
+        now = time.monotonic()
+        delta_time = now - self._last_time
+        if delta_time < CPU_USAGE_SAMPLING_INTERVAL_S:
+            return
+
+        process_cpu_time = get_process_cpu_time()
+        self.cpu_usage = (process_cpu_time - self._last_process_cpu_time) / \
+            delta_time * 100 / multiprocessing.cpu_count()
+
+        system_cpu_times = get_system_cpu_times()
+        if system_cpu_times and self._last_system_cpu_times:
+            busy = system_cpu_times[0] - self._last_system_cpu_times[0]
+            total = system_cpu_times[1] - self._last_system_cpu_times[1]
+            if total > 0:
+                self.system_cpu_usage = busy / total * 100
+
+        self._last_time = now
+        self._last_process_cpu_time = process_cpu_time
+        self._last_system_cpu_times = system_cpu_times
+
+
+class PipelineCpuThrottler(Loggable):
+    """Pipeline manager pausing the provided pipeline to limit its CPU usage.
+
+    Meant for pipelines with unsynchronized sinks, which run as fast as they
+    can. The output is the same as when playing in realtime, the pipeline
+    being simply paused while the BackgroundWorkScheduler does not allow it
+    to run.
+
+    Attributes:
+        cpu_usage (int): The share of the CPU of the pipeline, in percents
+            of all the cores.
+    """
+
+    def __init__(self, pipeline, cpu_usage):
+        Loggable.__init__(self)
+        self.pipeline = pipeline
+        self.cpu_usage = cpu_usage
+        self.paused = False
+
+        self._scheduler = BackgroundWorkScheduler.get_default()
+        self._check_source_id = 0
+
+    def start(self):
+        """Starts checking the CPU usage of the controlled pipeline."""
+        self._scheduler.add_producer(self, self.cpu_usage)
+        if not self._check_source_id:
+            self._check_source_id = GLib.timeout_add(
+                THROTTLE_INTERVAL_MS, self._check_cpu_usage_cb)
+
+    def stop(self):
+        """Stops checking the CPU usage of the controlled pipeline."""
+        self._scheduler.remove_producer(self)
+        if self._check_source_id:
+            GLib.source_remove(self._check_source_id)
+            self._check_source_id = 0
+        self.pipeline = None
+
+    def _check_cpu_usage_cb(self):
+        allowed = self._scheduler.allows(self)
+        if not self.paused and not allowed:
+            self.log("Pausing the pipeline")
+            self.pipeline.set_state(Gst.State.PAUSED)
+            self.paused = True
+        elif self.paused and allowed:
+            self.log("Resuming the pipeline")
+            self.pipeline.set_state(Gst.State.PLAYING)
+            self.paused = False
+        return True
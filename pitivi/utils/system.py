@@ -14,10 +14,7 @@
 #
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
-import datetime
-import multiprocessing
 import os
-import resource
 import sys
 
 from gi.repository import GObject
@@ -134,20 +131,3 @@ def get_system():
     if os.name == 'nt':
         return WindowsSystem()
     return System()
-
-
-class CPUUsageTracker(object):
-
-    def __init__(self):
-        self.reset()
-
-    def usage(self):
-        delta_time = (datetime.datetime.now() - self.last_moment).total_seconds()
-        delta_usage = resource.getrusage(
-            resource.RUSAGE_SELF).ru_utime - self.last_usage.ru_utime
-        usage = float(delta_usage) / delta_time * 100
-        return usage / multiprocessing.cpu_count()
-
-    def reset(self):
-        self.last_moment = datetime.datetime.now()
-        self.last_usage = resource.getrusage(resource.RUSAGE_SELF)
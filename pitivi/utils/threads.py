@@ -17,7 +17,9 @@
 # Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
 # Boston, MA 02110-1301, USA.
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from gi.repository import GLib
 from gi.repository import GObject
 
 from pitivi.utils.loggable import Loggable
@@ -99,3 +101,64 @@ class ThreadMaster(Loggable):
                     joinedthreads += 1
                 except:
                     self.warning("what happened ??")
+
+
+class WorkerPool(Loggable):
+    """Pool of threads running functions out of the main loop.
+
+    The results are passed to the callbacks in the main loop. Useful for
+    functions spending their time in C code which releases the GIL.
+
+    Attributes:
+        name (str): The name of the pool, for logging.
+        max_workers (int): The maximum number of threads.
+    """
+
+    def __init__(self, name, max_workers):
+        Loggable.__init__(self)
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = None
+        # The futures not done yet, cancelled by `shutdown`.
+        self._futures = set()
+
+    def submit(self, func, *args, callback=None):
+        """Runs a function in a worker thread.
+
+        Args:
+            func (function): The function to run.
+            callback (Optional[function]): The function called in the main
+                loop with the result of `func`.
+
+        Returns:
+            concurrent.futures.Future: The future result of `func`.
+        """
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        future = self._executor.submit(func, *args)
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        if callback:
+            future.add_done_callback(
+                lambda future: GLib.idle_add(self.__deliver, future, callback))
+        return future
+
+    def __deliver(self, future, callback):
+        if future.cancelled():
+            return False
+
+        exception = future.exception()
+        if exception:
+            self.error("Job failed in %s: %s", self.name, exception)
+            return False
+
+        callback(future.result())
+        return False
+
+    def shutdown(self):
+        """Cancels the pending jobs and waits for the running ones."""
+        if self._executor:
+            for future in list(self._futures):
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
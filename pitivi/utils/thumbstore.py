@@ -0,0 +1,766 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+"""Storage backends for the JPEG thumbnails of the assets."""
+import binascii
+import contextlib
+import fcntl
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+from collections import OrderedDict
+
+from pitivi.utils.loggable import Loggable
+
+# The page size of the thumbnails dbs, big enough to fit a thumbnail.
+THUMBS_DB_PAGE_SIZE = 16384
+# The size of the SQLite page cache of a thumbnails db, in KiB when negative.
+THUMBS_DB_CACHE_SIZE = -2048
+# The maximum number of thumbnails dbs open at the same time. Each one uses
+# up to three file descriptors, for the db, its WAL and its shared memory.
+THUMBS_DB_MAX_CONNECTIONS = 64
+
+# The name of the pack file, in the thumbnails dir.
+THUMBS_PACK_FILENAME = "thumbs.pack"
+# The name of the index of the pack file, in the thumbnails dir.
+THUMBS_PACK_INDEX_FILENAME = "thumbs.index"
+# The name of the file locked while changing the pack, in the thumbnails dir.
+THUMBS_PACK_LOCK_FILENAME = "thumbs.lock"
+# The first bytes of the pack and index files.
+THUMBS_PACK_MAGIC = b"PTVTHMB1"
+# An index entry: file hash digest, time, offset and size of the JPEG data.
+THUMBS_PACK_INDEX_ENTRY = struct.Struct("<32sqQI")
+# The time of the index entries removing all the thumbnails of a file.
+THUMBS_PACK_TOMBSTONE = -2 ** 63
+# The time of the index entries of the poster frames.
+THUMBS_PACK_POSTER = -2 ** 63 + 1
+
+
+class ThumbnailStorage:
+    """The places where the thumbnails can be saved on disk.
+
+    SQLITE uses one SQLite db per asset. PACK uses a single pack file for
+    all the assets, memory-mapped and indexed by `ThumbnailPack`.
+    """
+
+    SQLITE = "sqlite"
+    PACK = "pack"
+
+
+class ThumbnailStore(Loggable):
+    """Interface of the places where the thumbnails of an asset are saved.
+
+    The thumbnails are JPEG data identified by their position.
+
+    Attributes:
+        filehash (str): The hash of the asset file.
+    """
+
+    def __init__(self, filehash):
+        Loggable.__init__(self)
+        self.filehash = filehash
+
+    def get_jpegs(self, positions):
+        """Gets the thumbnails at the specified positions.
+
+        Args:
+            positions (Iterable[int]): The positions of the thumbnails.
+
+        Returns:
+            dict: The JPEG data of the existing thumbnails, by position.
+        """
+        raise NotImplementedError
+
+    def get_any_jpeg(self):
+        """Gets the JPEG data of one of the thumbnails, or None."""
+        raise NotImplementedError
+
+    def get_poster_jpeg(self):
+        """Gets the JPEG data of the poster frame, or None."""
+        raise NotImplementedError
+
+    def put_poster_jpeg(self, jpeg):
+        """Saves the poster frame, the thumbnail representing the asset."""
+        raise NotImplementedError
+
+    def get_positions(self):
+        """Gets the positions of all the thumbnails.
+
+        Returns:
+            set: The positions.
+        """
+        raise NotImplementedError
+
+    def get_existing_positions(self, start, end, step):
+        """Gets the positions in the specified interval having a thumbnail.
+
+        Args:
+            start (int): The first position.
+            end (int): The end of the interval, excluded.
+            step (int): The distance between the positions.
+
+        Returns:
+            set: The positions.
+        """
+        return {position for position in self.get_positions()
+                if start <= position < end and (position - start) % step == 0}
+
+    def put_jpegs(self, rows):
+        """Saves the specified thumbnails, replacing the existing ones.
+
+        Args:
+            rows (List[(int, bytes)]): The positions and JPEG data.
+        """
+        raise NotImplementedError
+
+    def link(self, filehash):
+        """Makes the thumbnails available for another file."""
+        raise NotImplementedError
+
+
+class SQLiteConnectionPool(Loggable):
+    """Bounded pool of connections to the thumbnails dbs.
+
+    The dbs are opened on demand. When more than `max_connections` are
+    open, the least recently used one is closed. It is opened again
+    transparently when needed.
+
+    Attributes:
+        max_connections (int): The maximum number of open connections.
+    """
+
+    def __init__(self, max_connections):
+        Loggable.__init__(self)
+        self.max_connections = max_connections
+        self._connections = OrderedDict()
+
+    @property
+    def open_count(self):
+        """The number of open connections."""
+        return len(self._connections)
+
+    def get(self, dbfile):
+        """Gets a connection to the specified db, opening it if needed.
+
+        Args:
+            dbfile (str): The path of the db.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        db = self._connections.get(dbfile)
+        if db:
+            self._connections.move_to_end(dbfile)
+            return db
+
+        db = self.__open(dbfile)
+        self._connections[dbfile] = db
+        while len(self._connections) > self.max_connections:
+            unused_dbfile, old_db = self._connections.popitem(last=False)
+            old_db.close()
+        self.log("Opened %s, %d dbs open", dbfile, self.open_count)
+        return db
+
+    @staticmethod
+    def __open(dbfile):
+        db = sqlite3.connect(dbfile)
+        cur = db.cursor()
+        # The page size is taken into account only when the db is created.
+        cur.execute("PRAGMA page_size = %d" % THUMBS_DB_PAGE_SIZE)
+        cur.execute("PRAGMA cache_size = %d" % THUMBS_DB_CACHE_SIZE)
+        # The WAL journal allows committing without an fsync per transaction.
+        cur.execute("PRAGMA journal_mode = WAL")
+        cur.execute("PRAGMA synchronous = NORMAL")
+        cur.execute("CREATE TABLE IF NOT EXISTS Thumbs\
+                    (Time INTEGER NOT NULL PRIMARY KEY,\
+                    Jpeg BLOB NOT NULL)")
+        cur.execute("CREATE TABLE IF NOT EXISTS Poster\
+                    (Id INTEGER NOT NULL PRIMARY KEY CHECK (Id = 0),\
+                    Jpeg BLOB NOT NULL)")
+        db.commit()
+        return db
+
+    def close(self, dbfile):
+        """Closes the connection to the specified db, if open."""
+        db = self._connections.pop(dbfile, None)
+        if db:
+            db.close()
+
+    def close_all(self):
+        """Closes all the connections."""
+        for db in self._connections.values():
+            db.close()
+        self._connections.clear()
+
+
+class SQLiteThumbnailStore(ThumbnailStore):
+    """Saves the thumbnails of an asset in a dedicated SQLite db.
+
+    The db is accessed through the `connections` pool, so the stores of all
+    the assets of a project do not keep their dbs open.
+
+    Attributes:
+        dbfile (str): The path of the db.
+    """
+
+    connections = SQLiteConnectionPool(THUMBS_DB_MAX_CONNECTIONS)
+
+    def __init__(self, thumbs_dir, filehash):
+        ThumbnailStore.__init__(self, filehash)
+        self.thumbs_dir = thumbs_dir
+        self.dbfile = os.path.join(thumbs_dir, filehash)
+        # Create the db right away.
+        self.connections.get(self.dbfile)
+
+    def __get_db(self):
+        return self.connections.get(self.dbfile)
+
+    def get_jpegs(self, positions):
+        positions = list(positions)
+        if not positions:
+            return {}
+        cur = self.__get_db().execute(
+            "SELECT * FROM Thumbs WHERE Time IN (%s)" %
+            ",".join(str(int(position)) for position in positions))
+        return dict(cur.fetchall())
+
+    def get_any_jpeg(self):
+        row = self.__get_db().execute("SELECT Jpeg FROM Thumbs LIMIT 1").fetchone()
+        if not row:
+            return None
+        return row[0]
+
+    def get_poster_jpeg(self):
+        row = self.__get_db().execute(
+            "SELECT Jpeg FROM Poster WHERE Id = 0").fetchone()
+        if not row:
+            return None
+        return row[0]
+
+    def put_poster_jpeg(self, jpeg):
+        db = self.__get_db()
+        with db:
+            db.execute("INSERT OR REPLACE INTO Poster VALUES (0, ?)",
+                       (sqlite3.Binary(jpeg),))
+
+    def get_positions(self):
+        cur = self.__get_db().execute("SELECT Time FROM Thumbs")
+        return {row[0] for row in cur.fetchall()}
+
+    def get_existing_positions(self, start, end, step):
+        cur = self.__get_db().execute(
+            "SELECT Time FROM Thumbs"
+            " WHERE Time >= ? AND Time < ? AND (Time - ?) % ? = 0",
+            (start, end, start, step))
+        return {row[0] for row in cur.fetchall()}
+
+    def put_jpegs(self, rows):
+        db = self.__get_db()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO Thumbs VALUES (?,?)",
+                [(position, sqlite3.Binary(jpeg)) for position, jpeg in rows])
+
+    def link(self, filehash):
+        os.symlink(self.dbfile, os.path.join(self.thumbs_dir, filehash))
+
+
+class ThumbnailPack(Loggable):
+    """Append-only file holding the thumbnails of all the assets.
+
+    The JPEG data is appended to the pack file, which is memory-mapped for
+    reading. The index file lists, in fixed-size entries, the file hash and
+    the position of each thumbnail, plus where its data is in the pack.
+    The index is written after the data, so an interrupted write leaves at
+    most some unreferenced data at the end of the pack.
+
+    A thumbnail is replaced by appending it again, the last index entry wins.
+    The thumbnails of a file are removed by appending a tombstone entry. The
+    space they use is reclaimed by `compact`. The poster frame of a file is
+    saved as the thumbnail at THUMBS_PACK_POSTER.
+
+    The pack can be used by multiple processes at the same time. The
+    writes, the compaction and the index reloads are done while holding
+    an exclusive lock on the lock file. The entries appended by the other
+    processes are loaded when the index file grows, and the whole index
+    is loaded again when it is replaced by a compaction.
+
+    The pack can also be used by multiple threads, for example to remove
+    and compact in a worker thread. The reads of the entries and of their
+    data have to be done while holding `lock`, so a compaction does not
+    move the data meanwhile.
+
+    Attributes:
+        path (str): The path of the pack file.
+        index_path (str): The path of the index file.
+        lock_path (str): The path of the lock file.
+        lock (threading.RLock): The lock of the pack in this process.
+    """
+
+    packs_by_path = {}
+    packs_lock = threading.Lock()
+
+    def __init__(self, thumbs_dir):
+        Loggable.__init__(self)
+        self.path = os.path.join(thumbs_dir, THUMBS_PACK_FILENAME)
+        self.index_path = os.path.join(thumbs_dir, THUMBS_PACK_INDEX_FILENAME)
+        self.lock_path = os.path.join(thumbs_dir, THUMBS_PACK_LOCK_FILENAME)
+        self.lock = threading.RLock()
+        self._lock_file = open(self.lock_path, "ab")
+        self._pack_file = None
+        self._index_file = None
+        self._mmap = None
+        self._mapped_size = 0
+        # The device and inode of the index file, changing when compacted.
+        self._index_identity = None
+        # The number of bytes of the index file already loaded.
+        self._index_size = 0
+        # The (offset, size) of the thumbnails, by position, by file hash.
+        self._entries = {}
+        with self.__locked():
+            self.__open_files()
+
+    @classmethod
+    def get(cls, thumbs_dir):
+        """Gets the pack in the specified dir, creating it if needed."""
+        with cls.packs_lock:
+            pack = cls.packs_by_path.get(thumbs_dir)
+            if not pack:
+                pack = ThumbnailPack(thumbs_dir)
+                cls.packs_by_path[thumbs_dir] = pack
+        return pack
+
+    @contextlib.contextmanager
+    def __locked(self):
+        # The flock is per open file, it does not exclude the other threads.
+        with self.lock:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def __open(path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        file = os.fdopen(fd, "r+b")
+        if file.seek(0, os.SEEK_END) == 0:
+            file.write(THUMBS_PACK_MAGIC)
+            file.flush()
+        else:
+            file.seek(0)
+            if file.read(len(THUMBS_PACK_MAGIC)) != THUMBS_PACK_MAGIC:
+                file.close()
+                raise ValueError("Not a thumbnails pack file: %s" % path)
+        return file
+
+    def __close_files(self):
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+            self._mapped_size = 0
+        if self._pack_file:
+            self._pack_file.close()
+            self._pack_file = None
+        if self._index_file:
+            self._index_file.close()
+            self._index_file = None
+
+    def __open_files(self):
+        """Opens the files and loads the whole index, with the lock held."""
+        self.__close_files()
+        self._pack_file = self.__open(self.path)
+        self._index_file = self.__open(self.index_path)
+        stat = os.fstat(self._index_file.fileno())
+        self._index_identity = (stat.st_dev, stat.st_ino)
+        self._index_size = len(THUMBS_PACK_MAGIC)
+        self._entries = {}
+        self.__load_index()
+
+    def __load_index(self):
+        """Loads the entries not loaded yet, with the lock held."""
+        pack_size = os.fstat(self._pack_file.fileno()).st_size
+        self._index_file.seek(self._index_size)
+        data = self._index_file.read()
+        entry_size = THUMBS_PACK_INDEX_ENTRY.size
+        valid_size = 0
+        for digest, position, offset, size in \
+                THUMBS_PACK_INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % entry_size]):
+            if offset + size > pack_size:
+                # The data has not been written completely.
+                break
+            filehash = binascii.hexlify(digest).decode("ascii")
+            if position == THUMBS_PACK_TOMBSTONE:
+                self._entries.pop(filehash, None)
+            else:
+                self._entries.setdefault(filehash, {})[position] = (offset, size)
+            valid_size += entry_size
+
+        if valid_size < len(data):
+            self.warning("Dropping the incomplete entries of %s", self.index_path)
+            self._index_file.truncate(self._index_size + valid_size)
+        self._index_size += valid_size
+
+    def __sync(self):
+        """Loads the changes made by the other processes, with the lock held."""
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            stat = None
+        if not stat or (stat.st_dev, stat.st_ino) != self._index_identity:
+            self.debug("Reloading %s, compacted meanwhile", self.index_path)
+            self.__open_files()
+        elif stat.st_size != self._index_size:
+            self.__load_index()
+
+    def __refresh(self):
+        """Loads the changes made by the other processes, if any."""
+        try:
+            stat = os.stat(self.index_path)
+            if (stat.st_dev, stat.st_ino) == self._index_identity and \
+                    stat.st_size == self._index_size:
+                return
+        except OSError:
+            # Being compacted.
+            pass
+        with self.__locked():
+            self.__sync()
+
+    def __read(self, offset, size):
+        if offset + size > self._mapped_size:
+            if self._mmap:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._pack_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self._mapped_size = len(self._mmap)
+        return self._mmap[offset:offset + size]
+
+    def get_entries(self, filehash):
+        """Gets the (offset, size) of the thumbnails of a file, by position."""
+        with self.lock:
+            self.__refresh()
+            return self._entries.get(filehash, {})
+
+    def get_jpeg(self, entry):
+        """Gets the JPEG data at the specified index entry."""
+        offset, size = entry
+        with self.lock:
+            return self.__read(offset, size)
+
+    def append(self, filehash, rows):
+        """Appends thumbnails of the specified file.
+
+        Args:
+            filehash (str): The hash of the file.
+            rows (List[(int, bytes)]): The positions and JPEG data.
+        """
+        digest = bytes.fromhex(filehash)
+        with self.__locked():
+            self.__sync()
+            offset = self._pack_file.seek(0, os.SEEK_END)
+            index = []
+            for position, jpeg in rows:
+                self._pack_file.write(jpeg)
+                index.append((position, offset, len(jpeg)))
+                offset += len(jpeg)
+            self._pack_file.flush()
+
+            self.__append_entries(digest, index)
+            entries = self._entries.setdefault(filehash, {})
+            for position, offset, size in index:
+                entries[position] = (offset, size)
+
+    def link(self, filehash, target_filehash):
+        """Makes the thumbnails of a file available for another file."""
+        with self.__locked():
+            self.__sync()
+            entries = self._entries.get(filehash, {})
+            index = [(position, offset, size)
+                     for position, (offset, size) in entries.items()]
+            self.__append_entries(bytes.fromhex(target_filehash), index)
+            self._entries[target_filehash] = dict(entries)
+
+    def remove(self, filehash):
+        """Removes the thumbnails of the specified file."""
+        with self.__locked():
+            self.__sync()
+            if self._entries.pop(filehash, None) is not None:
+                self.__append_entries(bytes.fromhex(filehash),
+                                      [(THUMBS_PACK_TOMBSTONE, 0, 0)])
+
+    def get_sizes(self):
+        """Gets the size of the thumbnails of each file.
+
+        Returns:
+            dict: The number of bytes by file hash.
+        """
+        with self.lock:
+            self.__refresh()
+            return {filehash: sum(size for unused_offset, size in entries.values())
+                    for filehash, entries in self._entries.items()}
+
+    def get_unused_size(self):
+        """Gets the size of the data not referenced anymore."""
+        with self.lock:
+            used_size = len(THUMBS_PACK_MAGIC) + sum(self.get_sizes().values())
+            pack_size = os.fstat(self._pack_file.fileno()).st_size
+        return max(0, pack_size - used_size)
+
+    def compact(self):
+        """Rewrites the pack and the index without the unreferenced data."""
+        self.debug("Compacting %s", self.path)
+        pack_path = self.path + ".tmp"
+        index_path = self.index_path + ".tmp"
+        with self.__locked():
+            self.__sync()
+            with open(pack_path, "wb") as pack_file, open(index_path, "wb") as index_file:
+                pack_file.write(THUMBS_PACK_MAGIC)
+                index_file.write(THUMBS_PACK_MAGIC)
+                offset = len(THUMBS_PACK_MAGIC)
+                for filehash, file_entries in self._entries.items():
+                    digest = bytes.fromhex(filehash)
+                    for position, entry in file_entries.items():
+                        jpeg = self.get_jpeg(entry)
+                        pack_file.write(jpeg)
+                        index_file.write(THUMBS_PACK_INDEX_ENTRY.pack(
+                            digest, position, offset, len(jpeg)))
+                        offset += len(jpeg)
+
+            self.__close_files()
+            # The old index is removed first so it's never used with the new
+            # pack. If interrupted, the thumbnails have to be generated again.
+            os.remove(self.index_path)
+            os.replace(pack_path, self.path)
+            os.replace(index_path, self.index_path)
+            self.__open_files()
+
+    def __append_entries(self, digest, index):
+        data = b"".join(
+            THUMBS_PACK_INDEX_ENTRY.pack(digest, position, offset, size)
+            for position, offset, size in index)
+        self._index_file.seek(0, os.SEEK_END)
+        self._index_file.write(data)
+        self._index_file.flush()
+        self._index_size += len(data)
+
+    def close(self):
+        """Closes the files."""
+        with self.lock:
+            self.__close_files()
+            self._lock_file.close()
+        thumbs_dir = os.path.dirname(self.path)
+        with self.packs_lock:
+            if self.packs_by_path.get(thumbs_dir) is self:
+                del self.packs_by_path[thumbs_dir]
+
+
+class PackThumbnailStore(ThumbnailStore):
+    """Saves the thumbnails of an asset in the shared `ThumbnailPack`."""
+
+    def __init__(self, thumbs_dir, filehash):
+        ThumbnailStore.__init__(self, filehash)
+        self.pack = ThumbnailPack.get(thumbs_dir)
+
+    def get_jpegs(self, positions):
+        with self.pack.lock:
+            entries = self.pack.get_entries(self.filehash)
+            return {position: self.pack.get_jpeg(entries[position])
+                    for position in positions
+                    if position in entries and position != THUMBS_PACK_POSTER}
+
+    def get_any_jpeg(self):
+        with self.pack.lock:
+            entries = self.pack.get_entries(self.filehash)
+            if not entries:
+                return None
+            return self.pack.get_jpeg(next(iter(entries.values())))
+
+    def get_poster_jpeg(self):
+        with self.pack.lock:
+            entry = self.pack.get_entries(self.filehash).get(THUMBS_PACK_POSTER)
+            if not entry:
+                return None
+            return self.pack.get_jpeg(entry)
+
+    def put_poster_jpeg(self, jpeg):
+        self.pack.append(self.filehash, [(THUMBS_PACK_POSTER, jpeg)])
+
+    def get_positions(self):
+        positions = set(self.pack.get_entries(self.filehash).keys())
+        positions.discard(THUMBS_PACK_POSTER)
+        return positions
+
+    def put_jpegs(self, rows):
+        self.pack.append(self.filehash, rows)
+
+    def link(self, filehash):
+        self.pack.link(self.filehash, filehash)
+
+
+def create_thumbnail_store(storage, thumbs_dir, filehash):
+    """Creates a store for the thumbnails of the specified file.
+
+    Args:
+        storage (str): One of the `ThumbnailStorage` values.
+        thumbs_dir (str): The dir containing the thumbnails.
+        filehash (str): The hash of the file.
+
+    Returns:
+        ThumbnailStore: The store.
+    """
+    if storage == ThumbnailStorage.PACK:
+        return PackThumbnailStore(thumbs_dir, filehash)
+    return SQLiteThumbnailStore(thumbs_dir, filehash)
+
+
+def get_poster_jpegs(storage, thumbs_dir, filehashes):
+    """Gets the poster frames of the specified files.
+
+    With the PACK storage, the poster frames are found in the index in
+    memory. With the SQLITE storage, the existing dbs are opened read-only.
+
+    Args:
+        storage (str): One of the `ThumbnailStorage` values.
+        thumbs_dir (str): The dir containing the thumbnails.
+        filehashes (Iterable[str]): The hashes of the files.
+
+    Returns:
+        dict: The JPEG data of the existing poster frames, by file hash.
+    """
+    jpegs = {}
+    if storage == ThumbnailStorage.PACK:
+        pack = ThumbnailPack.get(thumbs_dir)
+        with pack.lock:
+            for filehash in filehashes:
+                entry = pack.get_entries(filehash).get(THUMBS_PACK_POSTER)
+                if entry:
+                    jpegs[filehash] = pack.get_jpeg(entry)
+        return jpegs
+
+    for filehash in filehashes:
+        dbfile = os.path.join(thumbs_dir, filehash)
+        if not os.path.exists(dbfile):
+            continue
+        try:
+            db = sqlite3.connect("file:%s?mode=ro" % dbfile, uri=True)
+            try:
+                row = db.execute("SELECT Jpeg FROM Poster WHERE Id = 0").fetchone()
+            finally:
+                db.close()
+        except sqlite3.Error:
+            # Created before the poster frames were saved.
+            continue
+        if row:
+            jpegs[filehash] = row[0]
+    return jpegs
+
+
+def migrate_sqlite_to_pack(thumbs_dir, remove=False):
+    """Copies the thumbnails in the SQLite dbs to the pack file.
+
+    The dbs of the files already having thumbnails in the pack are not
+    copied again, so running the migration again is harmless.
+
+    Args:
+        thumbs_dir (str): The dir containing the thumbnails.
+        remove (bool): Whether to remove the migrated dbs.
+
+    Returns:
+        int: The number of migrated dbs.
+    """
+    pack = ThumbnailPack.get(thumbs_dir)
+    dbfiles = []
+    links = []
+    for filename in sorted(os.listdir(thumbs_dir)):
+        path = os.path.join(thumbs_dir, filename)
+        if not is_filehash(filename) or not os.path.isfile(path):
+            continue
+        if os.path.islink(path):
+            # The dbs copied with `ThumbnailCache.copy` are symlinks.
+            links.append((os.path.basename(os.path.realpath(path)), filename))
+        else:
+            dbfiles.append(filename)
+
+    migrated = []
+    for filehash in dbfiles:
+        if pack.get_entries(filehash):
+            pack.debug("Already migrated: %s", filehash)
+            migrated.append(filehash)
+            continue
+        path = os.path.join(thumbs_dir, filehash)
+        db = sqlite3.connect(path)
+        try:
+            rows = db.execute("SELECT Time, Jpeg FROM Thumbs").fetchall()
+            try:
+                rows.extend((THUMBS_PACK_POSTER, jpeg)
+                            for jpeg, in db.execute("SELECT Jpeg FROM Poster"))
+            except sqlite3.OperationalError:
+                # Created before the poster frames were saved.
+                pass
+        except sqlite3.DatabaseError as e:
+            pack.warning("Skipping %s: %s", path, e)
+            continue
+        finally:
+            db.close()
+        pack.append(filehash, [(position, bytes(jpeg)) for position, jpeg in rows])
+        migrated.append(filehash)
+
+    for filehash, link_filehash in links:
+        if filehash in migrated:
+            if not pack.get_entries(link_filehash):
+                pack.link(filehash, link_filehash)
+            migrated.append(link_filehash)
+
+    if remove:
+        for filehash in migrated:
+            path = os.path.join(thumbs_dir, filehash)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.lexists(path + suffix):
+                    os.remove(path + suffix)
+
+    return len(migrated)
+
+
+def is_filehash(name):
+    """Checks whether the specified name is a hash made by `hash_file`."""
+    if len(name) != 64:
+        return False
+    try:
+        bytes.fromhex(name)
+    except ValueError:
+        return False
+    return True
+
+
+def main(argv):
+    """Migrates the SQLite thumbnail dbs to the pack file."""
+    from pitivi.settings import xdg_cache_home
+
+    remove = "--remove" in argv
+    args = [arg for arg in argv[1:] if arg != "--remove"]
+    thumbs_dir = args[0] if args else os.path.join(xdg_cache_home(), "thumbs")
+    count = migrate_sqlite_to_pack(thumbs_dir, remove=remove)
+    print("Migrated the thumbnails of %d files to %s" %
+          (count, os.path.join(thumbs_dir, THUMBS_PACK_FILENAME)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -51,10 +51,12 @@ def clean_pitivi_mock(app):
 
 def __create_settings(proxyingStrategy=ProxyingStrategy.NOTHING,
                       numTranscodingJobs=4,
+                      analyzeOnImport=False,
                       **additional_settings):
     settings = GlobalSettings()
     settings.proxyingStrategy = proxyingStrategy
     settings.numTranscodingJobs = numTranscodingJobs
+    settings.analyzeOnImport = analyzeOnImport
     for key, value in additional_settings.items():
         setattr(settings, key, value)
     return settings
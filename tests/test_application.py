@@ -20,8 +20,12 @@
 # pylint: disable=missing-docstring,protected-access,no-self-use
 from unittest import mock
 
+from gi.repository import GES
+from gi.repository import Gst
+
 from pitivi import application
 from pitivi import configure
+from pitivi.utils.scheduler import BackgroundWorkPauseReason
 from tests import common
 
 
@@ -108,3 +112,33 @@ class TestPitivi(common.TestCase):
         with mock.patch.object(app, "inhibit") as inhibit_mock:
             app.simple_inhibit("reason1", "flags1")
             self.assertTrue(inhibit_mock.called)
+
+    def test_background_work_resume_delayed(self):
+        app = application.Pitivi()
+        app.background_work = mock.Mock()
+        pipeline = mock.Mock()
+        pipeline.props.mode = GES.PipelineFlags.FULL_PREVIEW
+        state_change_cb = app._Pitivi__pipeline_state_change_cb
+
+        with mock.patch.object(application.GLib, "timeout_add") as timeout_add,\
+                mock.patch.object(application.GLib, "source_remove") as source_remove:
+            timeout_add.return_value = 1
+            state_change_cb(pipeline, Gst.State.PLAYING, Gst.State.PAUSED)
+            app.background_work.pause.assert_called_once_with(
+                BackgroundWorkPauseReason.PLAYBACK)
+
+            # The background work is not resumed right away.
+            state_change_cb(pipeline, Gst.State.PAUSED, Gst.State.PLAYING)
+            self.assertFalse(app.background_work.resume.called)
+            self.assertEqual(timeout_add.call_count, 1)
+
+            # Playing again cancels the pending resume.
+            state_change_cb(pipeline, Gst.State.PLAYING, Gst.State.PAUSED)
+            source_remove.assert_called_once_with(1)
+
+            state_change_cb(pipeline, Gst.State.PAUSED, Gst.State.PLAYING)
+            self.assertEqual(timeout_add.call_count, 2)
+            resume_cb = timeout_add.call_args[0][1]
+            self.assertFalse(resume_cb())
+            app.background_work.resume.assert_any_call(
+                BackgroundWorkPauseReason.PLAYBACK)
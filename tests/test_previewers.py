@@ -18,16 +18,46 @@
 # Boston, MA 02110-1301, USA.
 import os
 import pickle
+import sqlite3
 import tempfile
 from unittest import mock
 from unittest import TestCase
 
+import cairo
+import numpy
+from gi.repository import GdkPixbuf
 from gi.repository import GES
+from gi.repository import GLib
 from gi.repository import Gst
 
+from pitivi.timeline.previewers import AudioPreviewer
+from pitivi.timeline.previewers import choose_peaks_level
+from pitivi.timeline.previewers import choose_thumbnailing_mode
+from pitivi.timeline.previewers import compute_peaks_pyramid
+from pitivi.timeline.previewers import forget_file_previews
+from pitivi.timeline.previewers import get_peaks_file_location
+from pitivi.timeline.previewers import get_poster_position
 from pitivi.timeline.previewers import get_wavefile_location_for_uri
+from pitivi.timeline.previewers import levels_to_samples
+from pitivi.timeline.previewers import MemoryLRUCache
+from pitivi.timeline.previewers import PreviewGeneratorManager
+from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import PreviewsPrefetcher
+from pitivi.timeline.previewers import renderer
+from pitivi.timeline.previewers import SAMPLE_DURATION
 from pitivi.timeline.previewers import THUMB_HEIGHT
+from pitivi.timeline.previewers import THUMB_PERIODS
 from pitivi.timeline.previewers import ThumbnailCache
+from pitivi.timeline.previewers import ThumbnailGenerator
+from pitivi.timeline.previewers import ThumbnailsMemoryCache
+from pitivi.timeline.previewers import ThumbnailingMode
+from pitivi.timeline.previewers import THUMBS_WRITE_BATCH_SIZE
+from pitivi.timeline.previewers import VideoPreviewer
+from pitivi.timeline.previewers import WaveformCache
+from pitivi.timeline.previewers import WaveformTilesCache
+from pitivi.utils.scheduler import BackgroundWorkPauseReason
+from pitivi.utils.scheduler import BackgroundWorkScheduler
+from pitivi.utils.timeline import Zoomable
 from tests import common
 from tests.test_media_library import BaseTestMediaLibrary
 
@@ -41,6 +71,19 @@ class TestPreviewers(BaseTestMediaLibrary):
         wavebin = pipeline.get_by_name("wavebin")
         self.assertTrue(wavebin)
 
+    def test_thumbnail_bin_coarse_positions(self):
+        thumbnailbin = Gst.ElementFactory.make("thumbnailbin")
+        # The analysis is not paced to realtime.
+        self.assertFalse(thumbnailbin.gdkpixbufsink.props.sync)
+
+        thumbnailbin.props.duration = 21 * Gst.SECOND
+        positions = [position
+                     for position in range(0, 21 * Gst.SECOND, Gst.SECOND // 2)
+                     if thumbnailbin.is_coarse_position(position)]
+        self.assertEqual(positions, [0, 8 * Gst.SECOND,
+                                     get_poster_position(21 * Gst.SECOND),
+                                     16 * Gst.SECOND])
+
     def testWaveFormAndThumbnailCreated(self):
         sample_name = "1sec_simpsons_trailer.mp4"
         self.runCheckImport([sample_name])
@@ -57,10 +100,328 @@ class TestPreviewers(BaseTestMediaLibrary):
         wavefile = get_wavefile_location_for_uri(sample_uri)
         self.assertTrue(os.path.exists(wavefile), wavefile)
 
-        with open(wavefile, "rb") as fsamples:
-            samples = pickle.load(fsamples)
+        samples = numpy.load(wavefile)
+        self.assertTrue(len(samples))
+
+
+class TestVideoPreviewer(TestCase):
+
+    def test_choose_thumbnailing_mode(self):
+        period = Gst.SECOND / 2
+        self.assertEqual(choose_thumbnailing_mode(None, period),
+                         ThumbnailingMode.ACCURATE)
+        self.assertEqual(choose_thumbnailing_mode(Gst.SECOND / 30, period),
+                         ThumbnailingMode.ACCURATE)
+        self.assertEqual(choose_thumbnailing_mode(Gst.SECOND, period),
+                         ThumbnailingMode.FAST)
+        self.assertEqual(choose_thumbnailing_mode(10 * Gst.SECOND, period),
+                         ThumbnailingMode.SEQUENTIAL)
+
+        # A few thumbnails far from each other are generated by seeking.
+        missing = [0, 60 * Gst.SECOND, 120 * Gst.SECOND]
+        self.assertEqual(choose_thumbnailing_mode(10 * Gst.SECOND, period, missing),
+                         ThumbnailingMode.ACCURATE)
+        self.assertEqual(choose_thumbnailing_mode(10 * Gst.SECOND, period, []),
+                         ThumbnailingMode.ACCURATE)
+        missing = [i * period for i in range(20)]
+        self.assertEqual(choose_thumbnailing_mode(10 * Gst.SECOND, period, missing),
+                         ThumbnailingMode.SEQUENTIAL)
+
+    def test_get_level_period(self):
+        self.assertEqual(VideoPreviewer._get_level_period(THUMB_PERIODS[0]),
+                         THUMB_PERIODS[0])
+        self.assertEqual(VideoPreviewer._get_level_period(3 * Gst.SECOND),
+                         2 * Gst.SECOND)
+        self.assertEqual(VideoPreviewer._get_level_period(1000 * Gst.SECOND),
+                         THUMB_PERIODS[-1])
+        for period, next_period in zip(THUMB_PERIODS, THUMB_PERIODS[1:]):
+            # The coarse thumbnails are also used by the finer periods.
+            self.assertEqual(next_period % period, 0)
+
+
+class TestPreviewGeneratorManager(TestCase):
+
+    @staticmethod
+    def create_job(resumable=True, start=0):
+        job = mock.Mock()
+        job.track_type = GES.TrackType.VIDEO
+        job.resumable = resumable
+        job.get_timeline_intervals.return_value = [(start, start + 10)]
+        return job
+
+    @staticmethod
+    def finish_job(job):
+        done_cb = job.connect.call_args[0][1]
+        done_cb(job)
+
+    def test_parallel_jobs(self):
+        manager = PreviewGeneratorManager()
+        manager.set_limits(2, 50)
+        manager._scheduler = mock.Mock(paused=False)
+        jobs = [self.create_job() for unused_i in range(4)]
+        for job in jobs:
+            manager.add_previewer(job)
+        # The first job is started right away.
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 0, 0, 0])
+
+        # Below the budget, one more job is started.
+        manager._scheduler.is_below.return_value = True
+        self.assertTrue(manager._check_cpu_usage_cb())
+        manager._scheduler.is_below.assert_called_with(50)
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 1, 0, 0])
+        # No more than max_jobs run in parallel.
+        self.assertTrue(manager._check_cpu_usage_cb())
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 1, 0, 0])
+
+        # Over the budget, the last started job is stopped and queued first.
+        manager._scheduler.is_below.return_value = False
+        self.assertTrue(manager._check_cpu_usage_cb())
+        jobs[1].stopGeneration.assert_called_once_with()
+        self.assertTrue(manager._check_cpu_usage_cb())
+        self.assertFalse(jobs[0].stopGeneration.called)
+
+        # A finished job is replaced right away.
+        self.finish_job(jobs[0])
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 2, 0, 0])
+
+    def test_non_resumable_jobs_not_stopped(self):
+        manager = PreviewGeneratorManager()
+        manager.set_limits(2, 50)
+        manager._scheduler = mock.Mock(paused=False)
+        jobs = [self.create_job(resumable=False) for unused_i in range(2)]
+        for job in jobs:
+            manager.add_previewer(job)
+        manager._scheduler.is_below.return_value = True
+        manager._check_cpu_usage_cb()
+        manager._scheduler.is_below.return_value = False
+        self.assertTrue(manager._check_cpu_usage_cb())
+        self.assertFalse(jobs[1].stopGeneration.called)
+
+        self.finish_job(jobs[0])
+        self.finish_job(jobs[1])
+        self.assertFalse(manager._check_cpu_usage_cb())
+
+    def test_paused(self):
+        scheduler = BackgroundWorkScheduler()
+        with mock.patch.object(BackgroundWorkScheduler, "get_default",
+                               return_value=scheduler):
+            manager = PreviewGeneratorManager()
+        manager.set_limits(2, 100)
+        jobs = [self.create_job(), self.create_job(resumable=False),
+                self.create_job()]
+        manager.add_previewer(jobs[0])
+        manager.add_previewer(jobs[1])
+
+        # All the resumable jobs are stopped.
+        scheduler.pause(BackgroundWorkPauseReason.PLAYBACK)
+        jobs[0].stopGeneration.assert_called_once_with()
+        self.assertFalse(jobs[1].stopGeneration.called)
+        self.assertFalse(manager._check_cpu_usage_cb())
+        manager.add_previewer(jobs[2])
+        self.assertFalse(jobs[2].startGeneration.called)
+
+        scheduler.resume(BackgroundWorkPauseReason.PLAYBACK)
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 1, 0])
+        self.finish_job(jobs[1])
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [2, 1, 0])
+
+    def test_priorities(self):
+        manager = PreviewGeneratorManager()
+        manager.set_limits(1, 50)
+        manager.set_viewport(200, 300, 250)
+        # Far, visible, visible and closer to the playhead, near.
+        jobs = [self.create_job(start=start) for start in (1000, 200, 240, 320)]
+        for job in jobs:
+            manager.add_previewer(job)
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 0, 0, 0])
+
+        # A visible job takes the place of the running job out of view.
+        manager.set_viewport(200, 300, 250)
+        jobs[0].stopGeneration.assert_called_once_with()
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 0, 1, 0])
+
+        self.finish_job(jobs[2])
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [1, 1, 1, 0])
+
+        # Scrolling changes the priorities.
+        manager.set_viewport(900, 1000, 950)
+        jobs[1].stopGeneration.assert_called_once_with()
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [2, 1, 1, 0])
+        self.finish_job(jobs[0])
+        self.assertEqual([job.startGeneration.call_count for job in jobs],
+                         [2, 1, 1, 1])
+
+
+class TestPreviewsPrefetcher(TestCase):
+
+    def test_direction(self):
+        prefetcher = PreviewsPrefetcher()
+        client = mock.Mock()
+        client.get_timeline_intervals.return_value = [(0, 100 * Gst.SECOND)]
+        prefetcher.add_client(client)
+
+        with mock.patch("time.monotonic") as monotonic:
+            monotonic.return_value = 0
+            prefetcher.set_viewport(0, 10)
+            self.assertEqual(prefetcher.direction, 0)
+            self.assertIsNone(prefetcher.get_prefetch_interval())
+
+            # Scrolling a screen per second to the right.
+            monotonic.return_value = 1
+            prefetcher.set_viewport(10, 20)
+            self.assertEqual(prefetcher.direction, 1)
+            self.assertEqual(prefetcher.velocity, 0.5)
+            self.assertEqual(prefetcher.get_prefetch_interval(), (20, 35))
+            self.assertEqual(prefetcher.get_priority(15), (0, 15))
+            self.assertEqual(prefetcher.get_priority(25), (1, 5))
+            self.assertEqual(prefetcher.get_priority(5), (2, 5))
+
+            # Faster, but not more than two screens ahead.
+            monotonic.return_value = 1.1
+            prefetcher.set_viewport(20, 30)
+            self.assertEqual(prefetcher.get_prefetch_interval(), (30, 50))
+            client.cancel_prefetch.assert_not_called()
+
+            # Reversing the direction cancels the prefetching.
+            monotonic.return_value = 2
+            prefetcher.set_viewport(15, 25)
+            self.assertEqual(prefetcher.direction, -1)
+            client.cancel_prefetch.assert_called_once_with()
+            self.assertEqual(prefetcher.get_prefetch_interval()[1], 15)
+
+            # Zooming stops the prefetching.
+            client.cancel_prefetch.reset_mock()
+            prefetcher.set_viewport(15, 45)
+            self.assertEqual(prefetcher.direction, 0)
+            client.cancel_prefetch.assert_called_once_with()
+
+
+class TestThumbnailGenerator(TestCase):
+
+    def test_shared_per_uri(self):
+        sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+        with mock.patch.object(Previewer.manager, "add_previewer") as add_previewer:
+            generator = ThumbnailGenerator.get(sample_uri, ThumbnailingMode.ACCURATE)
+            self.assertIs(ThumbnailGenerator.get(sample_uri, ThumbnailingMode.FAST),
+                          generator)
+
+            previewers = []
+            for duration in (Gst.SECOND, 2 * Gst.SECOND):
+                previewer = mock.Mock()
+                previewer.ges_elem.props.in_point = 0
+                previewer.ges_elem.props.duration = duration
+                generator.add_client(previewer)
+                previewers.append(previewer)
+            self.assertEqual(generator.duration, 2 * Gst.SECOND)
+            add_previewer.assert_called_with(generator)
+
+            # The wishes of the clients are merged, skipping the positions
+            # generated meanwhile.
+            generator._generated.add(4)
+            generator.set_wishlist(previewers[0], [0, 2])
+            generator.set_wishlist(previewers[1], [4, 6], THUMB_PERIODS[1])
+            self.assertEqual(generator._get_wish(), 0)
+            self.assertEqual(generator._get_wish(), 2)
+            self.assertEqual(generator._get_wish(), 6)
+            self.assertIsNone(generator._get_wish())
+            self.assertEqual(generator._periods[previewers[1]], THUMB_PERIODS[1])
+
+            generator.remove_client(previewers[0])
+            self.assertIs(ThumbnailGenerator.get(sample_uri, ThumbnailingMode.FAST),
+                          generator)
+            generator.remove_client(previewers[1])
+            self.assertNotIn(sample_uri, ThumbnailGenerator.generators_by_uri)
+
+    def test_coarse_positions_tried_once(self):
+        sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+        generator = ThumbnailGenerator(sample_uri, ThumbnailingMode.ACCURATE)
+        generator.pipeline = mock.Mock()
+        generator._coarse_queue = [0, 8 * Gst.SECOND]
+        with mock.patch.object(generator, "stopGeneration") as stop_generation, \
+                mock.patch.object(generator.thumb_cache, "commit"):
+            # The seeks do not produce any thumbnail.
+            generator._create_next_thumb()
+            generator._create_next_thumb()
+            stop_generation.assert_not_called()
+            self.assertEqual(generator.pipeline.seek.call_count, 2)
 
-        self.assertTrue(bool(samples))
+            generator._create_next_thumb()
+            stop_generation.assert_called_once_with()
+
+    def test_sequential_resumed(self):
+        sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+        generator = ThumbnailGenerator(sample_uri, ThumbnailingMode.SEQUENTIAL)
+        generator.pipeline = mock.Mock()
+        generator.pipeline.query_duration.return_value = (True, 40 * Gst.SECOND)
+        flags = Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE
+        pixbuf = mock.Mock()
+        missing = {Gst.SECOND // 2, Gst.SECOND, 30 * Gst.SECOND}
+        with mock.patch.object(generator.thumb_cache, "get_missing_positions",
+                               return_value=missing),\
+                mock.patch.object(generator.thumb_cache, "commit"),\
+                mock.patch.object(generator, "_set_pixbuf") as set_pixbuf,\
+                mock.patch.object(generator, "stopGeneration") as stop_generation,\
+                mock.patch.object(GLib, "timeout_add"):
+            generator._startThumbnailing()
+            # The decoding starts at the first missing thumbnail.
+            generator.pipeline.seek_simple.assert_called_once_with(
+                Gst.Format.TIME, flags, Gst.SECOND // 2)
+
+            # The frames decoded before the seek are ignored.
+            generator._set_sequential_pixbuf(0, pixbuf)
+            generator._set_sequential_pixbuf(Gst.SECOND // 2, pixbuf)
+            set_pixbuf.assert_called_once_with(Gst.SECOND // 2, pixbuf)
+
+            # The long spans of cached thumbnails are skipped.
+            generator._set_sequential_pixbuf(Gst.SECOND, pixbuf)
+            generator.pipeline.seek_simple.assert_called_with(
+                Gst.Format.TIME, flags, 30 * Gst.SECOND)
+            generator._set_sequential_pixbuf(3 * Gst.SECOND // 2, pixbuf)
+            self.assertEqual(set_pixbuf.call_count, 2)
+            stop_generation.assert_not_called()
+
+            generator._set_sequential_pixbuf(30 * Gst.SECOND, pixbuf)
+            self.assertEqual(set_pixbuf.call_count, 3)
+            stop_generation.assert_called_once_with()
+
+    def test_keyframes_distance_estimation(self):
+        sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+        generator = ThumbnailGenerator(sample_uri, ThumbnailingMode.AUTOMATIC)
+        previewer = mock.Mock()
+        previewer.ges_elem.props.in_point = 0
+        previewer.ges_elem.props.duration = Gst.SECOND
+        with mock.patch.object(Previewer.manager, "add_previewer"):
+            generator.add_client(previewer)
+        with mock.patch.object(generator, "_startThumbnailingWhenIdle") as start_thumbnailing:
+            generator.startGeneration()
+            # The keyframe seeks are not waited for.
+            start_thumbnailing.assert_not_called()
+            self.assertEqual(generator.mode, ThumbnailingMode.AUTOMATIC)
+
+            mainloop = common.create_main_loop()
+
+            def check_estimated_cb():
+                if not start_thumbnailing.called:
+                    return True
+                mainloop.quit()
+                return False
+
+            GLib.timeout_add(10, check_estimated_cb)
+            mainloop.run(timeout_seconds=5)
+            start_thumbnailing.assert_called_once_with()
+        self.assertIsNotNone(generator._keyframes_distance)
+        self.assertNotEqual(generator.mode, ThumbnailingMode.AUTOMATIC)
+        generator.stopGeneration()
 
 
 class TestThumbnailCache(TestCase):
@@ -77,3 +438,434 @@ class TestThumbnailCache(TestCase):
 
             asset = GES.UriClipAsset.request_sync(sample_uri)
             self.assertEqual(ThumbnailCache.get(asset), cache)
+
+    def test_poster(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_config_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_config_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            cache = ThumbnailCache(sample_uri)
+            self.assertIsNone(cache.get_poster())
+
+            for i in range(3):
+                pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 16 + i, 9)
+                cache[i * Gst.SECOND] = pixbuf
+            cache.commit()
+            # Until the poster frame is saved, the thumbnail in the middle
+            # is used.
+            self.assertFalse(cache.has_poster())
+            self.assertEqual(cache.get_poster().get_width(), 17)
+
+            # The poster frame is not saved while its thumbnail is missing.
+            cache.commit(poster_position=get_poster_position(10 * Gst.SECOND))
+            self.assertFalse(cache.has_poster())
+
+            cache.commit(poster_position=get_poster_position(4 * Gst.SECOND))
+            self.assertTrue(cache.has_poster())
+            self.assertEqual(cache.get_poster().get_width(), 18)
+
+            # The poster frame is refreshed with its thumbnail.
+            cache[2 * Gst.SECOND] = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 20, 9)
+            cache.commit(poster_position=2 * Gst.SECOND)
+            self.assertEqual(cache.get_poster().get_width(), 20)
+
+            # Not using the decoded poster frame.
+            posters = {}
+            mainloop = common.create_main_loop()
+
+            def poster_cb(uri, poster):
+                posters[uri] = poster
+                mainloop.quit()
+
+            with mock.patch.object(ThumbnailCache, "memory_cache",
+                                   ThumbnailsMemoryCache(0)):
+                ThumbnailCache.get_posters({sample_uri: 4 * Gst.SECOND}, poster_cb)
+                mainloop.run(timeout_seconds=5)
+            self.assertEqual(list(posters.keys()), [sample_uri])
+            self.assertEqual(posters[sample_uri].get_width(), 20)
+
+    def test_backfill_poster(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_config_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_config_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            cache = ThumbnailCache(sample_uri)
+            self.assertIsNone(cache.backfill_poster(10 * Gst.SECOND))
+
+            # Cached by a previous version, without poster frame.
+            for i in range(3):
+                pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 16 + i, 9)
+                cache[i * Gst.SECOND] = pixbuf
+            cache.commit()
+            self.assertFalse(cache.has_poster())
+
+            # The thumbnail nearest to the middle of the asset is used.
+            posters = {}
+            mainloop = common.create_main_loop()
+
+            def poster_cb(uri, poster):
+                posters[uri] = poster
+                mainloop.quit()
+
+            with mock.patch.object(ThumbnailCache, "caches_by_uri", {sample_uri: cache}),\
+                    mock.patch.object(ThumbnailCache, "memory_cache",
+                                      ThumbnailsMemoryCache(0)):
+                ThumbnailCache.get_posters({sample_uri: 10 * Gst.SECOND}, poster_cb)
+                mainloop.run(timeout_seconds=5)
+            self.assertEqual(posters[sample_uri].get_width(), 18)
+            self.assertTrue(cache.has_poster())
+
+    def test_write_behind(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_config_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_config_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            cache = ThumbnailCache(sample_uri)
+            db = sqlite3.connect(cache._store.dbfile)
+
+            def count_rows():
+                return db.execute("SELECT COUNT(*) FROM Thumbs").fetchone()[0]
+
+            pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 16, 9)
+            for i in range(THUMBS_WRITE_BATCH_SIZE - 1):
+                cache[i * Gst.SECOND] = pixbuf
+            # The thumbnails are available before being written.
+            self.assertEqual(count_rows(), 0)
+            self.assertIn(0, cache)
+            self.assertEqual(cache.getImagesSize(), (16, 9))
+
+            # Reaching the batch size triggers a write, once the thumbnails
+            # are compressed by the worker threads.
+            cache[THUMBS_WRITE_BATCH_SIZE * Gst.SECOND] = pixbuf
+            mainloop = common.create_main_loop()
+
+            def check_written_cb():
+                if count_rows() < THUMBS_WRITE_BATCH_SIZE:
+                    return True
+                mainloop.quit()
+                return False
+
+            GLib.timeout_add(10, check_written_cb)
+            mainloop.run(timeout_seconds=5)
+            self.assertEqual(count_rows(), THUMBS_WRITE_BATCH_SIZE)
+
+            # Overwriting a thumbnail replaces the row.
+            cache[0] = pixbuf
+            cache.commit()
+            self.assertEqual(count_rows(), THUMBS_WRITE_BATCH_SIZE)
+            self.assertIsNotNone(cache[0])
+
+    def test_get_many(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_config_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_config_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            cache = ThumbnailCache(sample_uri)
+            pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 16, 9)
+            for position in (0, 2, 4, 5, 8):
+                cache[position] = pixbuf
+            cache.commit()
+            # Empty the memory cache so the thumbnails have to be decoded.
+            max_size = ThumbnailCache.memory_cache.max_size
+            ThumbnailCache.memory_cache.set_max_size(0)
+            ThumbnailCache.memory_cache.set_max_size(max_size)
+
+            pixbufs, missing = cache.get_many(range(0, 10, 2))
+            self.assertEqual(set(pixbufs.keys()), {0, 2, 4, 8})
+            self.assertEqual(missing, {6})
+
+            # The decoded thumbnails are served from memory.
+            with mock.patch.object(cache._store, "get_jpegs") as get_jpegs:
+                pixbufs, missing = cache.get_many(range(0, 6, 2))
+                self.assertFalse(get_jpegs.called)
+            self.assertEqual(set(pixbufs.keys()), {0, 2, 4})
+            self.assertEqual(missing, set())
+
+            pixbufs, missing = cache.get_many([5, 7])
+            self.assertEqual(set(pixbufs.keys()), {5})
+            self.assertEqual(missing, {7})
+
+    def test_get_many_decoded_in_pool(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_config_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_config_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            cache = ThumbnailCache(sample_uri)
+            pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 16, 9)
+            for position in (0, 2):
+                cache[position] = pixbuf
+            cache.commit()
+            max_size = ThumbnailCache.memory_cache.max_size
+            ThumbnailCache.memory_cache.set_max_size(0)
+            ThumbnailCache.memory_cache.set_max_size(max_size)
+
+            mainloop = common.create_main_loop()
+            decoded = {}
+
+            def decoded_cb(position, pixbuf):
+                decoded[position] = pixbuf
+                if len(decoded) == 2:
+                    mainloop.quit()
+
+            pixbufs, missing = cache.get_many([0, 2, 4], decoded_cb=decoded_cb)
+            # The thumbnails being decoded are neither returned nor missing.
+            self.assertEqual(pixbufs, {})
+            self.assertEqual(missing, {4})
+            pixbufs, missing = cache.get_many([0, 2], decoded_cb=decoded_cb)
+            self.assertEqual(pixbufs, {})
+            self.assertEqual(missing, set())
+
+            mainloop.run(timeout_seconds=5)
+            self.assertEqual(set(decoded.keys()), {0, 2})
+            self.assertEqual(decoded[0].get_width(), 16)
+            # The decoded thumbnails are served from memory.
+            pixbufs, missing = cache.get_many([0, 2], decoded_cb=decoded_cb)
+            self.assertEqual(set(pixbufs.keys()), {0, 2})
+
+    def test_get_missing_positions(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_config_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_config_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            cache = ThumbnailCache(sample_uri)
+            pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 16, 9)
+            cache[0] = pixbuf
+            cache[8] = pixbuf
+            cache.commit()
+            cache[24] = pixbuf
+
+            self.assertEqual(cache.get_missing_positions(0, 32, 8), {16})
+            self.assertEqual(cache.get_missing_positions(0, 32, 16), {16})
+
+
+class TestWaveformPreviewer(TestCase):
+
+    def test_levels_to_samples(self):
+        levels = numpy.array([[-20, 0, -40, -numpy.inf],
+                              [-20, -20, 5, -numpy.inf],
+                              [0, 0, 0, 0]], dtype=numpy.float32)
+        samples = levels_to_samples(levels)
+        self.assertEqual(samples.dtype, numpy.float32)
+        # The glitches are replaced by the previous value, the third
+        # channel is ignored and the missing levels are silence.
+        numpy.testing.assert_allclose(samples, [10, 10, 5.5, 0], rtol=1e-5)
+
+
+class TestLoudnessPreviewer(TestCase):
+
+    def test_levels(self):
+        loudnessbin = Gst.ElementFactory.make("loudnessbin")
+        self.assertEqual(loudnessbin.get_levels(),
+                         {"peak": -numpy.inf, "rms": -numpy.inf})
+
+        loudnessbin.add_levels([-6, -3], [-20, -20])
+        loudnessbin.add_levels([-12], [-20])
+        levels = loudnessbin.get_levels()
+        self.assertEqual(levels["peak"], -3)
+        self.assertAlmostEqual(levels["rms"], -20)
+
+        # The RMS level is the one of the mean power.
+        loudnessbin.add_levels([-40], [-numpy.inf])
+        self.assertAlmostEqual(loudnessbin.get_levels()["rms"],
+                               -20 - 10 * numpy.log10(1.5))
+
+
+class TestRenderer(TestCase):
+
+    def test_fill_surface_from_buffer(self):
+        samples = numpy.array([10, 20, 30, 40], dtype=numpy.float32)
+        for values in (samples,
+                       samples.astype(numpy.float64),
+                       # A strided view, as the levels of the peaks pyramid.
+                       numpy.stack((samples, samples), axis=1)[:, 1],
+                       memoryview(samples)):
+            surface = renderer.fill_surface_from_buffer(values, 2, 50)
+            self.assertEqual((surface.get_width(), surface.get_height()), (2, 50))
+            # The same shape as with a list.
+            expected = renderer.fill_surface(samples.tolist(), 2, 50)
+            self.assertEqual(bytes(surface.get_data()), bytes(expected.get_data()))
+
+        # The int16 samples are scaled to the -100..100 range.
+        surface = renderer.fill_surface_from_buffer(
+            numpy.array([0, 16384], dtype=numpy.int16), 1, 50)
+        self.assertEqual(surface.get_width(), 1)
+
+        with self.assertRaises(TypeError):
+            renderer.fill_surface_from_buffer(samples.astype(numpy.int32), 2, 50)
+        with self.assertRaises(ValueError):
+            renderer.fill_surface_from_buffer(samples, 0, 50)
+
+    def test_fill_envelope(self):
+        mins = numpy.array([-100, -50, 0, -10], dtype=numpy.float32)
+        maxs = -mins
+        surface = renderer.fill_envelope(mins, maxs, 2, 100)
+        self.assertEqual((surface.get_width(), surface.get_height()), (2, 100))
+        data = numpy.frombuffer(surface.get_data(), dtype=numpy.uint32).reshape(
+            100, surface.get_stride() // 4)
+        # The first column goes from the top to the bottom.
+        self.assertTrue(data[0, 0] and data[99, 0])
+        # The second column is within -10..10.
+        self.assertFalse(data[40, 1])
+        self.assertTrue(data[50, 1])
+
+        # Stereo, a lane per channel.
+        stereo_mins = numpy.stack((mins, mins / 10))
+        surface = renderer.fill_envelope(stereo_mins, -stereo_mins, 2, 100)
+        data = numpy.frombuffer(surface.get_data(), dtype=numpy.uint32).reshape(
+            100, surface.get_stride() // 4)
+        self.assertTrue(data[0, 0])
+        self.assertFalse(data[60, 0])
+        self.assertTrue(data[75, 0])
+
+        with self.assertRaises(ValueError):
+            renderer.fill_envelope(mins, maxs[:2], 2, 100)
+
+
+class TestMemoryLRUCache(TestCase):
+
+    def test_lru(self):
+        cache = MemoryLRUCache(3 * 10, len)
+        cache.set(("a", 0), b"0" * 10)
+        cache.set(("a", 1), b"1" * 10)
+        cache.set(("b", 0), b"2" * 10)
+        self.assertEqual(cache.size, 3 * 10)
+
+        # Replacing a value does not count it twice.
+        cache.set(("a", 1), b"1" * 10)
+        self.assertEqual(cache.size, 3 * 10)
+
+        # Make ("a", 0) the most recently used.
+        self.assertIsNotNone(cache.get(("a", 0)))
+        cache.set(("b", 1), b"3" * 10)
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(("b", 0), cache)
+        self.assertIn(("a", 0), cache)
+
+        cache.set_max_size(10)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNotNone(cache.get(("a", 0)))
+        self.assertEqual(cache.size, 10)
+
+        cache.set_max_size(0)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_sizes(self):
+        pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 16, 9)
+        cache = ThumbnailsMemoryCache(pixbuf.get_byte_length())
+        cache.set(("a", 0), pixbuf)
+        self.assertEqual(cache.size, pixbuf.get_byte_length())
+
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 256, 10)
+        cache = WaveformTilesCache(surface.get_stride() * 10)
+        cache.set(("a", 1.0, 0, 10), surface)
+        self.assertEqual(cache.size, surface.get_stride() * 10)
+
+
+class TestWaveformCache(TestCase):
+
+    def test_shared_mapping(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            self.assertIsNone(WaveformCache.get(sample_uri))
+
+            WaveformCache.save(sample_uri, [1.0, 2.5, 3.0])
+            samples = WaveformCache.get(sample_uri)
+            self.assertIsInstance(samples, numpy.memmap)
+            self.assertEqual(samples.dtype, numpy.float32)
+            self.assertEqual(samples.tolist(), [1.0, 2.5, 3.0])
+            # All the clips share the same samples.
+            self.assertIs(WaveformCache.get(sample_uri), samples)
+            WaveformCache.samples_by_uri.pop(sample_uri)
+
+    def test_peaks(self):
+        levels = compute_peaks_pyramid(numpy.array([1, 5, 2, 0, 3], dtype=numpy.float32))
+        self.assertEqual([level.tolist() for level in levels],
+                         [[5, 2, 3], [5, 3], [5]])
+        self.assertEqual(compute_peaks_pyramid(numpy.zeros(1)), [])
+
+        self.assertEqual(choose_peaks_level(100, 100), 0)
+        self.assertEqual(choose_peaks_level(399, 100), 1)
+        self.assertEqual(choose_peaks_level(400, 100), 2)
+        self.assertEqual(choose_peaks_level(50, 100), 0)
+
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            WaveformCache.save(sample_uri, [1, 5, 2, 0, 3])
+            peaks = WaveformCache.get_peaks(sample_uri)
+            self.assertEqual(len(peaks), 4)
+            self.assertEqual(peaks[0].tolist(), [1, 5, 2, 0, 3])
+            self.assertEqual(peaks[1].tolist(), [5, 2, 3])
+            self.assertEqual(peaks[3].tolist(), [5])
+
+            # The pyramids saved with the mins are replaced.
+            wavefile = get_wavefile_location_for_uri(sample_uri)
+            numpy.save(get_peaks_file_location(wavefile),
+                       numpy.zeros((4, 2), dtype=numpy.float32))
+            WaveformCache.peaks_by_uri.pop(sample_uri)
+            peaks = WaveformCache.get_peaks(sample_uri)
+            self.assertEqual(peaks[1].tolist(), [5, 2, 3])
+            WaveformCache.samples_by_uri.pop(sample_uri)
+            WaveformCache.peaks_by_uri.pop(sample_uri)
+
+    def test_missing_peaks(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            WaveformCache.save(sample_uri, [1.0, 2.0, 3.0])
+
+            ges_elem = mock.Mock()
+            ges_elem.props.id = sample_uri
+            ges_elem.get_proxy_target.return_value = None
+            ges_elem.get_parent().get_asset().get_duration.return_value = \
+                3 * SAMPLE_DURATION
+            with mock.patch.object(Previewer.prefetcher, "add_client"),\
+                    mock.patch.object(WaveformCache, "get_peaks", return_value=None):
+                previewer = AudioPreviewer(ges_elem)
+                previewer._startLevelsDiscovery()
+
+            # Without a peaks pyramid, the tiles are drawn from the samples.
+            self.assertEqual(len(previewer.peaks), 1)
+            self.assertEqual(previewer.peaks[0].tolist(), [1.0, 2.0, 3.0])
+            self.assertIsNotNone(previewer._AudioPreviewer__get_tile(0, 10))
+            AudioPreviewer.tiles_cache.remove((sample_uri, Zoomable.zoomratio, 0, 10))
+            WaveformCache.samples_by_uri.pop(sample_uri)
+
+    def test_pickle_migration(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            wavefile = get_wavefile_location_for_uri(sample_uri)
+            pickled_wavefile = os.path.splitext(wavefile)[0] + ".wave"
+            with open(pickled_wavefile, "wb") as samples_file:
+                pickle.dump([1.0, 2.0], samples_file)
+
+            samples = WaveformCache.get(sample_uri)
+            self.assertEqual(samples.tolist(), [1.0, 2.0])
+            self.assertTrue(os.path.exists(wavefile))
+            self.assertFalse(os.path.exists(pickled_wavefile))
+            WaveformCache.samples_by_uri.pop(sample_uri)
+
+    def test_forget_file_previews(self):
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home,\
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.return_value = temp_dir
+            sample_uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+            WaveformCache.save(sample_uri, [1.0, 2.0])
+            self.assertIsNotNone(WaveformCache.get_peaks(sample_uri))
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 256, 10)
+            AudioPreviewer.tiles_cache.set((sample_uri, 1.0, 0, 10), surface)
+            AudioPreviewer.tiles_cache.set(("file:///other", 1.0, 0, 10), surface)
+
+            forget_file_previews(Gst.uri_get_location(sample_uri))
+            self.assertNotIn(sample_uri, WaveformCache.samples_by_uri)
+            self.assertNotIn(sample_uri, WaveformCache.peaks_by_uri)
+            self.assertNotIn((sample_uri, 1.0, 0, 10), AudioPreviewer.tiles_cache)
+            self.assertIn(("file:///other", 1.0, 0, 10), AudioPreviewer.tiles_cache)
+            AudioPreviewer.tiles_cache.remove(("file:///other", 1.0, 0, 10))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+import os
+from unittest import mock
+from unittest import TestCase
+
+from gi.repository import GES
+
+from pitivi.timeline.previewers import get_loudness
+from pitivi.timeline.previewers import get_wavefile_location_for_uri
+from pitivi.timeline.previewers import ThumbnailCache
+from pitivi.utils.analysis import AnalysisPipeline
+from tests import common
+
+
+class TestAnalysisPipeline(TestCase):
+
+    def test_analysis(self):
+        sample_uri = common.get_sample_uri("tears_of_steel.webm")
+        asset = GES.UriClipAsset.request_sync(sample_uri)
+        analysis = AnalysisPipeline(asset, timed=True)
+        mainloop = common.create_main_loop()
+        analysis.connect("done", lambda unused_analysis: mainloop.quit())
+        self.assertTrue(analysis.start())
+        mainloop.run(timeout_seconds=20)
+
+        timings = analysis.get_timings()
+        self.assertEqual(set(timings),
+                         {"thumbnailbin", "waveformbin", "loudnessbin"})
+        for seconds in timings.values():
+            self.assertGreater(seconds, 0)
+
+        self.assertIsNotNone(get_loudness(sample_uri))
+        self.assertTrue(os.path.exists(get_wavefile_location_for_uri(sample_uri)))
+        self.assertTrue(ThumbnailCache.get(sample_uri).has_poster())
+
+        # Everything is cached now.
+        self.assertFalse(AnalysisPipeline(asset).start())
+
+    def test_not_timed_by_default(self):
+        sample_uri = common.get_sample_uri("tears_of_steel.webm")
+        asset = GES.UriClipAsset.request_sync(sample_uri)
+        with mock.patch("pitivi.utils.analysis.loggable.getCategoryLevel") as get_level:
+            get_level.return_value = 2
+            self.assertFalse(AnalysisPipeline(asset).timed)
+            get_level.return_value = 5
+            self.assertTrue(AnalysisPipeline(asset).timed)
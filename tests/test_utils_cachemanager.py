@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+import os
+import tempfile
+import time
+from unittest import mock
+from unittest import TestCase
+
+from gi.repository import GLib
+
+from pitivi.utils.cachemanager import get_filehash
+from pitivi.utils.cachemanager import PreviewsCacheManager
+from pitivi.utils.thumbstore import PackThumbnailStore
+
+HASH1 = "1" * 64
+HASH2 = "2" * 64
+HASH3 = "3" * 64
+
+
+class TestPreviewsCacheManager(TestCase):
+
+    @staticmethod
+    def create_file(path, size, mtime):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"x" * size)
+        os.utime(path, (mtime, mtime))
+
+    def test_get_filehash(self):
+        self.assertEqual(get_filehash(HASH1), HASH1)
+        self.assertEqual(get_filehash(HASH1 + "-wal"), HASH1)
+        self.assertEqual(get_filehash(HASH1 + ".npy"), HASH1)
+        self.assertIsNone(get_filehash("thumbs.pack"))
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                mock.patch("pitivi.utils.cachemanager.xdg_cache_home") as xdg_cache_home:
+            xdg_cache_home.return_value = temp_dir
+            thumbs_dir = os.path.join(temp_dir, "thumbs")
+            waves_dir = os.path.join(temp_dir, "waves")
+            self.create_file(os.path.join(thumbs_dir, HASH1), 100, 1000)
+            self.create_file(os.path.join(waves_dir, HASH1 + ".npy"), 50, 1000)
+            self.create_file(os.path.join(thumbs_dir, HASH2), 100, 3000)
+            self.create_file(os.path.join(thumbs_dir, HASH3), 100, 2000)
+
+            manager = PreviewsCacheManager()
+            self.assertEqual(manager.get_usage(), 350)
+            self.assertEqual(manager.evict(), 0)
+
+            # The least recently used assets are removed first.
+            manager.quota = 200
+            self.assertEqual(manager.evict(), 150)
+            self.assertFalse(os.path.exists(os.path.join(thumbs_dir, HASH1)))
+            self.assertFalse(os.path.exists(os.path.join(waves_dir, HASH1 + ".npy")))
+            self.assertEqual(manager.get_usage(), 200)
+
+            # The assets in use are kept.
+            manager.touch(HASH3)
+            manager.quota = 100
+            self.assertEqual(manager.evict(), 100)
+            self.assertFalse(os.path.exists(os.path.join(thumbs_dir, HASH2)))
+            self.assertTrue(os.path.exists(os.path.join(thumbs_dir, HASH3)))
+
+            # The access times are remembered.
+            manager.stop()
+            manager = PreviewsCacheManager()
+            self.create_file(os.path.join(thumbs_dir, HASH2), 100, time.time() + 10)
+            manager.quota = 100
+            manager.evict()
+            self.assertTrue(os.path.exists(os.path.join(thumbs_dir, HASH2)))
+            self.assertFalse(os.path.exists(os.path.join(thumbs_dir, HASH3)))
+
+    def test_evict_async(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                mock.patch("pitivi.utils.cachemanager.xdg_cache_home") as xdg_cache_home:
+            xdg_cache_home.return_value = temp_dir
+            thumbs_dir = os.path.join(temp_dir, "thumbs")
+            self.create_file(os.path.join(thumbs_dir, HASH1), 100, 1000)
+            self.create_file(os.path.join(thumbs_dir, HASH2), 100, 2000)
+
+            manager = PreviewsCacheManager()
+            manager.set_quota(100)
+            # Scanning the previews and removing the files does not block.
+            self.assertTrue(os.path.exists(os.path.join(thumbs_dir, HASH1)))
+
+            mainloop = GLib.MainLoop()
+
+            def check_evicted_cb():
+                if manager._evicting:
+                    return True
+                mainloop.quit()
+                return False
+
+            GLib.timeout_add(10, check_evicted_cb)
+            GLib.timeout_add_seconds(5, mainloop.quit)
+            mainloop.run()
+            self.assertFalse(os.path.exists(os.path.join(thumbs_dir, HASH1)))
+            self.assertTrue(os.path.exists(os.path.join(thumbs_dir, HASH2)))
+            manager.stop()
+
+    def test_evict_from_pack(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                mock.patch("pitivi.utils.cachemanager.xdg_cache_home") as xdg_cache_home:
+            xdg_cache_home.return_value = temp_dir
+            thumbs_dir = os.path.join(temp_dir, "thumbs")
+            os.makedirs(thumbs_dir)
+            store1 = PackThumbnailStore(thumbs_dir, HASH1)
+            store1.put_jpegs([(0, b"x" * 300)])
+            store2 = PackThumbnailStore(thumbs_dir, HASH2)
+            store2.put_jpegs([(0, b"y" * 100)])
+
+            manager = PreviewsCacheManager()
+            manager.touch(HASH2)
+            manager.quota = 100
+            self.assertEqual(manager.evict(), 300)
+            self.assertEqual(store1.get_positions(), set())
+            self.assertEqual(store2.get_jpegs([0]), {0: b"y" * 100})
+            # The pack has been compacted.
+            self.assertEqual(store2.pack.get_unused_size(), 0)
+            store2.pack.close()
+
+    def test_evict_from_pack_async(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                mock.patch("pitivi.utils.cachemanager.xdg_cache_home") as xdg_cache_home:
+            xdg_cache_home.return_value = temp_dir
+            thumbs_dir = os.path.join(temp_dir, "thumbs")
+            os.makedirs(thumbs_dir)
+            store1 = PackThumbnailStore(thumbs_dir, HASH1)
+            store1.put_jpegs([(0, b"x" * 300)])
+            store2 = PackThumbnailStore(thumbs_dir, HASH2)
+            store2.put_jpegs([(0, b"y" * 100)])
+
+            manager = PreviewsCacheManager()
+            manager.touch(HASH2)
+            manager.set_quota(100)
+            # The pack is changed in the io_pool.
+            self.assertEqual(store1.get_positions(), {0})
+
+            mainloop = GLib.MainLoop()
+
+            def check_evicted_cb():
+                if manager._evicting:
+                    return True
+                mainloop.quit()
+                return False
+
+            GLib.timeout_add(10, check_evicted_cb)
+            GLib.timeout_add_seconds(5, mainloop.quit)
+            mainloop.run()
+            self.assertEqual(store1.get_positions(), set())
+            self.assertEqual(store2.get_jpegs([0]), {0: b"y" * 100})
+            self.assertEqual(store2.pack.get_unused_size(), 0)
+            manager.stop()
+            store2.pack.close()
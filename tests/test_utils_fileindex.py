@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+import os
+import tempfile
+from unittest import mock
+from unittest import TestCase
+
+from gi.repository import GLib
+
+from pitivi.utils.fileindex import FileHashIndex
+from pitivi.utils.misc import hash_file
+from tests import common
+
+
+class TestFileHashIndex(TestCase):
+
+    @staticmethod
+    def write(path, content):
+        with open(path, "wb") as media_file:
+            media_file.write(content)
+
+    def test_get_hash(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "media")
+            self.write(path, b"a" * 1000)
+            index_path = os.path.join(temp_dir, "index.json")
+            index = FileHashIndex(index_path)
+            self.assertIsNone(index.get_cached_hash(path))
+            filehash = index.get_hash(path)
+            self.assertEqual(filehash, hash_file(path))
+            index.save()
+
+            # The saved hashes are returned without accessing the files.
+            index = FileHashIndex(index_path)
+            with mock.patch("pitivi.utils.fileindex.os.stat") as stat, \
+                    mock.patch("pitivi.utils.fileindex.hash_file") as hash_file_:
+                self.assertEqual(index.get_cached_hash(path), filehash)
+                self.assertFalse(stat.called)
+                self.assertFalse(hash_file_.called)
+
+            # A moved file is not hashed again.
+            moved_path = os.path.join(temp_dir, "moved")
+            os.rename(path, moved_path)
+            with mock.patch("pitivi.utils.fileindex.hash_file") as hash_file_:
+                self.assertEqual(index.get_hash(moved_path), filehash)
+                self.assertFalse(hash_file_.called)
+
+    def test_revalidate(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "media")
+            self.write(path, b"a" * 1000)
+            index_path = os.path.join(temp_dir, "index.json")
+            index = FileHashIndex(index_path)
+            filehash = index.get_hash(path)
+            index.save()
+
+            self.write(path, b"b" * 2000)
+            index = FileHashIndex(index_path)
+            # The stale hash is returned while revalidating.
+            self.assertEqual(index.get_hash(path), filehash)
+
+            mainloop = common.create_main_loop()
+            hash_changed_cb = mock.Mock()
+            hash_changed_cb.side_effect = lambda *args: mainloop.quit()
+            index.connect("hash-changed", hash_changed_cb)
+            mainloop.run(timeout_seconds=5)
+            hash_changed_cb.assert_called_once_with(index, path, hash_file(path))
+            self.assertEqual(index.get_hash(path), hash_file(path))
+
+    def test_revalidate_new_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "media")
+            self.write(path, b"a" * 1000)
+            index = FileHashIndex(os.path.join(temp_dir, "index.json"))
+            hash_changed_cb = mock.Mock()
+            index.connect("hash-changed", hash_changed_cb)
+
+            mainloop = common.create_main_loop()
+
+            def check_cb():
+                if index.get_cached_hash(path):
+                    mainloop.quit()
+                    return False
+                return True
+
+            index.revalidate([path])
+            GLib.timeout_add(10, check_cb)
+            mainloop.run(timeout_seconds=5)
+
+            # A file hashed for the first time has not changed.
+            self.assertFalse(hash_changed_cb.called)
+            with mock.patch("pitivi.utils.fileindex.hash_file") as hash_file_:
+                self.assertEqual(index.get_hash(path), hash_file(path))
+                self.assertFalse(hash_file_.called)
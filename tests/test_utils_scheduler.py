@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+from unittest import mock
+from unittest import TestCase
+
+from gi.repository import Gst
+
+from pitivi.utils.scheduler import BackgroundWorkPauseReason
+from pitivi.utils.scheduler import BackgroundWorkScheduler
+from pitivi.utils.scheduler import get_system_cpu_times
+from pitivi.utils.scheduler import PipelineCpuThrottler
+
+
+class TestBackgroundWorkScheduler(TestCase):
+
+    def test_pause(self):
+        scheduler = BackgroundWorkScheduler()
+        paused_changed_cb = mock.Mock()
+        scheduler.connect("paused-changed", paused_changed_cb)
+        self.assertFalse(scheduler.paused)
+
+        scheduler.pause(BackgroundWorkPauseReason.PLAYBACK)
+        scheduler.pause(BackgroundWorkPauseReason.RENDERING)
+        self.assertTrue(scheduler.paused)
+        paused_changed_cb.assert_called_once_with(scheduler, True)
+        scheduler.add_producer("producer", 100)
+        self.assertFalse(scheduler.allows("producer"))
+
+        paused_changed_cb.reset_mock()
+        scheduler.resume(BackgroundWorkPauseReason.PLAYBACK)
+        self.assertTrue(scheduler.paused)
+        scheduler.resume(BackgroundWorkPauseReason.RENDERING)
+        self.assertFalse(scheduler.paused)
+        paused_changed_cb.assert_called_once_with(scheduler, False)
+
+    def test_allows(self):
+        with mock.patch("pitivi.utils.scheduler.time.monotonic") as monotonic, \
+                mock.patch("pitivi.utils.scheduler.multiprocessing.cpu_count") as cpu_count, \
+                mock.patch("pitivi.utils.scheduler.get_process_cpu_time") as get_process_cpu_time, \
+                mock.patch("pitivi.utils.scheduler.get_system_cpu_times") as get_system_cpu_times_:
+            cpu_count.return_value = 2
+            monotonic.return_value = 0
+            get_process_cpu_time.return_value = 0
+            get_system_cpu_times_.return_value = (0, 0)
+            scheduler = BackgroundWorkScheduler()
+
+            # Half a core out of two used by the process.
+            monotonic.return_value = 1
+            get_process_cpu_time.return_value = 0.5
+            get_system_cpu_times_.return_value = (50, 200)
+            scheduler.add_producer("thumbnails", 20)
+            self.assertFalse(scheduler.allows("thumbnails"))
+            self.assertEqual(scheduler.cpu_usage, 25)
+            self.assertEqual(scheduler.system_cpu_usage, 25)
+            # The shares of the running producers add up.
+            scheduler.add_producer("waveforms", 10)
+            self.assertEqual(scheduler.cpu_budget, 30)
+            self.assertTrue(scheduler.allows("thumbnails"))
+            self.assertTrue(scheduler.allows("waveforms"))
+            self.assertFalse(scheduler.allows("proxies"))
+            scheduler.remove_producer("waveforms")
+            self.assertFalse(scheduler.allows("thumbnails"))
+            self.assertTrue(scheduler.is_below(30))
+
+            # The system is busy.
+            monotonic.return_value = 2
+            get_system_cpu_times_.return_value = (245, 400)
+            self.assertFalse(scheduler.is_below(30))
+            self.assertEqual(scheduler.cpu_usage, 0)
+
+    def test_get_system_cpu_times(self):
+        times = get_system_cpu_times()
+        if times is not None:
+            busy, total = times
+            self.assertLessEqual(busy, total)
+
+
+class TestPipelineCpuThrottler(TestCase):
+
+    def test_pause_over_budget(self):
+        pipeline = mock.Mock()
+        throttler = PipelineCpuThrottler(pipeline, 30)
+        throttler._scheduler = mock.Mock()
+        throttler.start()
+        throttler._scheduler.add_producer.assert_called_once_with(throttler, 30)
+
+        throttler._scheduler.allows.return_value = True
+        self.assertTrue(throttler._check_cpu_usage_cb())
+        throttler._scheduler.allows.assert_called_once_with(throttler)
+        pipeline.set_state.assert_not_called()
+
+        throttler._scheduler.allows.return_value = False
+        throttler._check_cpu_usage_cb()
+        pipeline.set_state.assert_called_once_with(Gst.State.PAUSED)
+        self.assertTrue(throttler.paused)
+
+        pipeline.set_state.reset_mock()
+        throttler._scheduler.allows.return_value = True
+        throttler._check_cpu_usage_cb()
+        pipeline.set_state.assert_called_once_with(Gst.State.PLAYING)
+        self.assertFalse(throttler.paused)
+
+        throttler.stop()
+        throttler._scheduler.remove_producer.assert_called_once_with(throttler)
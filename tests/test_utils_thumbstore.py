@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+# Copyright (c) 2017, Pitivi contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin St, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+import os
+import tempfile
+from unittest import mock
+from unittest import TestCase
+
+from pitivi.utils.thumbstore import get_poster_jpegs
+from pitivi.utils.thumbstore import migrate_sqlite_to_pack
+from pitivi.utils.thumbstore import PackThumbnailStore
+from pitivi.utils.thumbstore import SQLiteConnectionPool
+from pitivi.utils.thumbstore import SQLiteThumbnailStore
+from pitivi.utils.thumbstore import ThumbnailPack
+from pitivi.utils.thumbstore import ThumbnailStorage
+from pitivi.utils.thumbstore import THUMBS_PACK_FILENAME
+from pitivi.utils.thumbstore import THUMBS_PACK_INDEX_FILENAME
+
+HASH1 = "1" * 64
+HASH2 = "2" * 64
+HASH3 = "3" * 64
+
+
+class TestPackThumbnailStore(TestCase):
+
+    def test_put_get(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = PackThumbnailStore(temp_dir, HASH1)
+            self.assertIsNone(store.get_any_jpeg())
+            store.put_jpegs([(0, b"zero"), (2, b"two"), (4, b"four")])
+            # Replacing a thumbnail appends it again.
+            store.put_jpegs([(2, b"TWO")])
+            self.assertEqual(store.get_jpegs([0, 1, 2]), {0: b"zero", 2: b"TWO"})
+            self.assertEqual(store.get_existing_positions(2, 10, 2), {2, 4})
+
+            # The other files have their own thumbnails.
+            other_store = PackThumbnailStore(temp_dir, HASH2)
+            self.assertEqual(other_store.get_positions(), set())
+            store.link(HASH2)
+            self.assertEqual(other_store.get_positions(), {0, 2, 4})
+
+            # The index is loaded when the pack is opened again.
+            store.pack.close()
+            store = PackThumbnailStore(temp_dir, HASH1)
+            self.assertEqual(store.get_jpegs([0, 2, 4]),
+                             {0: b"zero", 2: b"TWO", 4: b"four"})
+            self.assertEqual(PackThumbnailStore(temp_dir, HASH2).get_jpegs([2]),
+                             {2: b"TWO"})
+            store.pack.close()
+
+    def test_poster(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = PackThumbnailStore(temp_dir, HASH1)
+            store.put_jpegs([(0, b"zero")])
+            self.assertIsNone(store.get_poster_jpeg())
+            store.put_poster_jpeg(b"poster")
+            self.assertEqual(store.get_poster_jpeg(), b"poster")
+            # The poster frame is not one of the thumbnails.
+            self.assertEqual(store.get_positions(), {0})
+
+            self.assertEqual(get_poster_jpegs(ThumbnailStorage.PACK, temp_dir,
+                                              [HASH1, HASH2]),
+                             {HASH1: b"poster"})
+            store.pack.close()
+
+    def test_incomplete_index(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = PackThumbnailStore(temp_dir, HASH1)
+            store.put_jpegs([(0, b"zero")])
+            store.pack.close()
+            index_path = os.path.join(temp_dir, THUMBS_PACK_INDEX_FILENAME)
+            size = os.path.getsize(index_path)
+            with open(index_path, "ab") as index_file:
+                index_file.write(b"interrupted")
+
+            store = PackThumbnailStore(temp_dir, HASH1)
+            self.assertEqual(store.get_jpegs([0]), {0: b"zero"})
+            self.assertEqual(os.path.getsize(index_path), size)
+            store.pack.close()
+
+    def test_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = PackThumbnailStore(temp_dir, HASH1)
+            store.put_jpegs([(0, b"zero")])
+            # Another process using the same pack.
+            other_pack = ThumbnailPack(temp_dir)
+            self.assertEqual(other_pack.get_entries(HASH1).keys(), {0})
+
+            # The entries appended by the other process are loaded.
+            other_pack.append(HASH1, [(1, b"one")])
+            other_pack.append(HASH2, [(0, b"other")])
+            self.assertEqual(store.get_jpegs([0, 1]), {0: b"zero", 1: b"one"})
+            store.put_jpegs([(2, b"two")])
+            self.assertEqual(set(other_pack.get_entries(HASH1)), {0, 1, 2})
+
+            # The index is loaded again when compacted by the other process.
+            other_pack.remove(HASH2)
+            other_pack.compact()
+            self.assertEqual(store.get_jpegs([0, 1, 2]),
+                             {0: b"zero", 1: b"one", 2: b"two"})
+            self.assertEqual(store.pack.get_sizes(), {HASH1: 10})
+            self.assertEqual(store.pack.get_unused_size(), 0)
+            other_pack.close()
+            store.pack.close()
+
+
+class TestSQLiteThumbnailStore(TestCase):
+
+    def test_connections_pool(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                mock.patch.object(SQLiteThumbnailStore, "connections",
+                                  SQLiteConnectionPool(2)) as connections:
+            stores = [SQLiteThumbnailStore(temp_dir, filehash)
+                      for filehash in (HASH1, HASH2, HASH3)]
+            self.assertEqual(connections.open_count, 2)
+
+            # The least recently used db is reopened transparently.
+            stores[0].put_jpegs([(0, b"zero")])
+            self.assertEqual(connections.open_count, 2)
+            stores[1].put_jpegs([(1, b"one")])
+            self.assertEqual(stores[0].get_jpegs([0]), {0: b"zero"})
+            self.assertEqual(stores[1].get_jpegs([1]), {1: b"one"})
+            self.assertEqual(connections.open_count, 2)
+
+            connections.close_all()
+            self.assertEqual(connections.open_count, 0)
+
+    def test_poster(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = SQLiteThumbnailStore(temp_dir, HASH1)
+            self.assertIsNone(store.get_poster_jpeg())
+            store.put_poster_jpeg(b"poster")
+            store.put_poster_jpeg(b"POSTER")
+            self.assertEqual(store.get_poster_jpeg(), b"POSTER")
+            SQLiteThumbnailStore(temp_dir, HASH2)
+
+            self.assertEqual(get_poster_jpegs(ThumbnailStorage.SQLITE, temp_dir,
+                                              [HASH1, HASH2, HASH3]),
+                             {HASH1: b"POSTER"})
+
+
+class TestMigration(TestCase):
+
+    def test_migrate_sqlite_to_pack(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = SQLiteThumbnailStore(temp_dir, HASH1)
+            store.put_jpegs([(0, b"zero"), (1, b"one")])
+            store.put_poster_jpeg(b"poster")
+            store.link(HASH2)
+            SQLiteThumbnailStore(temp_dir, HASH3)
+
+            self.assertEqual(migrate_sqlite_to_pack(temp_dir), 3)
+            pack_size = os.path.getsize(os.path.join(temp_dir, THUMBS_PACK_FILENAME))
+            # Migrating again does not copy the thumbnails again.
+            self.assertEqual(migrate_sqlite_to_pack(temp_dir, remove=True), 3)
+            self.assertEqual(os.path.getsize(os.path.join(temp_dir, THUMBS_PACK_FILENAME)),
+                             pack_size)
+            self.assertFalse(os.path.lexists(os.path.join(temp_dir, HASH1)))
+            self.assertFalse(os.path.lexists(os.path.join(temp_dir, HASH2)))
+
+            for filehash in (HASH1, HASH2):
+                store = PackThumbnailStore(temp_dir, filehash)
+                self.assertEqual(store.get_jpegs([0, 1]), {0: b"zero", 1: b"one"})
+                self.assertEqual(store.get_poster_jpeg(), b"poster")
+            self.assertEqual(PackThumbnailStore(temp_dir, HASH3).get_positions(), set())
+            ThumbnailPack.get(temp_dir).close()